@@ -0,0 +1,206 @@
+import argparse
+import csv
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from fileutil import atomic_path, commit_file
+
+# Extension used for each supported artifact format
+ARTIFACT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+DEFAULT_CHUNK_SIZE = 50000
+
+def default_format() -> str:
+    """Artifact format from ARTIFACT_FORMAT: csv (default), parquet or arrow."""
+    fmt = os.getenv('ARTIFACT_FORMAT', 'csv').strip().lower()
+    if fmt not in ARTIFACT_FORMATS:
+        raise ValueError(f"Unknown ARTIFACT_FORMAT {fmt!r}, expected one of {sorted(ARTIFACT_FORMATS)}")
+    return fmt
+
+def format_of(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, suffix in ARTIFACT_FORMATS.items():
+        if extension == suffix:
+            return fmt
+    return 'csv'
+
+def artifact_path(name: str, fmt: Optional[str] = None) -> str:
+    """File name of artifact `name` (e.g. 'phrases') in the given or default format."""
+    return name + ARTIFACT_FORMATS[fmt or default_format()]
+
+def find_artifact(name: str, fmt: Optional[str] = None) -> str:
+    """
+    Existing file for artifact `name`, preferring the given or default format
+    and falling back to any other format, so a stage can read what the
+    previous one wrote. Returns the preferred path when none exists.
+    """
+    preferred = artifact_path(name, fmt)
+    if os.path.exists(preferred):
+        return preferred
+    for suffix in ARTIFACT_FORMATS.values():
+        if os.path.exists(name + suffix):
+            return name + suffix
+    return preferred
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow artifacts require the pyarrow package") from e
+    return pyarrow
+
+def _typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # Object columns hold text (including JSON reviews); store them as Arrow strings
+    object_columns = [col for col in df.columns if df[col].dtype == object]
+    if not object_columns:
+        return df
+    return df.astype({col: 'string' for col in object_columns})
+
+def _text_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # Every column as nullable strings, so all chunks of an artifact share one schema
+    return df.astype({col: 'string' for col in df.columns})
+
+def write_artifact(data, path: str, columns: Optional[List[str]] = None) -> None:
+    """
+    Write a DataFrame (or a list of row dicts) to path in the format given by
+    its extension. The file is written to a temp path, fsynced and renamed,
+    so readers never see a partial artifact.
+    """
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data, columns=columns)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    fmt = format_of(path)
+    with atomic_path(path) as tmp_path:
+        if fmt == 'csv':
+            df.to_csv(tmp_path, index=False, encoding='utf-8')
+        else:
+            pa = _pyarrow()
+            table = pa.Table.from_pandas(_typed_frame(df), preserve_index=False)
+            if fmt == 'parquet':
+                pa.parquet.write_table(table, tmp_path)
+            else:
+                with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+def _read_table(path: str, columns: Optional[List[str]] = None):
+    pa = _pyarrow()
+    if format_of(path) == 'parquet':
+        return pa.parquet.read_table(path, columns=columns)
+    # Arrow IPC files are memory-mapped, so only the selected columns are paged in
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns else table
+
+def read_artifact(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    if format_of(path) == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    return _read_table(path, columns).to_pandas()
+
+def iter_artifact_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yield the artifact as DataFrames of at most chunk_size rows. CSV columns
+    are read as text, so a column's type does not change from chunk to chunk.
+    """
+    fmt = format_of(path)
+    if fmt == 'csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str)
+    elif fmt == 'parquet':
+        for batch in _pyarrow().parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        table = _read_table(path)
+        for offset in range(0, table.num_rows, chunk_size):
+            yield table.slice(offset, chunk_size).to_pandas()
+
+def iter_records(path: str) -> Iterator[Dict[str, str]]:
+    """
+    Rows of an artifact as dicts of strings (empty for missing values), the
+    same shape csv.DictReader gives for the CSV artifacts.
+    """
+    if format_of(path) == 'csv':
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+        return
+
+    for chunk in iter_artifact_chunks(path):
+        for record in chunk.to_dict('records'):
+            yield {key: '' if pd.isna(value) else str(value) for key, value in record.items()}
+
+class ChunkedArtifactWriter:
+    """
+    Writes an artifact one DataFrame chunk at a time, keeping memory bounded
+    by the chunk. Output goes to a temp file that close() renames into place;
+    if no chunk was written, close() creates an empty artifact with `columns`.
+    Parquet and Arrow output stores every column as a nullable string, since
+    a chunk cannot tell whether a column is numeric, textual or all missing.
+    """
+
+    def __init__(self, path: str, columns: Optional[Iterable[str]] = None):
+        self.path = path
+        self.columns = list(columns or [])
+        self.rows_written = 0
+        self.format = format_of(path)
+        self._tmp_path = f"{path}.tmp"
+        self._writer = None
+        self._sink = None
+        self._schema = None
+        self._header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        self.rows_written += len(df)
+        if self.format == 'csv':
+            df.to_csv(self._tmp_path, index=False, header=self._header, mode='w' if self._header else 'a',
+                      encoding='utf-8')
+            self._header = False
+            return
+
+        pa = _pyarrow()
+        if self._writer is None:
+            self._schema = pa.schema([pa.field(str(col), pa.string()) for col in df.columns])
+            table = pa.Table.from_pandas(_text_frame(df), schema=self._schema, preserve_index=False)
+            if self.format == 'parquet':
+                self._writer = pa.parquet.ParquetWriter(self._tmp_path, self._schema)
+            else:
+                self._sink = pa.OSFile(self._tmp_path, 'wb')
+                self._writer = pa.ipc.new_file(self._sink, self._schema)
+        else:
+            table = pa.Table.from_pandas(_text_frame(df), schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            if self._sink is not None:
+                self._sink.close()
+        elif self._header:
+            write_artifact(pd.DataFrame(columns=self.columns), self.path)
+            return
+
+        commit_file(self._tmp_path, self.path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a pipeline artifact to another format")
+    parser.add_argument('input', help="Artifact to read (.csv, .parquet or .arrow)")
+    parser.add_argument('--to', choices=sorted(ARTIFACT_FORMATS), default='csv', help="Format to export to")
+    args = parser.parse_args()
+
+    output = os.path.splitext(args.input)[0] + ARTIFACT_FORMATS[args.to]
+    if os.path.abspath(output) == os.path.abspath(args.input):
+        parser.error(f"{args.input} is already in {args.to} format")
+
+    writer = ChunkedArtifactWriter(output)
+    for chunk in iter_artifact_chunks(args.input):
+        writer.write(chunk)
+    if writer.rows_written:
+        writer.close()
+    else:
+        write_artifact(read_artifact(args.input), output)
+    print(f"Exported {args.input} to {output}")
+
+if __name__ == "__main__":
+    main()
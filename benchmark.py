@@ -0,0 +1,418 @@
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import numpy as np
+
+# Synthetic input sizes selectable with --size
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+
+# Stages in pipeline order; each one reads what the previous one wrote
+STAGES = ['sentiment', 'phrases', 'sets', 'generation', 'clean']
+
+DEFAULT_RESULTS_PATH = 'benchmark_results.json'
+INPUT_CHUNK_ROWS = 50000
+REVIEWS_PER_PROJECT = 50
+
+POSITIVE_FRAGMENTS = [
+    'well maintained garden', 'good security', 'spacious rooms', 'clean swimming pool', 'helpful maintenance staff',
+    'great connectivity to the metro', 'plenty of natural light', 'quiet neighbourhood', 'good quality tiles',
+    'well equipped gym', 'ample parking space', 'nice play area for kids', 'reliable power backup',
+    'good ventilation', 'schools nearby', 'wide internal roads'
+]
+NEGATIVE_FRAGMENTS = [
+    'frequent water cuts', 'poor wall finishing', 'slow lifts', 'constant traffic noise', 'seepage in the walls',
+    'broken gate', 'inadequate lighting at night', 'stuffy rooms', 'cramped living area', 'mosquito problem',
+    'poorly maintained club house', 'long wait for repairs', 'potholes near the entrance', 'weak mobile signal'
+]
+FILLERS = [
+    'I have been living here for some time.', 'Overall it is a decent place to live.',
+    'My family moved in recently.', 'Would recommend visiting before deciding.', 'Nothing much else to add.'
+]
+STAYS = ['6 months', '1 year', '2 years', '3 years', '5 years', '8 years']
+
+class LatencyModel:
+    """
+    Log-normal call latency (median_ms, sigma) with injected server errors
+    and 429 throttling at the given rates. Configured from BENCH_* variables
+    so the stage subprocesses see the same settings as the stub server.
+    """
+
+    def __init__(self, median_ms=20.0, sigma=0.5, error_rate=0.0, throttle_rate=0.0, seed=0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def from_env(cls):
+        return cls(median_ms=float(os.getenv('BENCH_LATENCY_MS', '20')),
+                   sigma=float(os.getenv('BENCH_LATENCY_SIGMA', '0.5')),
+                   error_rate=float(os.getenv('BENCH_ERROR_RATE', '0')),
+                   throttle_rate=float(os.getenv('BENCH_THROTTLE_RATE', '0')))
+
+    def to_env(self):
+        return {'BENCH_LATENCY_MS': str(self.median_ms), 'BENCH_LATENCY_SIGMA': str(self.sigma),
+                'BENCH_ERROR_RATE': str(self.error_rate), 'BENCH_THROTTLE_RATE': str(self.throttle_rate)}
+
+    def delay(self):
+        return self.median_ms / 1000 * math.exp(self.sigma * self._rng.gauss(0, 1))
+
+    def outcome(self):
+        """'throttle', 'error' or 'ok' for the next call."""
+        draw = self._rng.random()
+        if draw < self.throttle_rate:
+            return 'throttle'
+        if draw < self.throttle_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+def generate_input(path, rows, seed=0):
+    """
+    Write a synthetic input.csv of `rows` reviews, REVIEWS_PER_PROJECT per
+    project, built from the fragment lists so the stub can answer them.
+    """
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['xid', 'Project name', 'How Long do you stay here', 'Review'])
+        batch = []
+        for i in range(rows):
+            project = i // REVIEWS_PER_PROJECT
+            parts = [f"The {fragment} is a big plus." for fragment in rng.sample(POSITIVE_FRAGMENTS, rng.randint(0, 3))]
+            parts += [f"There is {fragment}." for fragment in rng.sample(NEGATIVE_FRAGMENTS, rng.randint(0, 2))]
+            parts.append(rng.choice(FILLERS))
+            rng.shuffle(parts)
+            batch.append([f"X{project:07d}", f"Project {project}", rng.choice(STAYS), ' '.join(parts)])
+            if len(batch) >= INPUT_CHUNK_ROWS:
+                writer.writerows(batch)
+                batch = []
+        writer.writerows(batch)
+
+def _fragments(text):
+    text = text.lower()
+    return ([fragment for fragment in POSITIVE_FRAGMENTS if fragment in text],
+            [fragment for fragment in NEGATIVE_FRAGMENTS if fragment in text])
+
+def _classify(text):
+    positives, negatives = _fragments(text)
+    if not positives and not negatives:
+        return 'ignore'
+    return 'positive' if len(positives) >= len(negatives) else 'negative'
+
+def analyze_reply(messages):
+    """Canned /api/analyze result for a sentiment, batch sentiment or phrase request."""
+    user = messages[-1]['content']
+    numbered = re.findall(r'^(\d+)\. Review: (.*)$', user, re.MULTILINE)
+    if numbered:
+        return json.dumps([{'id': int(number), 'sentiment': _classify(text)} for number, text in numbered])
+    if 'Extract specific phrases' in user:
+        positives, negatives = _fragments(user)
+        return '\n'.join([f'"{p}" (positive)' for p in positives] + [f'"{n}" (negative)' for n in negatives])
+    return _classify(user)
+
+class StubAnalyzeServer:
+    """
+    Local stand-in for the /api/analyze endpoint used by sentiment.py and
+    phrases_extraction.py, answering every POST after a latency drawn from
+    the LatencyModel (or with a 429/500 at its configured rates).
+    """
+
+    def __init__(self, latency, host='127.0.0.1', port=0):
+        latency_model = latency
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                outcome = latency_model.outcome()
+                time.sleep(latency_model.delay())
+                if outcome == 'ok':
+                    self._reply(200, {'result': analyze_reply(body.get('messages', [{'content': ''}]))})
+                elif outcome == 'throttle':
+                    self._reply(429, {'error': 'rate limited'})
+                else:
+                    self._reply(500, {'error': 'internal error'})
+
+            def _reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/analyze"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class FakeGeminiClient:
+    """
+    Drop-in for GeminiKeyClient (a GeminiDispatcher client_factory) that
+    sleeps for the LatencyModel delay and returns a schema-valid review, or
+    raises like the real SDK for injected errors and 429s.
+    """
+
+    latency = None
+
+    def __init__(self, api_key, model_name, rate_limiter=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter
+        if FakeGeminiClient.latency is None:
+            FakeGeminiClient.latency = LatencyModel.from_env()
+
+    def generate(self, system_instruction, message):
+        from google.api_core.exceptions import InternalServerError, ResourceExhausted
+        from review_generation import record_generation_call
+
+        outcome = self.latency.outcome()
+        start = time.perf_counter()
+        time.sleep(self.latency.delay())
+        seconds = time.perf_counter() - start
+
+        if outcome != 'ok':
+            error = ResourceExhausted('429 quota exceeded') if outcome == 'throttle' else InternalServerError('500')
+            record_generation_call(self.api_key, seconds, system_instruction, message, error=error)
+            raise error
+
+        lines = dict(line.split(': ', 1) for line in message.splitlines() if ': ' in line)
+        text = json.dumps({
+            'positive_review': f"Residents like the {lines.get('Positive', 'location')}.",
+            'negative_review': f"Some complain about {lines.get('Negative', 'maintenance')}.",
+            'society_management': '4', 'green_area': '3', 'amenities': '4', 'connectivity': '4',
+            'construction': '3', 'overall': '3.6', 'duration_of_stay': lines.get('Stay', 'N.A.')
+        })
+        record_generation_call(self.api_key, seconds, system_instruction, message, SimpleNamespace(text=text),
+                               rate_limiter=self.rate_limiter)
+        return text
+
+def run_stage(stage, args):
+    """Run one stage in the current directory (called inside the stage subprocess)."""
+    if stage == 'sentiment':
+        import sentiment
+        sentiment.process_sentiments('input.csv', 'reviews.csv', 'ignore.csv', max_workers=args.workers,
+                                     batch_size=args.sentiment_batch_size)
+    elif stage == 'phrases':
+        import phrases_extraction
+        phrases_extraction.process_phrases('reviews.csv', 'phrases.csv', max_workers=args.workers)
+    elif stage == 'sets':
+        import set_making
+        set_making.main()
+    elif stage == 'generation':
+        import review_generation
+        from artifacts import artifact_path, find_artifact, read_artifact
+        gen = review_generation.GeminiReviewGenerator()
+        dispatcher = review_generation.GeminiDispatcher(gen, client_factory=FakeGeminiClient,
+                                                        workers_per_key=max(1, args.workers // len(gen.api_keys)))
+        review_generation.generate_reviews(read_artifact(find_artifact('output_sets')),
+                                           artifact_path('structured_reviews'), gen=gen, dispatcher=dispatcher)
+    elif stage == 'clean':
+        import clean
+        clean.main()
+
+def _stage_rows(stage):
+    """Number of input rows the stage processed, read from its input artifact."""
+    import pandas as pd
+    from artifacts import find_artifact, iter_artifact_chunks
+
+    if stage in ('sentiment', 'phrases'):
+        path = 'input.csv' if stage == 'sentiment' else 'reviews.csv'
+        return sum(len(chunk) for chunk in pd.read_csv(path, usecols=['xid'], chunksize=INPUT_CHUNK_ROWS))
+    if stage == 'sets':
+        return sum(len(chunk) for chunk in iter_artifact_chunks(find_artifact('phrases')))
+    if stage == 'generation':
+        # One generation request per non-empty set
+        rows = 0
+        for chunk in iter_artifact_chunks(find_artifact('output_sets')):
+            set_columns = [col for col in chunk.columns if col.startswith('Set ')]
+            rows += int(chunk[set_columns].fillna('').astype(str).apply(lambda col: col.str.strip() != '').sum().sum())
+        return rows
+    return sum(len(chunk) for chunk in iter_artifact_chunks(find_artifact('structured_reviews')))
+
+def _call_stats(metrics_path):
+    latencies, errors, retries = [], 0, 0
+    if os.path.exists(metrics_path):
+        with open(metrics_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                event = json.loads(line)
+                if event['event'] == 'call':
+                    latencies.append(event['seconds'])
+                    errors += event['status'] != 'ok'
+                elif event['event'] == 'retry':
+                    retries += 1
+
+    stats = {'calls': len(latencies), 'errors': errors, 'retries': retries, 'p50_ms': None, 'p99_ms': None}
+    if latencies:
+        stats['p50_ms'], stats['p99_ms'] = (round(float(v) * 1000, 1) for v in np.percentile(latencies, [50, 99]))
+    return stats
+
+def benchmark_stage(stage, workdir, env, args):
+    """
+    Run a stage in its own subprocess so its peak RSS is measured alone, and
+    return rows/sec, per-call latency percentiles and peak RSS.
+    """
+    metrics_path = os.path.join(workdir, f"{stage}.metrics.jsonl")
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+    result_path = os.path.join(workdir, f"{stage}.result.json")
+
+    command = [sys.executable, os.path.abspath(__file__), '--run-stage', stage, '--workers', str(args.workers),
+               '--sentiment-batch-size', str(args.sentiment_batch_size)]
+    with open(os.path.join(workdir, f"{stage}.log"), 'w', encoding='utf-8') as log:
+        completed = subprocess.run(command, cwd=workdir, env=dict(env, METRICS_PATH=metrics_path),
+                                   stdout=log, stderr=subprocess.STDOUT)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Stage {stage} failed, see {os.path.join(workdir, stage + '.log')}")
+
+    with open(result_path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        rows = _stage_rows(stage)
+    finally:
+        os.chdir(cwd)
+
+    result.update(rows=rows, rows_per_sec=round(rows / result['seconds'], 1) if result['seconds'] else None)
+    result.update(_call_stats(metrics_path))
+    return result
+
+def _stage_main(stage, args):
+    start = time.perf_counter()
+    run_stage(stage, args)
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    with open(f"{stage}.result.json", 'w', encoding='utf-8') as f:
+        json.dump({'seconds': round(seconds, 3), 'peak_rss_mb': round(peak_mb, 1)}, f)
+
+def _print_report(results):
+    print(f"{'stage':<12}{'rows':>10}{'seconds':>10}{'rows/sec':>12}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'errors':>8}{'retries':>8}{'peak MB':>10}")
+    for stage, r in results.items():
+        fmt = lambda value: '-' if value is None else value
+        print(f"{stage:<12}{r['rows']:>10}{r['seconds']:>10}{fmt(r['rows_per_sec']):>12}{fmt(r['p50_ms']):>10}"
+              f"{fmt(r['p99_ms']):>10}{r['errors']:>8}{r['retries']:>8}{r['peak_rss_mb']:>10}")
+
+def find_regressions(results, baseline, max_regression):
+    """Stages whose rows/sec fell, or peak RSS grew, by more than max_regression vs the baseline."""
+    regressions = []
+    for stage, result in results.items():
+        before = baseline.get('stages', {}).get(stage)
+        if not before:
+            continue
+        if before.get('rows_per_sec') and result['rows_per_sec'] is not None \
+                and result['rows_per_sec'] < before['rows_per_sec'] * (1 - max_regression):
+            regressions.append(f"{stage}: {result['rows_per_sec']} rows/sec vs {before['rows_per_sec']}")
+        if before.get('peak_rss_mb') and result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + max_regression):
+            regressions.append(f"{stage}: {result['peak_rss_mb']} MB peak RSS vs {before['peak_rss_mb']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage against local stub LLMs")
+    parser.add_argument('--size', default='1k', help="Input rows: 1k, 100k, 1m or a number")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--workdir', help="Directory for the stage artifacts (default: a temporary directory)")
+    parser.add_argument('--workers', type=int, default=16, help="Concurrent LLM calls per stage")
+    parser.add_argument('--sentiment-batch-size', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Median stub latency")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="Log-normal spread of the stub latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls answered with a 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of calls answered with a 429")
+    parser.add_argument('--gemini-keys', type=int, default=2, help="Fake Gemini API keys to spread generation over")
+    parser.add_argument('--format', default='csv', help="ARTIFACT_FORMAT for sets, generation and clean")
+    parser.add_argument('--output', default=DEFAULT_RESULTS_PATH, help="Where the JSON results are written")
+    parser.add_argument('--baseline', help="Earlier results file to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Allowed fractional drop in rows/sec (or growth in peak RSS) vs --baseline")
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        _stage_main(args.run_stage, args)
+        return
+
+    rows = SIZES.get(args.size.lower()) or int(args.size)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='review_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    if os.path.exists(os.path.join(repo_dir, 'gemini_ai_prompts.json')):
+        shutil.copy(os.path.join(repo_dir, 'gemini_ai_prompts.json'), workdir)
+
+    latency = LatencyModel(args.latency_ms, args.latency_sigma, args.error_rate, args.throttle_rate)
+    server = StubAnalyzeServer(latency).start()
+
+    env = dict(os.environ, **latency.to_env())
+    env.update({
+        'PYTHONPATH': os.pathsep.join(filter(None, [repo_dir, env.get('PYTHONPATH')])),
+        'SENTIMENT_API_URL': server.url, 'PHRASES_API_URL': server.url,
+        'LLM_CACHE_DISABLED': '1', 'ARTIFACT_FORMAT': args.format,
+        'GEMINI_RPM': '1000000', 'GEMINI_RPD': '1000000000'
+    })
+    env.pop('GEMINI_API_KEY', None)
+    env.update({f'GEMINI_API_KEY_{i}': f'bench-key-{i}' for i in range(1, args.gemini_keys + 1)})
+
+    results = {}
+    try:
+        if 'sentiment' in args.stages:
+            start = time.time()
+            generate_input(os.path.join(workdir, 'input.csv'), rows)
+            print(f"Generated {rows} input rows in {time.time() - start:.1f}s ({workdir})")
+
+        for stage in args.stages:
+            print(f"Running {stage}...")
+            results[stage] = benchmark_stage(stage, workdir, env, args)
+    finally:
+        server.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_report(results)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'rows': rows, 'settings': {k: v for k, v in vars(args).items() if k != 'run_stage'},
+                   'stages': results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
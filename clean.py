@@ -1,52 +1,94 @@
-
 import pandas as pd
 import json
+from collections import Counter
+from artifacts import ChunkedArtifactWriter, artifact_path, find_artifact, iter_artifact_chunks
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Rows of structured_reviews.csv read at a time by main()
+DEFAULT_CHUNK_SIZE = 50000
+
+# Review JSON field -> processed_reviews.csv column
+REVIEW_FIELDS = {
+    'duration_of_stay': 'duration_of_stay',
+    'positive_review': 'positive',
+    'negative_review': 'negative',
+    'society_management': 'society_management',
+    'green_area': 'green_area',
+    'amenities': 'amenities',
+    'connectivity': 'connectivity',
+    'construction': 'construction',
+    'overall': 'overall_rating'
+}
+
+OUTPUT_COLUMNS = ['xid', 'project_name'] + list(REVIEW_FIELDS.values())
+
+def _parse_review(cell):
+    try:
+        review_data = _loads(cell)
+    except (ValueError, TypeError):
+        return None
+    return review_data if isinstance(review_data, dict) else None
+
+def flatten_reviews(df, failures=None):
+    """
+    Expand the JSON 'Review N' cells of structured_reviews.csv into one flat
+    row per generated review. Cells that are not a JSON object are skipped
+    and counted per column in `failures` (a Counter) when one is given,
+    otherwise summarized in a single line.
+    """
+    review_columns = [col for col in df.columns if 'Review' in col]
+
+    # One row per (project, review column), kept in the original row-major order
+    reviews = df.melt(id_vars=['xid', 'Project name'], value_vars=review_columns, var_name='column',
+                      value_name='review', ignore_index=False)
+    # Sets without a review are empty strings in Parquet/Arrow artifacts and NaN in CSV
+    reviews = reviews[reviews['review'].notna() & (reviews['review'] != '')].sort_index(kind='stable')
+
+    parsed = reviews['review'].map(_parse_review)
+    invalid = parsed.isna()
+    counts = Counter(reviews.loc[invalid, 'column'].value_counts().to_dict())
+    if failures is not None:
+        failures.update(counts)
+    elif counts:
+        print(f"Skipped invalid review JSON: {dict(counts)}")
+
+    reviews = reviews[~invalid]
+    fields = pd.DataFrame(parsed[~invalid].tolist(), columns=list(REVIEW_FIELDS))
+    fields = fields.fillna('N.A.').rename(columns=REVIEW_FIELDS)
+
+    flat = pd.DataFrame({'xid': reviews['xid'].to_numpy(), 'project_name': reviews['Project name'].to_numpy()})
+    return pd.concat([flat, fields], axis=1)[OUTPUT_COLUMNS]
+
+def flatten_reviews_file(input_file, output_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Flatten a structured reviews artifact (CSV, Parquet or Arrow) chunk by
+    chunk so memory stays bounded by chunk_size. Returns (projects read,
+    reviews written, failures per column).
+    """
+    projects = 0
+    failures = Counter()
+    writer = ChunkedArtifactWriter(output_file, columns=OUTPUT_COLUMNS)
+
+    for chunk in iter_artifact_chunks(input_file, chunk_size):
+        writer.write(flatten_reviews(chunk, failures))
+        projects += len(chunk)
+
+    writer.close()
+    return projects, writer.rows_written, failures
+
+def main():
+    output_file = artifact_path('processed_reviews')
+    projects, reviews, failures = flatten_reviews_file(find_artifact('structured_reviews'), output_file)
+
+    print(f"Processed {reviews} reviews from {projects} projects.")
+    for col, count in sorted(failures.items()):
+        print(f"Skipped {count} invalid JSON cell(s) in {col}")
+    print(f"New file created as '{output_file}'")
 
-df = pd.read_csv('structured_reviews.csv')
-
-new_rows = []
-
-for _, row in df.iterrows():
-    xid = row['xid']
-    project_name = row['Project name']
-    
-    
-    for col in df.columns:
-        if 'Review' in col and pd.notna(row[col]):
-            try:
-                # Parse JSON string from the review column
-                review_data = json.loads(row[col])
-                
-                positive = review_data.get('positive_review', 'N.A.')
-                negative = review_data.get('negative_review', 'N.A.')
-                duration = review_data.get('duration_of_stay', 'N.A.')
-                
-                society_management = review_data.get('society_management', 'N.A.')
-                green_area = review_data.get('green_area', 'N.A.')
-                amenities = review_data.get('amenities', 'N.A.')
-                connectivity = review_data.get('connectivity', 'N.A.')
-                construction = review_data.get('construction', 'N.A.')
-                overall = review_data.get('overall', 'N.A.')
-                
-                new_rows.append({
-                    'xid': xid,
-                    'project_name': project_name,
-                    'duration_of_stay': duration,
-                    'positive': positive,
-                    'negative': negative,
-                    'society_management': society_management,
-                    'green_area': green_area,
-                    'amenities': amenities,
-                    'connectivity': connectivity,
-                    'construction': construction,
-                    'overall_rating': overall
-                })
-            except (json.JSONDecodeError, AttributeError) as e:
-                print(f"Skipping invalid JSON in {col} for xid {xid}: {e}")
-                continue
-
-new_df = pd.DataFrame(new_rows)
-new_df.to_csv('processed_reviews.csv', index=False)
-
-print(f"Processed {len(new_rows)} reviews from {len(df)} projects.")
-print("New CSV created as 'processed_reviews.csv'")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """
+    Boolean environment setting: 1/true/yes or 0/false/no (any case);
+    unset, empty or anything else gives default.
+    """
+    value = os.getenv(name, '').strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    return default
@@ -0,0 +1,52 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+def _fsync(path: str) -> None:
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+def _fsync_directory(path: str) -> None:
+    # Make a rename durable; directories cannot be opened this way on Windows
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def commit_file(tmp_path: str, path: str, fsync: bool = True) -> None:
+    """
+    Rename a fully written temp file over path. With fsync the data is
+    flushed to disk before the rename and the rename itself after it.
+    """
+    if fsync:
+        _fsync(tmp_path)
+    os.replace(tmp_path, path)
+    if fsync:
+        _fsync_directory(os.path.dirname(path))
+
+@contextmanager
+def atomic_path(path: str, suffix: str = '.tmp', fsync: bool = True) -> Iterator[str]:
+    """
+    Temp path to write the new content of path to. It replaces path through
+    commit_file() when the block succeeds and is removed when it raises, so
+    readers see the old file or the new one, never a partial write.
+    """
+    tmp_path = f"{path}{suffix}"
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    commit_file(tmp_path, path, fsync=fsync)
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'w', fsync: bool = True, **open_kwargs):
+    """open() for an atomic_path(): the file replaces path once it is closed."""
+    with atomic_path(path, fsync=fsync) as tmp_path:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            yield f
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from config import env_flag
+
+DEFAULT_CACHE_PATH = 'llm_cache.sqlite3'
+DEFAULT_MAX_SIZE_MB = 512
+
+# The in-memory size total is re-read from the table every this many inserts,
+# in case other processes share the cache file
+SIZE_RESYNC_EVERY = 1000
+# last_used updates from hits are written in batches of this many
+TOUCH_BATCH = 500
+
+class LLMCache:
+    """
+    On-disk, content-addressed cache of LLM responses.
+
+    Entries are keyed by a hash of (endpoint/model, system prompt, user message,
+    temperature), so any prompt change naturally misses. When the stored
+    responses grow past max_size_bytes the least recently used entries are evicted.
+    The stored size is tracked in memory so inserts never scan the table, and
+    hits only queue their last_used update; queued updates are written in
+    batches, and always before an eviction.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_size_bytes: int = DEFAULT_MAX_SIZE_MB * 1024 * 1024,
+                 enabled: bool = True):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total_size = 0
+        self._inserts = 0
+        self._touched: Dict[str, float] = {}
+
+        if self.enabled:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)')
+            self._conn.commit()
+            self._total_size = self._stored_size()
+
+    def _stored_size(self) -> int:
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _flush_touches(self) -> None:
+        if not self._touched:
+            return
+        self._conn.executemany('UPDATE responses SET last_used = ? WHERE key = ?',
+                               [(used, key) for key, used in self._touched.items()])
+        self._conn.commit()
+        self._touched.clear()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_message: str, temperature: float) -> str:
+        payload = json.dumps([model, system_prompt, user_message, temperature], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touches()
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled or value is None:
+            return
+
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            previous = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                (key, value, size, time.time())
+            )
+            self._touched.pop(key, None)
+            self._total_size += size - (previous[0] if previous else 0)
+
+            self._inserts += 1
+            if self._inserts % SIZE_RESYNC_EVERY == 0:
+                self._total_size = self._stored_size()
+            if self._total_size > self.max_size_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        self._flush_touches()
+        total = self._total_size = self._stored_size()
+        if total <= self.max_size_bytes:
+            return
+
+        # Trim down to 90% of the budget so we don't evict on every insert
+        target = int(self.max_size_bytes * 0.9)
+        victims = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_used'):
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', victims)
+        self._total_size = total
+        logging.info(f"LLM cache evicted {len(victims)} entries to stay under {self.max_size_bytes} bytes")
+
+    def stats(self) -> Dict[str, int]:
+        entries = size = 0
+        if self.enabled:
+            with self._lock:
+                entries, size = self._conn.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+                ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'size_bytes': size}
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._flush_touches()
+                self._conn.close()
+                self._conn = None
+            self.enabled = False
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_cache() -> LLMCache:
+    """
+    Return the process-wide cache, configured from LLM_CACHE_PATH,
+    LLM_CACHE_MAX_MB and LLM_CACHE_DISABLED (set to 1 to opt out).
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            disabled = env_flag('LLM_CACHE_DISABLED')
+            _shared_cache = LLMCache(
+                path=os.getenv('LLM_CACHE_PATH', DEFAULT_CACHE_PATH),
+                max_size_bytes=int(float(os.getenv('LLM_CACHE_MAX_MB', DEFAULT_MAX_SIZE_MB)) * 1024 * 1024),
+                enabled=not disabled
+            )
+        return _shared_cache
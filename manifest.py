@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Set
+
+from fileutil import atomic_open
+
+DEFAULT_MANIFEST_PATH = 'pipeline_manifest.json'
+
+class PipelineManifest:
+    """
+    Per-xid record of what the pipeline has already processed: a fingerprint
+    of the project's reviews and a hash of every generated set. Comparing a
+    new input against it tells each stage which xids and sets actually changed.
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self.xids: Dict[str, Dict] = {}
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.xids = json.load(f).get('xids', {})
+
+    @staticmethod
+    def review_fingerprint(review_keys: Iterable[str]) -> str:
+        return hashlib.sha1('\n'.join(sorted(review_keys)).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def set_hash(set_phrases: str, duration: str) -> str:
+        return hashlib.sha1(f"{set_phrases}\x1f{duration}".encode('utf-8')).hexdigest()
+
+    def changed_xids(self, review_keys_by_xid: Dict[str, Iterable[str]]) -> Set[str]:
+        """
+        xids whose reviews differ from the last run, including xids that
+        disappeared from the input entirely.
+        """
+        changed = {
+            xid for xid, keys in review_keys_by_xid.items()
+            if self.xids.get(xid, {}).get('reviews') != self.review_fingerprint(keys)
+        }
+        changed.update(xid for xid in self.xids if xid not in review_keys_by_xid)
+        return changed
+
+    def record_reviews(self, xid: str, review_keys: Iterable[str]) -> None:
+        self.xids.setdefault(xid, {})['reviews'] = self.review_fingerprint(review_keys)
+
+    def forget_reviews(self, xid: str) -> None:
+        """Drop the fingerprint of an xid so the next run treats it as changed."""
+        self.xids.get(xid, {}).pop('reviews', None)
+
+    def changed_sets(self, xid: str, set_hashes: Dict[int, str]) -> Set[int]:
+        previous = self.xids.get(xid, {}).get('sets', {})
+        return {number for number, digest in set_hashes.items() if previous.get(str(number)) != digest}
+
+    def record_sets(self, xid: str, set_hashes: Dict[int, str]) -> None:
+        self.xids.setdefault(xid, {})['sets'] = {str(number): digest for number, digest in set_hashes.items()}
+
+    def forget(self, xid: str) -> None:
+        self.xids.pop(xid, None)
+
+    def save(self) -> None:
+        # Write to a temp file first so a crash never leaves a truncated manifest
+        with atomic_open(self.path, encoding='utf-8') as f:
+            json.dump({'version': 1, 'xids': self.xids}, f)
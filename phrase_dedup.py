@@ -0,0 +1,172 @@
+import itertools
+import os
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ChunkedArtifactWriter, artifact_path, find_artifact, iter_records
+from phrases_extraction import PHRASE_FIELDNAMES
+from set_making import extract_years, sort_by_xid
+
+# Artifact names; the file format comes from ARTIFACT_FORMAT
+input_artifact = 'phrases'
+output_artifact = 'phrases_dedup'
+
+DEDUP_FIELDNAMES = PHRASE_FIELDNAMES + ['Count']
+
+# Character shingle size and Jaccard similarity at which two phrases are merged
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = float(os.getenv('PHRASE_DEDUP_THRESHOLD', '0.6'))
+
+# MinHash signature = BANDS * ROWS_PER_BAND permutations; LSH candidates share a band
+BANDS = 16
+ROWS_PER_BAND = 4
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, _PRIME, size=(BANDS * ROWS_PER_BAND, 1)).astype(np.int64)
+_B = _rng.randint(0, _PRIME, size=(BANDS * ROWS_PER_BAND, 1)).astype(np.int64)
+# Odd multipliers that fold a band's rows into a single uint64 bucket key
+_BAND_MIX = (_rng.randint(1, _PRIME, size=ROWS_PER_BAND).astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+
+# Output rows collected before they are written out by main()
+WRITE_CHUNK_ROWS = 5000
+
+STOPWORDS = {'a', 'an', 'the', 'is', 'are', 'was', 'were', 'and', 'of', 'in', 'on', 'at', 'to', 'for',
+             'with', 'very', 'really', 'quite', 'it', 'its', 'this', 'there'}
+
+def normalize_phrase(phrase):
+    words = re.sub(r'[^a-z0-9 ]+', ' ', str(phrase).lower()).split()
+    return ' '.join(word for word in words if word not in STOPWORDS)
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Hashed character shingles of a normalized phrase, as a frozenset of ints."""
+    padded = f" {text} "
+    grams = [padded] if len(padded) <= size else [padded[i:i + size] for i in range(len(padded) - size + 1)]
+    # Hashed directly rather than memoized: review shingles have no small vocabulary
+    return frozenset(zlib.crc32(gram.encode('utf-8')) & _PRIME for gram in grams)
+
+def minhash_signatures(shingle_sets):
+    """
+    MinHash signatures (one row per shingle set) for all sets at once: the
+    permutations are applied as (a * h + b) mod p over the concatenated
+    shingle hashes and reduced per set.
+    """
+    lengths = [len(shingle_set) for shingle_set in shingle_sets]
+    hashes = np.fromiter(itertools.chain.from_iterable(shingle_sets), dtype=np.int64, count=sum(lengths))
+    offsets = np.cumsum([0] + lengths[:-1])
+    permuted = (_A * hashes[None, :] + _B) % _PRIME
+    return np.minimum.reduceat(permuted, offsets, axis=1).T
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def cluster_phrases(normalized, threshold=DEFAULT_THRESHOLD):
+    """
+    Cluster distinct normalized phrases whose character-shingle Jaccard
+    similarity reaches threshold. LSH over MinHash bands proposes candidate
+    pairs and each one is confirmed with the exact Jaccard. Returns the
+    cluster label (index of the cluster's first phrase) for every phrase.
+    """
+    count = len(normalized)
+    parent = list(range(count))
+    if count < 2:
+        return parent
+
+    shingle_sets = [shingles(text) for text in normalized]
+    signatures = minhash_signatures(shingle_sets)
+    band_keys = (signatures.reshape(count, BANDS, ROWS_PER_BAND).astype(np.uint64) * _BAND_MIX).sum(axis=2)
+
+    for band in range(BANDS):
+        # Sort the band's keys; runs of equal keys are the LSH buckets
+        order = np.argsort(band_keys[:, band], kind='stable')
+        sorted_keys = band_keys[order, band]
+        same = sorted_keys[1:] == sorted_keys[:-1]
+        if not same.any():
+            continue
+        edges = np.diff(np.concatenate(([False], same, [False])).astype(np.int8))
+
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            for i, j in itertools.combinations(order[start:end + 1].tolist(), 2):
+                root_i, root_j = _find(parent, i), _find(parent, j)
+                if root_i == root_j:
+                    continue
+                union = len(shingle_sets[i] | shingle_sets[j])
+                if len(shingle_sets[i] & shingle_sets[j]) >= threshold * union:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return [_find(parent, i) for i in range(count)]
+
+def dedup_group(rows, threshold=DEFAULT_THRESHOLD):
+    """
+    Collapse one xid's phrase rows into one row per near-duplicate cluster
+    and sentiment. The representative is the cluster's most frequent phrase
+    (shortest first on ties), 'Count' is the number of rows it stands for and
+    the stay is the average over those rows.
+    """
+    by_sentiment = defaultdict(list)
+    for row in rows:
+        by_sentiment[row['Sentiment'].strip().lower()].append(row)
+
+    output = []
+    for sentiment_rows in by_sentiment.values():
+        normalized = [normalize_phrase(row['Phrase']) for row in sentiment_rows]
+        distinct = list(dict.fromkeys(normalized))
+        labels = dict(zip(distinct, cluster_phrases(distinct, threshold)))
+
+        clusters = defaultdict(list)
+        for row, text in zip(sentiment_rows, normalized):
+            clusters[labels[text]].append(row)
+
+        for members in clusters.values():
+            counts = defaultdict(int)
+            for row in members:
+                counts[row['Phrase']] += 1
+            representative = min(counts, key=lambda phrase: (-counts[phrase], len(phrase), phrase))
+            years = sum(extract_years(row['How Long do you stay here']) for row in members) / len(members)
+
+            output.append({
+                'xid': members[0]['xid'],
+                'How Long do you stay here': f"{round(years)} years",
+                'Project name': members[0]['Project name'],
+                'Phrase': representative,
+                'Sentiment': members[0]['Sentiment'],
+                'Count': len(members)
+            })
+
+    return output
+
+def dedup_phrase_rows(rows, threshold=DEFAULT_THRESHOLD, presorted=False):
+    """
+    Stream deduplicated phrase rows (DEDUP_FIELDNAMES) one xid at a time.
+    Rows that are not already grouped by xid are sorted first.
+    """
+    if not presorted:
+        rows = sort_by_xid(rows)
+    for _, group in itertools.groupby(rows, key=lambda row: str(row['xid'])):
+        yield from dedup_group(list(group), threshold)
+
+def main():
+    output_file = artifact_path(output_artifact)
+    writer = ChunkedArtifactWriter(output_file, columns=DEDUP_FIELDNAMES)
+
+    phrases = 0
+    def counted(rows):
+        nonlocal phrases
+        for phrases, row in enumerate(rows, 1):
+            yield row
+
+    output_rows = dedup_phrase_rows(counted(iter_records(find_artifact(input_artifact))))
+    while chunk := list(itertools.islice(output_rows, WRITE_CHUNK_ROWS)):
+        writer.write(pd.DataFrame(chunk, columns=DEDUP_FIELDNAMES))
+    writer.close()
+
+    print(f"Deduplicated {phrases} phrases into {writer.rows_written} in {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,47 @@
 
 import pandas as pd
+import itertools
 import time
 import os
 import csv
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from artifacts import ChunkedArtifactWriter, artifact_path, find_artifact, format_of, read_artifact
+from llm_cache import LLMCache, get_cache
+from telemetry import get_metrics, usage_tokens
 
 load_dotenv()
 
 # API Setup
 
 
-API_URL = 'http://new99acresposting:6009/api/analyze'
+API_URL = os.getenv('PHRASES_API_URL', 'http://new99acresposting:6009/api/analyze')
+DEFAULT_WORKERS = 1
+DEFAULT_FLUSH_EVERY = 50
+
+_session = None
+_session_pool_size = 0
+_session_lock = threading.Lock()
+
+def get_session(pool_size=DEFAULT_WORKERS):
+    """
+    Shared keep-alive session so every extraction call reuses pooled
+    connections instead of opening a new one per review. The pool grows
+    when a later caller asks for more connections than it holds.
+    """
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            _session_pool_size = max(pool_size, 1)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_session_pool_size)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
 
 system_instructions = """
 [You are a helpful assistant tasked with extracting concise, meaningful phrases from a homebuyer's review that express clear positive or negative sentiment about specific aspects of the property and its immediate surroundings.
@@ -58,11 +88,28 @@ def extract_phrases(review, sentiment):
             "keyType": "MINI"
         }
         
-        response = requests.post(API_URL, json=data, headers={"Content-Type": "application/json"}, timeout=30)
-        response.raise_for_status()
-        
-        response_data = response.json()
-        print(f"API Response: {response_data}")
+        cache = get_cache()
+        cache_key = LLMCache.make_key(API_URL, system_instructions, prompt, data["temperature"])
+        cached = cache.get(cache_key)
+        if cached is not None:
+            get_metrics().record_cache_hit('phrases')
+            response_data = {"result": cached}
+        else:
+            start = time.perf_counter()
+            try:
+                response = get_session().post(API_URL, json=data, headers={"Content-Type": "application/json"}, timeout=30)
+                response.raise_for_status()
+                response_data = response.json()
+            except Exception as e:
+                get_metrics().record_call('phrases', time.perf_counter() - start, status=type(e).__name__)
+                raise
+
+            input_tokens, output_tokens = usage_tokens(response_data, system_instructions + prompt,
+                                                       str(response_data.get("result", "")))
+            get_metrics().record_call('phrases', time.perf_counter() - start,
+                                      input_tokens=input_tokens, output_tokens=output_tokens)
+            if "result" in response_data:
+                cache.set(cache_key, response_data["result"])
 
         phrases = []
         
@@ -99,10 +146,54 @@ def extract_phrases(review, sentiment):
         print(f"Phrase extraction error: {e}")
         return []
 
-def process_phrases(classified_file, phrase_output):
+PHRASE_FIELDNAMES = ['xid', 'How Long do you stay here', 'Project name', 'Phrase', 'Sentiment']
+
+def extract_phrase_rows(rows, max_workers=DEFAULT_WORKERS):
+    """
+    Yield one phrase row per extracted phrase for an iterable of classified
+    review rows (dicts or Series), in input order.
+    """
+    for phrase_rows in extract_review_phrases(rows, max_workers=max_workers):
+        yield from phrase_rows
+
+def extract_review_phrases(rows, max_workers=DEFAULT_WORKERS):
+    """
+    Like extract_phrase_rows, but yields the list of phrase rows of each
+    review that was sent for extraction (possibly empty).
+    """
+    tasks = []
+    for row in rows:
+        review = str(row['Review']).strip()
+        if not review:
+            continue
+            
+        sentiment = str(row['Sentiment']).strip().lower()
+        if sentiment not in ['positive', 'negative']:
+            continue
+
+        tasks.append((row, review, sentiment))
+
+    get_session(pool_size=max_workers)
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        # executor.map yields in submission order, so output keeps the input row order
+        results = executor.map(lambda task: extract_phrases(task[1], task[2]), tasks)
+
+        for (row, review, _), phrases_data in zip(tasks, results):
+            print(f"Extracted {len(phrases_data)} phrases from review: {review[:50]}...")
+
+            yield [{
+                'xid': row['xid'],
+                'How Long do you stay here': row['How Long do you stay here'],
+                'Project name': row['Project name'],
+                'Phrase': phrase_info['Phrase'],
+                'Sentiment': phrase_info['Sentiment']
+            } for phrase_info in phrases_data]
+
+def process_phrases(classified_file, phrase_output, max_workers=DEFAULT_WORKERS, flush_every=DEFAULT_FLUSH_EVERY):
     try:
         try:
-            df = pd.read_csv(classified_file)
+            df = read_artifact(classified_file)
         except Exception as e:
             print(f"Error reading input file: {e}")
             return
@@ -114,42 +205,46 @@ def process_phrases(classified_file, phrase_output):
 
         os.makedirs(os.path.dirname(phrase_output) or '.', exist_ok=True)
 
-        with open(phrase_output, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['xid', 'How Long do you stay here', 'Project name', 'Phrase', 'Sentiment']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for _, row in df.iterrows():
-                review = str(row['Review']).strip()
-                if not review:
-                    continue
-                    
-                sentiment = str(row['Sentiment']).strip().lower()
-                if sentiment not in ['positive', 'negative']:
-                    continue
-
-                phrases_data = extract_phrases(review, sentiment)
-                print(f"Extracted {len(phrases_data)} phrases from review: {review[:50]}...")
-
-                for phrase_info in phrases_data:
-                    writer.writerow({
-                        'xid': row['xid'],
-                        'How Long do you stay here': row['How Long do you stay here'],
-                        'Project name': row['Project name'],
-                        'Phrase': phrase_info['Phrase'],
-                        'Sentiment': phrase_info['Sentiment']
-                    })
-                csvfile.flush()
+        # Output is flushed (or written as a chunk) every flush_every reviews
+        review_phrases = extract_review_phrases((row for _, row in df.iterrows()), max_workers=max_workers)
+        if format_of(phrase_output) == 'csv':
+            with open(phrase_output, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=PHRASE_FIELDNAMES)
+                writer.writeheader()
+
+                for reviews, phrase_rows in enumerate(review_phrases, 1):
+                    writer.writerows(phrase_rows)
+                    if reviews % flush_every == 0:
+                        csvfile.flush()
+        else:
+            writer = ChunkedArtifactWriter(phrase_output, columns=PHRASE_FIELDNAMES)
+            while batch := list(itertools.islice(review_phrases, flush_every)):
+                chunk = list(itertools.chain.from_iterable(batch))
+                if chunk:
+                    writer.write(pd.DataFrame(chunk, columns=PHRASE_FIELDNAMES))
+            writer.close()
 
         print(f"Successfully saved phrases to {phrase_output}")
+        print(f"LLM cache stats: {get_cache().stats()}")
+        print(f"Phrase extraction metrics: {get_metrics().summary().get('phrases', {})}")
 
     except Exception as e:
         print(f"Error in process_phrases: {e}")
 
-# Use relative paths in current working directory
-cwd = os.getcwd()
-classified_reviews_path = os.path.join(cwd, 'reviews.csv')
-phrases_output_path = os.path.join(cwd, 'phrases.csv')
+def main():
+    # Use relative paths in current working directory
+    cwd = os.getcwd()
+    classified_reviews_path = os.path.join(cwd, find_artifact('reviews'))
+    # Written in ARTIFACT_FORMAT, so find_artifact() never prefers a stale file in another format
+    phrases_output_path = os.path.join(cwd, artifact_path('phrases'))
+
+    workers = int(os.getenv('PHRASES_WORKERS', DEFAULT_WORKERS))
+    flush_every = int(os.getenv('PHRASES_FLUSH_EVERY', DEFAULT_FLUSH_EVERY))
+
+    start = time.time()
+    process_phrases(classified_reviews_path, phrases_output_path, max_workers=workers, flush_every=flush_every)
+    get_metrics().record_stage('phrases', time.time() - start)
+    get_metrics().close()
 
-# Run the script
-process_phrases(classified_reviews_path, phrases_output_path)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import cProfile
+import logging
+import os
+import pstats
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+import clean
+import phrase_dedup
+import phrases_extraction
+import review_generation
+import sentiment
+import set_making
+from artifacts import ARTIFACT_FORMATS, artifact_path, default_format, iter_records, write_artifact
+from config import env_flag
+from manifest import DEFAULT_MANIFEST_PATH, PipelineManifest
+from review_dedup import new_dedup_index, write_spam_report
+from telemetry import get_metrics
+
+def _save_rows(rows, path, columns=None):
+    write_artifact(rows, path, columns=columns)
+    logging.info(f"Saved {len(rows)} rows to {path}")
+
+def _read_rows(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+    return list(iter_records(path))
+
+def _generation_backend(concurrent_generation, workers_per_key):
+    """
+    (generator, dispatcher) for generate_reviews: a GeminiDispatcher over
+    every API key when concurrent_generation is set, otherwise (None, None)
+    so generation runs sequentially with its own generator.
+    """
+    if not concurrent_generation:
+        return None, None
+    gen = review_generation.GeminiReviewGenerator()
+    return gen, review_generation.GeminiDispatcher(gen, workers_per_key=workers_per_key)
+
+def run_pipeline(input_file, output_file='processed_reviews.csv', ignore_file='ignore.csv',
+                 structured_file='structured_reviews.csv', sentiment_workers=1, sentiment_batch_size=1,
+                 phrase_workers=1, keep_intermediates=False, artifact_format='csv', dedup_phrases=True,
+                 concurrent_generation=False, workers_per_key=2):
+    """
+    Run sentiment -> phrases -> sets -> generation -> clean in one process,
+    handing each stage's rows to the next in memory. Only the ignored reviews,
+    the generation checkpoint and the final output are written unless
+    keep_intermediates is set; intermediates use artifact_format. Near-duplicate
+    phrases are collapsed before set making unless dedup_phrases is off.
+    With concurrent_generation, reviews are generated across all API keys
+    by a GeminiDispatcher with workers_per_key workers per key.
+    """
+    timings = {}
+
+    start = time.time()
+    classified, ignored = [], []
+    dedup = new_dedup_index()
+    for output_data, ignore_data in sentiment.classify_rows(sentiment.iter_input_rows(input_file),
+                                                            max_workers=sentiment_workers,
+                                                            batch_size=sentiment_batch_size, dedup=dedup):
+        classified.extend(output_data)
+        ignored.extend(ignore_data)
+    timings['sentiment'] = time.time() - start
+
+    _save_rows(ignored, ignore_file)
+    write_spam_report(dedup, artifact_path('suspected_spam', artifact_format))
+    if keep_intermediates:
+        _save_rows(classified, artifact_path('reviews', artifact_format))
+
+    start = time.time()
+    phrase_rows = list(phrases_extraction.extract_phrase_rows(classified, max_workers=phrase_workers))
+    timings['phrases'] = time.time() - start
+
+    if keep_intermediates:
+        _save_rows(phrase_rows, artifact_path('phrases', artifact_format),
+                   columns=phrases_extraction.PHRASE_FIELDNAMES)
+
+    if dedup_phrases:
+        start = time.time()
+        phrase_rows = list(phrase_dedup.dedup_phrase_rows(phrase_rows))
+        timings['dedup'] = time.time() - start
+
+        if keep_intermediates:
+            _save_rows(phrase_rows, artifact_path(phrase_dedup.output_artifact, artifact_format),
+                       columns=phrase_dedup.DEDUP_FIELDNAMES)
+
+    start = time.time()
+    set_rows = set_making.make_sets(phrase_rows, presorted=dedup_phrases)
+    timings['sets'] = time.time() - start
+
+    if keep_intermediates:
+        _save_rows(set_rows, artifact_path('output_sets', artifact_format), columns=set_making.output_headers())
+
+    if not set_rows:
+        # Leave empty outputs rather than the files of an earlier run
+        logging.warning("No phrases were extracted, nothing to generate")
+        review_generation.StructuredReviewWriter(structured_file, set_making.NUM_SETS, truncate=True).close()
+        write_artifact(pd.DataFrame(columns=clean.OUTPUT_COLUMNS), output_file)
+        return timings
+
+    start = time.time()
+    gen, dispatcher = _generation_backend(concurrent_generation, workers_per_key)
+    structured_rows = review_generation.generate_reviews(pd.DataFrame(set_rows), structured_file, gen=gen,
+                                                         dispatcher=dispatcher)
+    timings['generation'] = time.time() - start
+
+    if structured_rows is None:
+        raise RuntimeError("Review generation could not start")
+
+    start = time.time()
+    processed = clean.flatten_reviews(pd.DataFrame(structured_rows))
+    write_artifact(processed, output_file)
+    timings['clean'] = time.time() - start
+
+    logging.info(f"Saved {len(processed)} processed reviews to {output_file}")
+    return timings
+
+def run_incremental(input_file, output_file='processed_reviews.csv', ignore_file='ignore.csv',
+                    structured_file='structured_reviews.csv', manifest_path=DEFAULT_MANIFEST_PATH,
+                    sentiment_workers=1, sentiment_batch_size=1, phrase_workers=1, artifact_format='csv',
+                    dedup_phrases=True, concurrent_generation=False, workers_per_key=2):
+    """
+    Re-run the pipeline for only the xids whose reviews changed since the
+    last run. The previous reviews, phrases, output_sets and structured
+    reviews artifacts act as the state store: rows for unchanged xids
+    are carried over, only new reviews are classified, and only sets whose
+    content hash changed are regenerated.
+    """
+    timings = {}
+    manifest = PipelineManifest(manifest_path)
+    reviews_file = artifact_path('reviews', artifact_format)
+    phrases_file = artifact_path('phrases', artifact_format)
+    sets_file = artifact_path('output_sets', artifact_format)
+
+    # Fingerprint every xid's reviews to find the affected groups
+    start = time.time()
+    keys_by_xid = defaultdict(list)
+    for _, row in sentiment.iter_input_rows(input_file):
+        review = sentiment.review_text(row)
+        if review:
+            keys_by_xid[sentiment.row_xid(row)].append(sentiment.review_key(row.get('xid', ''), review))
+
+    changed = manifest.changed_xids(keys_by_xid)
+    logging.info(f"{len(changed)}/{len(keys_by_xid)} xids changed since the last run")
+    if not changed:
+        return timings
+
+    # Keep earlier sentiment results for reviews that are still in the input
+    remaining = Counter(key for xid in changed for key in keys_by_xid.get(xid, []))
+    completed = Counter()
+    classified, ignored = [], []
+    for rows, previous in ((classified, _read_rows(reviews_file)), (ignored, _read_rows(ignore_file))):
+        for row in previous:
+            if row['xid'] not in changed:
+                rows.append(row)
+                continue
+            key = sentiment.review_key(row['xid'], row['Review'])
+            if remaining[key] > 0:
+                remaining[key] -= 1
+                completed[key] += 1
+                rows.append(row)
+
+    changed_rows = ((index, row) for index, row in sentiment.iter_input_rows(input_file)
+                    if sentiment.row_xid(row) in changed)
+    dedup = new_dedup_index()
+    for output_data, ignore_data in sentiment.classify_rows(changed_rows, max_workers=sentiment_workers,
+                                                            batch_size=sentiment_batch_size,
+                                                            completed=completed, dedup=dedup):
+        classified.extend(output_data)
+        ignored.extend(ignore_data)
+    timings['sentiment'] = time.time() - start
+
+    _save_rows(classified, reviews_file)
+    _save_rows(ignored, ignore_file)
+    write_spam_report(dedup, artifact_path('suspected_spam', artifact_format))
+
+    # Phrases for unchanged reviews of affected xids come back from the LLM cache
+    start = time.time()
+    phrase_rows = [row for row in _read_rows(phrases_file) if row['xid'] not in changed]
+    phrase_rows.extend(phrases_extraction.extract_phrase_rows(
+        (row for row in classified if row['xid'] in changed), max_workers=phrase_workers
+    ))
+    timings['phrases'] = time.time() - start
+    _save_rows(phrase_rows, phrases_file, columns=phrases_extraction.PHRASE_FIELDNAMES)
+
+    start = time.time()
+    changed_phrases = (row for row in phrase_rows if row['xid'] in changed)
+    if dedup_phrases:
+        changed_phrases = phrase_dedup.dedup_phrase_rows(changed_phrases)
+    changed_sets = set_making.make_sets(changed_phrases, presorted=dedup_phrases)
+    set_rows = [row for row in _read_rows(sets_file) if row['xid'] not in changed] + changed_sets
+    timings['sets'] = time.time() - start
+    _save_rows(set_rows, sets_file, columns=set_making.output_headers())
+
+    # Reuse generated reviews for sets whose content did not change
+    start = time.time()
+    previous_structured = _read_rows(structured_file)
+    previous_reviews = {row['xid']: row for row in previous_structured}
+    reuse_reviews = {}
+    set_hashes_by_xid = {}
+    for row in changed_sets:
+        xid = row['xid']
+        set_hashes = {
+            number: PipelineManifest.set_hash(row[f'Set {number}'], row[f'How Long do you stay here {number}'])
+            for number in range(1, set_making.NUM_SETS + 1)
+        }
+        set_hashes_by_xid[xid] = set_hashes
+        unchanged = set(set_hashes) - manifest.changed_sets(xid, set_hashes)
+        if xid in previous_reviews:
+            # Failed or unparseable reviews are generated again rather than carried over
+            reviews = {number: previous_reviews[xid].get(f'Review {number}') for number in unchanged}
+            reuse_reviews[xid] = {number: review for number, review in reviews.items()
+                                  if isinstance(review, str) and review.strip()
+                                  and review_generation.review_succeeded(review)}
+
+    structured_columns = ['xid', 'Project name'] + [f'Review {i}' for i in range(1, set_making.NUM_SETS + 1)]
+    _save_rows([row for row in previous_structured if row['xid'] not in changed], structured_file,
+              columns=structured_columns)
+
+    if changed_sets:
+        gen, dispatcher = _generation_backend(concurrent_generation, workers_per_key)
+        generated = review_generation.generate_reviews(pd.DataFrame(changed_sets), structured_file, gen=gen,
+                                                       dispatcher=dispatcher, reuse_reviews=reuse_reviews,
+                                                       keep_existing=True)
+        if generated is None:
+            raise RuntimeError("Review generation could not start")
+    timings['generation'] = time.time() - start
+
+    start = time.time()
+    _, review_count, _ = clean.flatten_reviews_file(structured_file, output_file)
+    timings['clean'] = time.time() - start
+    logging.info(f"Saved {review_count} processed reviews to {output_file}")
+
+    # Only sets whose review was generated count as done; an xid with a
+    # failed set stays changed so the next run regenerates just those sets
+    structured_by_xid = {row['xid']: row for row in _read_rows(structured_file) if row['xid'] in changed}
+    for xid in changed:
+        if xid not in keys_by_xid:
+            manifest.forget(xid)
+            continue
+        set_hashes = set_hashes_by_xid.get(xid, {})
+        structured = structured_by_xid.get(xid)
+        done = {number: digest for number, digest in set_hashes.items()
+                if structured is not None and review_generation.review_succeeded(structured.get(f'Review {number}'))}
+        manifest.record_sets(xid, done)
+        if len(done) == len(set_hashes):
+            manifest.record_reviews(xid, keys_by_xid[xid])
+        else:
+            manifest.forget_reviews(xid)
+    manifest.save()
+
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the full review pipeline in a single process")
+    parser.add_argument('--input', default='input.csv', help="Raw reviews CSV with a 'Review' column")
+    parser.add_argument('--format', choices=sorted(ARTIFACT_FORMATS), default=None,
+                        help="Artifact format for every stage output (default: ARTIFACT_FORMAT or csv)")
+    parser.add_argument('--output', help="Final flattened reviews (default: processed_reviews in --format)")
+    parser.add_argument('--ignore-output', help="Where ignored reviews are written (default: ignore in --format)")
+    parser.add_argument('--structured-output',
+                        help="Generation checkpoint with one JSON review per set (default: structured_reviews)")
+    parser.add_argument('--sentiment-workers', type=int, default=int(os.getenv('SENTIMENT_CONCURRENCY', '1')))
+    parser.add_argument('--sentiment-batch-size', type=int, default=int(os.getenv('SENTIMENT_BATCH_SIZE', '1')))
+    parser.add_argument('--phrase-workers', type=int,
+                        default=int(os.getenv('PHRASES_WORKERS', phrases_extraction.DEFAULT_WORKERS)))
+    parser.add_argument('--keep-intermediates', action='store_true',
+                        help="Also write reviews.csv, phrases.csv and output_sets.csv")
+    parser.add_argument('--no-phrase-dedup', dest='dedup_phrases', action='store_false',
+                        help="Build sets from every extracted phrase instead of one per near-duplicate cluster")
+    parser.add_argument('--concurrent-generation', action='store_true',
+                        default=env_flag('GEMINI_CONCURRENT'),
+                        help="Generate reviews across every Gemini API key at once (GEMINI_CONCURRENT)")
+    parser.add_argument('--workers-per-key', type=int, default=int(os.getenv('GEMINI_WORKERS_PER_KEY', '2')),
+                        help="Concurrent generation requests per API key with --concurrent-generation")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only reprocess xids whose reviews changed since the last incremental run")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_PATH, help="State file used by --incremental")
+    parser.add_argument('--profile', metavar='PATH', help="Run under cProfile and dump stats to PATH")
+    args = parser.parse_args()
+
+    sentiment.configure_logging()
+
+    fmt = args.format or default_format()
+    args.output = args.output or artifact_path('processed_reviews', fmt)
+    args.ignore_output = args.ignore_output or artifact_path('ignore', fmt)
+    args.structured_output = args.structured_output or artifact_path('structured_reviews', fmt)
+
+    if args.incremental:
+        run = lambda: run_incremental(
+            args.input, args.output, args.ignore_output, args.structured_output, args.manifest,
+            sentiment_workers=args.sentiment_workers, sentiment_batch_size=args.sentiment_batch_size,
+            phrase_workers=args.phrase_workers, artifact_format=fmt, dedup_phrases=args.dedup_phrases,
+            concurrent_generation=args.concurrent_generation, workers_per_key=args.workers_per_key
+        )
+    else:
+        run = lambda: run_pipeline(
+            args.input, args.output, args.ignore_output, args.structured_output,
+            sentiment_workers=args.sentiment_workers, sentiment_batch_size=args.sentiment_batch_size,
+            phrase_workers=args.phrase_workers, keep_intermediates=args.keep_intermediates,
+            artifact_format=fmt, dedup_phrases=args.dedup_phrases,
+            concurrent_generation=args.concurrent_generation, workers_per_key=args.workers_per_key
+        )
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        timings = profiler.runcall(run)
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    else:
+        timings = run()
+
+    metrics = get_metrics()
+    for stage, seconds in timings.items():
+        metrics.record_stage(stage, seconds)
+        logging.info(f"{stage}: {seconds:.2f} seconds")
+    metrics.log_summary()
+    metrics.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import env_flag
+from fileutil import atomic_path
+
+DEFAULT_MODEL_PATH = 'prefilter_model.npz'
+
+# Every reason starts with this, so pre-filtered rows can be told apart in ignore.csv
+REASON_PREFIX = 'Pre-filter: '
+
+MIN_WORDS = 4
+# Character entropy (bits) below which a review of MIN_ENTROPY_LENGTH+ characters is gibberish
+MIN_ENTROPY = 3.0
+MIN_ENTROPY_LENGTH = 20
+MIN_UNIQUE_WORD_RATIO = 0.3
+MIN_LETTER_RATIO = 0.5
+# Share of letters that must be Latin; the pipeline only handles English reviews
+MIN_LATIN_RATIO = 0.5
+# The classifier only routes a review when it is at least this sure it is an ignore
+DEFAULT_THRESHOLD = 0.99
+
+HASH_BUCKETS = 1 << 18
+
+BUILDER_PATTERN = re.compile(
+    r"\b(?:builders?|developers?|sales(?:man|men)?|brokers?|bookings?|pric(?:e|es|ed|ing)|costs?|emis?|loans?|"
+    r"possession|delay(?:s|ed)?|handover|refunds?|rera|payments?|brochures?|launch(?:es|ed)?)\b", re.IGNORECASE
+)
+# Builder/pricing reviews are only routed when they are short and those
+# terms make up a good share of the words; longer reviews that mention the
+# builder in passing still go to the API
+BUILDER_MAX_WORDS = 20
+BUILDER_MIN_SHARE = 0.25
+PROPERTY_TERMS = [
+    'flat', 'apartment', 'room', 'kitchen', 'balcony', 'bathroom', 'tower', 'lift', 'elevator', 'parking', 'gym',
+    'pool', 'club', 'garden', 'park', 'green', 'security', 'guard', 'maintenance', 'water', 'power', 'backup',
+    'ventilation', 'light', 'noise', 'traffic', 'metro', 'road', 'school', 'hospital', 'market', 'location',
+    'connectivity', 'construction', 'quality', 'wall', 'seepage', 'leak', 'crack', 'plumbing', 'amenit',
+    'society', 'neighbo', 'clean', 'layout', 'space'
+]
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+def _char_entropy(text: str) -> float:
+    counts = Counter(text.replace(' ', ''))
+    total = sum(counts.values())
+    return -sum(count / total * math.log2(count / total) for count in counts.values()) if total else 0.0
+
+def _hashed_features(text: str) -> np.ndarray:
+    """Hashed word unigrams and bigrams of a review."""
+    words = _WORD_PATTERN.findall(text.lower())
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    return np.fromiter((zlib.crc32(token.encode('utf-8')) % HASH_BUCKETS for token in tokens),
+                       dtype=np.int64, count=len(tokens))
+
+class IgnoreClassifier:
+    """
+    Multinomial naive Bayes over hashed unigrams and bigrams, trained on the
+    reviews the LLM kept (reviews.csv) and ignored (ignore.csv). Stored as a
+    single weight vector of per-bucket log-likelihood ratios plus a bias.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float):
+        self.weights = weights
+        self.bias = bias
+
+    @classmethod
+    def train(cls, kept: Iterable[str], ignored: Iterable[str], alpha: float = 1.0) -> 'IgnoreClassifier':
+        counts = np.full((2, HASH_BUCKETS), alpha)
+        documents = [0, 0]
+        for label, texts in ((0, kept), (1, ignored)):
+            for text in texts:
+                np.add.at(counts[label], _hashed_features(text), 1)
+                documents[label] += 1
+
+        log_probs = np.log(counts / counts.sum(axis=1, keepdims=True))
+        bias = math.log((documents[1] + 1) / (documents[0] + 1))
+        return cls((log_probs[1] - log_probs[0]).astype(np.float32), bias)
+
+    def probability(self, text: str) -> float:
+        """Probability that the LLM would ignore this review."""
+        logit = self.bias + float(self.weights[_hashed_features(text)].sum())
+        return 1.0 / (1.0 + math.exp(-max(min(logit, 50.0), -50.0)))
+
+    def save(self, path: str) -> None:
+        # numpy appends .npz to any other suffix
+        with atomic_path(path, suffix='.tmp.npz') as tmp_path:
+            np.savez_compressed(tmp_path, weights=self.weights, bias=np.array([self.bias]))
+
+    @classmethod
+    def load(cls, path: str) -> 'IgnoreClassifier':
+        with np.load(path) as data:
+            return cls(data['weights'], float(data['bias'][0]))
+
+class ReviewPrefilter:
+    """
+    Cheap local checks that catch reviews the sentiment model would ignore
+    anyway: too short, gibberish or repetitive, not English, only about the
+    builder/pricing/delays, or (with a trained IgnoreClassifier) confidently
+    predicted as ignore. check() returns the reason, or None to send the
+    review to the API.
+    """
+
+    def __init__(self, classifier: Optional[IgnoreClassifier] = None, threshold: float = DEFAULT_THRESHOLD,
+                 min_words: int = MIN_WORDS):
+        self.classifier = classifier
+        self.threshold = threshold
+        self.min_words = min_words
+        self.routed = Counter()
+        self._lock = threading.Lock()
+
+    def _reason(self, review: str) -> Optional[str]:
+        text = review.strip()
+        if not text or text.lower() == 'nan':
+            return "Empty review"
+
+        non_space = [ch for ch in text if not ch.isspace()]
+        letters = [ch for ch in non_space if ch.isalpha()]
+        if len(letters) < MIN_LETTER_RATIO * len(non_space):
+            return "Mostly symbols or numbers"
+        if sum(ch.isascii() for ch in letters) < MIN_LATIN_RATIO * len(letters):
+            return "Not written in English"
+
+        lower = text.lower()
+        words = _WORD_PATTERN.findall(lower)
+        if len(words) < self.min_words:
+            return "Too short to judge the property"
+        if len(lower) >= MIN_ENTROPY_LENGTH and _char_entropy(lower) < MIN_ENTROPY:
+            return "Gibberish text"
+        if len(words) >= 10 and len(set(words)) < MIN_UNIQUE_WORD_RATIO * len(words):
+            return "Repetitive text"
+        if (len(words) <= BUILDER_MAX_WORDS
+                and len(BUILDER_PATTERN.findall(lower)) >= BUILDER_MIN_SHARE * len(words)
+                and not any(term in lower for term in PROPERTY_TERMS)):
+            return "Only about the builder, pricing or delays"
+
+        if self.classifier is not None and self.classifier.probability(text) >= self.threshold:
+            return "Predicted ignore by the local classifier"
+        return None
+
+    def check(self, review: str) -> Optional[str]:
+        reason = self._reason(review)
+        if reason is None:
+            return None
+        with self._lock:
+            self.routed[reason] += 1
+        return REASON_PREFIX + reason
+
+_shared_prefilter = None
+_shared_prefilter_lock = threading.Lock()
+
+def get_prefilter() -> Optional[ReviewPrefilter]:
+    """
+    Return the process-wide pre-filter, or None when PREFILTER_DISABLED is
+    set. The classifier from PREFILTER_MODEL (prefilter_model.npz) is used
+    if that file exists; PREFILTER_THRESHOLD and PREFILTER_MIN_WORDS tune it.
+    """
+    global _shared_prefilter
+    if env_flag('PREFILTER_DISABLED'):
+        return None
+
+    with _shared_prefilter_lock:
+        if _shared_prefilter is None:
+            model_path = os.getenv('PREFILTER_MODEL', DEFAULT_MODEL_PATH)
+            classifier = None
+            if os.path.exists(model_path):
+                classifier = IgnoreClassifier.load(model_path)
+                logging.info(f"Loaded pre-filter classifier from {model_path}")
+            _shared_prefilter = ReviewPrefilter(
+                classifier=classifier,
+                threshold=float(os.getenv('PREFILTER_THRESHOLD', DEFAULT_THRESHOLD)),
+                min_words=int(os.getenv('PREFILTER_MIN_WORDS', MIN_WORDS))
+            )
+        return _shared_prefilter
+
+def _training_reviews(path: str, skip_prefiltered: bool = False):
+    df = pd.read_csv(path, dtype=str)
+    if skip_prefiltered and 'Ignore_Reason' in df.columns:
+        # Rows the pre-filter routed never reached the LLM, so they are not labels
+        df = df[~df['Ignore_Reason'].fillna('').str.startswith(REASON_PREFIX)]
+    return df['Review'].dropna().astype(str).tolist()
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the pre-filter classifier from earlier sentiment results")
+    parser.add_argument('--reviews', default='reviews.csv', help="Reviews the LLM classified positive/negative")
+    parser.add_argument('--ignore', default='ignore.csv', help="Reviews the LLM ignored")
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--holdout', type=float, default=0.2, help="Share of rows held out for evaluation")
+    args = parser.parse_args()
+
+    kept = _training_reviews(args.reviews)
+    ignored = _training_reviews(args.ignore, skip_prefiltered=True)
+    if not kept or not ignored:
+        parser.error("Both files need reviews to train on")
+
+    rng = np.random.RandomState(0)
+    def split(texts):
+        holdout = rng.rand(len(texts)) < args.holdout
+        return [t for t, h in zip(texts, holdout) if not h], [t for t, h in zip(texts, holdout) if h]
+
+    kept_train, kept_test = split(kept)
+    ignored_train, ignored_test = split(ignored)
+    classifier = IgnoreClassifier.train(kept_train, ignored_train)
+
+    routed_ignored = sum(classifier.probability(t) >= args.threshold for t in ignored_test)
+    routed_kept = sum(classifier.probability(t) >= args.threshold for t in kept_test)
+    if routed_ignored + routed_kept:
+        print(f"Holdout at threshold {args.threshold}: {routed_ignored}/{len(ignored_test)} ignores routed, "
+              f"precision {routed_ignored / (routed_ignored + routed_kept):.3f} "
+              f"({routed_kept}/{len(kept_test)} kept reviews would be lost)")
+    else:
+        print(f"Holdout at threshold {args.threshold}: no reviews would be routed")
+
+    IgnoreClassifier.train(kept, ignored).save(args.model)
+    print(f"Trained on {len(kept)} kept and {len(ignored)} ignored reviews, saved to {args.model}")
+
+if __name__ == "__main__":
+    main()
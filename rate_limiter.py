@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from fileutil import atomic_open
+
+DEFAULT_QUOTA_STATE_PATH = 'gemini_quota_state.json'
+
+# Gemini API daily quotas reset at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+class DailyLimitReached(Exception):
+    pass
+
+def quota_day():
+    return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+def key_id(api_key):
+    """Short stable identifier for an API key, so raw keys never hit the disk."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens and refills
+    continuously at capacity/period per second. The balance may go negative
+    when actual usage is recorded after the fact; later requests then wait
+    for it to refill.
+    """
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount):
+        self._refill()
+        # A single request bigger than the bucket only needs a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+    def fraction_available(self):
+        self._refill()
+        return max(0.0, self.tokens) / self.capacity
+
+class QuotaStore:
+    """
+    JSON file holding each key's daily request and token counters, so a
+    restart does not reset the daily budget. Shared by all limiters of a process.
+    """
+
+    def __init__(self, path=DEFAULT_QUOTA_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"Warning: could not read quota state {path}: {e}. Starting from zero.")
+
+    def usage(self, limiter_id):
+        with self._lock:
+            entry = self.state.get(limiter_id)
+            if not entry or entry.get('day') != quota_day():
+                return 0, 0
+            return entry.get('requests', 0), entry.get('tokens', 0)
+
+    def add(self, limiter_id, requests=0, tokens=0):
+        with self._lock:
+            day = quota_day()
+            entry = self.state.get(limiter_id)
+            if not entry or entry.get('day') != day:
+                entry = {'day': day, 'requests': 0, 'tokens': 0}
+                self.state[limiter_id] = entry
+            entry['requests'] += requests
+            entry['tokens'] += tokens
+
+            # Saved on every request, so the rename is not fsynced
+            with atomic_open(self.path, fsync=False, encoding='utf-8') as f:
+                json.dump(self.state, f)
+
+class RateLimiter:
+    """
+    Rate limiter for one API key: token buckets for requests per minute and
+    (optionally) tokens per minute, plus a requests-per-day budget persisted
+    in a QuotaStore. wait_time()/try_acquire() never block, acquire() awaits
+    without blocking the event loop, and check_limit() keeps the old blocking
+    behaviour for synchronous callers.
+    """
+
+    def __init__(self, max_requests_per_minute=10, max_requests_per_day=200, max_tokens_per_minute=None,
+                 limiter_id='default', store=None):
+        self.max_rpm = max_requests_per_minute
+        self.max_daily = max_requests_per_day
+        self.max_tpm = max_tokens_per_minute
+        self.limiter_id = limiter_id
+        self.store = store if store is not None else QuotaStore()
+
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(max_requests_per_minute)
+        self._tokens = TokenBucket(max_tokens_per_minute) if max_tokens_per_minute else None
+
+    @property
+    def daily_count(self):
+        return self.store.usage(self.limiter_id)[0]
+
+    def _wait_time(self, tokens):
+        if self.daily_count >= self.max_daily:
+            raise DailyLimitReached(f"Daily request limit reached for {self.limiter_id}")
+
+        wait = self._requests.time_until(1)
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.time_until(tokens))
+        return wait
+
+    def wait_time(self, tokens=0):
+        """
+        Seconds until a request of `tokens` input tokens is allowed. Raises
+        DailyLimitReached once the daily budget is spent.
+        """
+        with self._lock:
+            return self._wait_time(tokens)
+
+    def record_request(self, tokens=0):
+        with self._lock:
+            self._record(tokens)
+
+    def _record(self, tokens):
+        self._requests.consume(1)
+        if self._tokens is not None:
+            self._tokens.consume(tokens)
+        self.store.add(self.limiter_id, requests=1, tokens=tokens)
+
+    def record_tokens(self, tokens):
+        """Charge tokens learned after the call (e.g. output tokens)."""
+        with self._lock:
+            if self._tokens is not None:
+                self._tokens.consume(tokens)
+            self.store.add(self.limiter_id, tokens=tokens)
+
+    def try_acquire(self, tokens=0):
+        """
+        Record a request if it is allowed right now and return 0, otherwise
+        return the number of seconds to wait.
+        """
+        with self._lock:
+            wait = self._wait_time(tokens)
+            if wait == 0:
+                self._record(tokens)
+            return wait
+
+    async def acquire(self, tokens=0):
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, tokens=0):
+        """acquire() for synchronous callers: sleeps until the request is allowed, then records it."""
+        while (wait := self.try_acquire(tokens)) > 0:
+            print(f"Rate limit reached. Waiting {wait:.2f} seconds...")
+            time.sleep(wait)
+
+    def check_limit(self, tokens=0):
+        time_to_wait = self.wait_time(tokens)
+        if time_to_wait > 0:
+            print(f"Rate limit reached. Waiting {time_to_wait:.2f} seconds...")
+            time.sleep(time_to_wait)
+
+        return True
+
+    def headroom(self):
+        """
+        Fraction (0-1) of the tightest remaining budget: per-minute requests,
+        per-minute tokens or the daily request quota.
+        """
+        with self._lock:
+            fractions = [
+                self._requests.fraction_available(),
+                max(0, self.max_daily - self.daily_count) / self.max_daily
+            ]
+            if self._tokens is not None:
+                fractions.append(self._tokens.fraction_available())
+            return min(fractions)
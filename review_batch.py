@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+from artifacts import artifact_path, find_artifact, read_artifact
+from llm_cache import get_cache
+from rate_limiter import DailyLimitReached, RateLimiter, key_id
+from review_generation import (
+    GENERATION_CONFIG,
+    GeminiKeyClient,
+    GeminiReviewGenerator,
+    StructuredReviewWriter,
+    estimate_tokens,
+    failed_review_json,
+    rate_limits_from_env,
+    sets_to_generate,
+)
+
+DEFAULT_JOBS_PATH = 'generation_batch.jsonl'
+DEFAULT_RESULTS_PATH = 'generation_batch_results.jsonl'
+LOCAL_JOBS_DIR = 'batch_jobs'
+
+TERMINAL_STATES = {'JOB_STATE_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'}
+
+def request_key(xid, set_number):
+    return f"{xid}|{set_number}"
+
+def parse_request_key(key):
+    xid, set_number = key.rsplit('|', 1)
+    return xid, int(set_number)
+
+def _set_columns(df):
+    return [col for col in df.columns if col.startswith("Set ")]
+
+def write_batch_jobs(df, gen, jobs_path=DEFAULT_JOBS_PATH):
+    """
+    Serialize every (xid, set) generation request of an output_sets
+    DataFrame into a Gemini batch JSONL file. Requests already answered in
+    the LLM cache are left out; ingest picks them up from the cache.
+    """
+    written = 0
+    cached = 0
+    set_count = len(_set_columns(df))
+    cache = get_cache()
+
+    with open(jobs_path, 'w', encoding='utf-8') as f:
+        for idx, (_, row) in enumerate(df.iterrows()):
+            xid = row.get("xid", f"id_{idx}")
+            pname = row.get("Project name", f"Project_{idx}")
+
+            for s, project_set in sets_to_generate(row, pname, xid, set_count, {}):
+                system_prompt, message_content, cache_key = gen.prepare_request(project_set, pname, s)
+                if cache.get(cache_key) is not None:
+                    cached += 1
+                    continue
+
+                f.write(json.dumps({
+                    'key': request_key(xid, s),
+                    'request': {
+                        'system_instruction': {'parts': [{'text': system_prompt}]},
+                        'contents': [{'role': 'user', 'parts': [{'text': message_content}]}],
+                        'generation_config': GENERATION_CONFIG
+                    }
+                }, ensure_ascii=False) + '\n')
+                written += 1
+
+    print(f"Wrote {written} batch requests to {jobs_path} ({cached} already cached)")
+    return written
+
+def _response_text(response):
+    candidates = response.get('candidates') or []
+    if not candidates:
+        return None
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return ''.join(part.get('text', '') for part in parts) or None
+
+def read_batch_results(results_path):
+    """Map each request key to its response text (None for failed requests)."""
+    results = {}
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'error' in record or 'response' not in record:
+                print(f"Batch request {record.get('key')} failed: {record.get('error')}")
+                results[record.get('key')] = None
+            else:
+                results[record['key']] = _response_text(record['response'])
+    return results
+
+def ingest_batch_results(df, results_path, gen, output_file="structured_reviews.csv"):
+    """
+    Turn a batch result file back into structured_reviews.csv rows. Requests
+    that were skipped as cache hits are read from the cache; anything missing
+    or unparseable gets the usual failure JSON.
+    """
+    results = read_batch_results(results_path)
+    set_count = len(_set_columns(df))
+    writer = StructuredReviewWriter(output_file, set_count)
+    cache = get_cache()
+
+    output_rows = []
+    for idx, (_, row) in enumerate(df.iterrows()):
+        xid = row.get("xid", f"id_{idx}")
+        pname = row.get("Project name", f"Project_{idx}")
+        pdata = {"xid": xid, "Project name": pname}
+
+        for s in range(1, set_count + 1):
+            pdata[f"Review {s}"] = ""
+
+        for s, project_set in sets_to_generate(row, pname, xid, set_count, {}):
+            _, _, cache_key = gen.prepare_request(project_set, pname, s)
+            review_json = results.get(request_key(xid, s))
+            if review_json is None:
+                review_json = cache.get(cache_key)
+
+            review = gen.parse_review_response(review_json, project_set) if review_json else None
+            if review is None:
+                pdata[f"Review {s}"] = failed_review_json("No batch result")
+                continue
+
+            cache.set(cache_key, review_json)
+            pdata[f"Review {s}"] = review
+
+        writer.write(pdata)
+        output_rows.append(pdata)
+
+    writer.close()
+
+    print(f"Ingested {len(results)} batch results for {len(output_rows)} projects into {output_file}")
+    return output_rows
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Gemini batch service. submit() runs every
+    request of the job file through `client` right away and stores a result
+    file in the same format the real service produces. Each request is
+    first acquired from rate_limiter; once its daily quota is spent the
+    remaining requests are recorded as errors without calling the client.
+    """
+
+    def __init__(self, client, rate_limiter=None, jobs_dir=LOCAL_JOBS_DIR):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.jobs_dir = jobs_dir
+
+    def _result_path(self, job_name):
+        return os.path.join(self.jobs_dir, f"{job_name}.results.jsonl")
+
+    def submit(self, jobs_path):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        job_name = f"local-{int(time.time() * 1000)}"
+        stopped = None
+
+        with open(jobs_path, 'r', encoding='utf-8') as src, \
+                open(self._result_path(job_name), 'w', encoding='utf-8') as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                job = json.loads(line)
+                request = job['request']
+                system_prompt = ''.join(p['text'] for p in request['system_instruction']['parts'])
+                message = ''.join(p['text'] for part in request['contents'] for p in part['parts'])
+                try:
+                    if stopped is not None:
+                        raise stopped
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.acquire_blocking(estimate_tokens(system_prompt, message))
+                    text = self.client.generate(system_prompt, message)
+                    record = {'key': job['key'],
+                              'response': {'candidates': [{'content': {'parts': [{'text': text}]}}]}}
+                except DailyLimitReached as e:
+                    stopped = e
+                    record = {'key': job['key'], 'error': {'message': str(e)}}
+                except Exception as e:
+                    record = {'key': job['key'], 'error': {'message': str(e)}}
+                dst.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        return job_name
+
+    def state(self, job_name):
+        return 'JOB_STATE_SUCCEEDED' if os.path.exists(self._result_path(job_name)) else 'JOB_STATE_FAILED'
+
+    def download(self, job_name, results_path):
+        shutil.copyfile(self._result_path(job_name), results_path)
+
+class GeminiBatchBackend:
+    """
+    Gemini Batch API backend. The batch endpoints only exist in the newer
+    google-genai SDK, so it is imported lazily and only needed for this mode.
+    """
+
+    def __init__(self, api_key, model_name):
+        try:
+            from google import genai as google_genai
+            from google.genai import types as genai_types
+        except ImportError as e:
+            raise ImportError("The Gemini batch backend requires the google-genai package") from e
+
+        self.client = google_genai.Client(api_key=api_key)
+        self.types = genai_types
+        self.model_name = model_name
+
+    def submit(self, jobs_path):
+        uploaded = self.client.files.upload(
+            file=jobs_path,
+            config=self.types.UploadFileConfig(display_name=os.path.basename(jobs_path), mime_type='jsonl')
+        )
+        job = self.client.batches.create(
+            model=f"models/{self.model_name}",
+            src=uploaded.name,
+            config={'display_name': f"review-generation-{int(time.time())}"}
+        )
+        return job.name
+
+    def state(self, job_name):
+        return self.client.batches.get(name=job_name).state.name
+
+    def download(self, job_name, results_path):
+        job = self.client.batches.get(name=job_name)
+        if job.state.name != 'JOB_STATE_SUCCEEDED':
+            raise RuntimeError(f"Batch job {job_name} is {job.state.name}")
+        with open(results_path, 'wb') as f:
+            f.write(self.client.files.download(file=job.dest.file_name))
+
+def make_backend(name, gen, client_factory=GeminiKeyClient):
+    """
+    Batch backend for the first API key. The local backend makes live calls,
+    so it shares that key's persisted RateLimiter and daily quota with
+    GeminiDispatcher; client_factory lets tests swap in a fake client.
+    """
+    api_key = gen.api_keys[0]
+    if name == 'local':
+        limiter = RateLimiter(limiter_id=key_id(api_key), store=gen.quota_store, **rate_limits_from_env())
+        return LocalBatchBackend(client_factory(api_key, gen.model_name, rate_limiter=limiter), rate_limiter=limiter)
+    return GeminiBatchBackend(api_key, gen.model_name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate reviews through a batch job instead of live calls")
+    parser.add_argument('--backend', choices=['gemini', 'local'], default='gemini')
+    parser.add_argument('--input', default=None, help="Sets artifact (default: output_sets in ARTIFACT_FORMAT)")
+    parser.add_argument('--jobs', default=DEFAULT_JOBS_PATH, help="Batch request JSONL file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('prepare', help="Write the batch request file from output_sets.csv")
+    commands.add_parser('submit', help="Submit the batch request file and print the job name")
+    status = commands.add_parser('status', help="Print the state of a submitted job")
+    status.add_argument('job')
+    ingest = commands.add_parser('ingest', help="Download results and append them to structured_reviews.csv")
+    ingest.add_argument('job', nargs='?', help="Job to download; omit to ingest an existing --results file")
+    ingest.add_argument('--results', default=DEFAULT_RESULTS_PATH)
+    ingest.add_argument('--output', default=None)
+    args = parser.parse_args()
+    input_file = args.input or find_artifact('output_sets')
+
+    gen = GeminiReviewGenerator()
+
+    if args.command == 'prepare':
+        write_batch_jobs(read_artifact(input_file), gen, args.jobs)
+    elif args.command == 'submit':
+        print(f"Submitted batch job: {make_backend(args.backend, gen).submit(args.jobs)}")
+    elif args.command == 'status':
+        print(make_backend(args.backend, gen).state(args.job))
+    elif args.command == 'ingest':
+        if args.job:
+            make_backend(args.backend, gen).download(args.job, args.results)
+        ingest_batch_results(read_artifact(input_file), args.results, gen,
+                             args.output or artifact_path('structured_reviews'))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from artifacts import write_artifact
+from config import env_flag
+from phrase_dedup import STOPWORDS, minhash_signatures, shingles
+
+# Estimated Jaccard similarity (share of equal MinHash values) at which two reviews are near-duplicates
+DEFAULT_THRESHOLD = 0.8
+# Reviews are longer than phrases, so longer character shingles keep unrelated ones apart
+REVIEW_SHINGLE_SIZE = 5
+# The 64 MinHash values are split into BANDS bands; a shared band makes two reviews candidates
+BANDS = 8
+
+SPAM_REPORT_COLUMNS = ['Cluster', 'Reviews', 'xid count', 'xids', 'Sample Review']
+SAMPLE_CHARS = 200
+
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def normalize_review(review) -> str:
+    """Casefolded words of a review in any script, without STOPWORDS."""
+    return ' '.join(word for word in _WORD_PATTERN.findall(str(review).casefold()) if word not in STOPWORDS)
+
+class ReviewDedupIndex:
+    """
+    Streaming index of review clusters for one classification run. Each new
+    review joins the cluster of an earlier review with the same normalized
+    text, or of one whose MinHash signature (looked up through LSH bands)
+    agrees on at least `threshold` of its values; otherwise it starts a new
+    cluster and becomes its representative. `labels` holds the sentiment of
+    every classified cluster, so duplicates reuse it instead of an API call.
+    A review with no words left after normalization always gets a cluster
+    of its own.
+
+    The index lives for one run and grows with the number of distinct
+    clusters: about 1.6 KB each (a 256-byte signature row, the first xid,
+    the first SAMPLE_CHARS characters of the representative and one exact
+    plus BANDS band entries with integer keys), so roughly 160 MB per 100k
+    distinct reviews; clusters spanning several reviews also keep their
+    xids. Set REVIEW_DEDUP_DISABLED where that is too much.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.labels: Dict[int, str] = {}
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self._exact: Dict[int, int] = {}
+        self._bands: List[Dict[int, int]] = [{} for _ in range(BANDS)]
+        # One signature row per cluster, grown by doubling
+        self._signatures = np.empty((0, 0), dtype=np.uint32)
+        self._first_xid: List[str] = []
+        self._first_sample: List[str] = []
+        # Only clusters with more than one review keep member details
+        self._clusters: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._first_xid)
+
+    def _add_signature(self, signature: np.ndarray) -> None:
+        count = len(self._first_xid)
+        if count == len(self._signatures):
+            grown = np.empty((max(1024, 2 * count), len(signature)), dtype=np.uint32)
+            if count:
+                grown[:count] = self._signatures[:count]
+            self._signatures = grown
+        self._signatures[count] = signature
+
+    def _join(self, cluster: int, xid: str) -> int:
+        info = self._clusters.get(cluster)
+        if info is None:
+            info = self._clusters[cluster] = {'reviews': 1, 'xids': {self._first_xid[cluster]},
+                                              'sample': self._first_sample[cluster]}
+        info['reviews'] += 1
+        info['xids'].add(xid)
+        return cluster
+
+    def _new_cluster(self, xid: str, review: str, signature: np.ndarray) -> int:
+        cluster = len(self._first_xid)
+        self._add_signature(signature)
+        self._first_xid.append(xid)
+        self._first_sample.append(str(review)[:SAMPLE_CHARS])
+        return cluster
+
+    def assign(self, reviews: Sequence[Tuple[str, str]]) -> List[int]:
+        """Cluster id for each (xid, review), adding new clusters to the index in order."""
+        if not reviews:
+            return []
+        normalized = [normalize_review(review) for _, review in reviews]
+        signatures = minhash_signatures([shingles(text, REVIEW_SHINGLE_SIZE) for text in normalized])
+        signatures = signatures.astype(np.uint32)
+        bands = signatures.reshape(len(reviews), BANDS, -1)
+
+        clusters = []
+        for i, ((xid, review), text) in enumerate(zip(reviews, normalized)):
+            xid = str(xid)
+            if not text:
+                clusters.append(self._new_cluster(xid, review, signatures[i]))
+                continue
+
+            digest = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+            cluster = self._exact.get(digest)
+            if cluster is not None:
+                self.exact_duplicates += 1
+                clusters.append(self._join(cluster, xid))
+                continue
+
+            # Within a run hash() is stable; a colliding key is caught by the signature check
+            keys = [hash(band.tobytes()) for band in bands[i]]
+            signature = signatures[i]
+            for band, key in enumerate(keys):
+                candidate = self._bands[band].get(key)
+                if candidate is not None and np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    cluster = candidate
+                    break
+
+            if cluster is not None:
+                self.near_duplicates += 1
+                self._exact[digest] = cluster
+                clusters.append(self._join(cluster, xid))
+                continue
+
+            cluster = self._new_cluster(xid, review, signature)
+            self._exact[digest] = cluster
+            for band, key in enumerate(keys):
+                self._bands[band].setdefault(key, cluster)
+            clusters.append(cluster)
+
+        return clusters
+
+    def spam_clusters(self) -> List[Dict]:
+        """Clusters whose reviews were posted under more than one xid, largest first."""
+        rows = [
+            {'Cluster': cluster, 'Reviews': info['reviews'], 'xid count': len(info['xids']),
+             'xids': '; '.join(sorted(info['xids'])), 'Sample Review': info['sample']}
+            for cluster, info in self._clusters.items() if len(info['xids']) > 1
+        ]
+        return sorted(rows, key=lambda row: (-row['xid count'], -row['Reviews'], row['Cluster']))
+
+def new_dedup_index() -> Optional[ReviewDedupIndex]:
+    """
+    A fresh index for one run, or None when REVIEW_DEDUP_DISABLED is set.
+    REVIEW_DEDUP_THRESHOLD sets the near-duplicate similarity.
+    """
+    if env_flag('REVIEW_DEDUP_DISABLED'):
+        return None
+    return ReviewDedupIndex(float(os.getenv('REVIEW_DEDUP_THRESHOLD', DEFAULT_THRESHOLD)))
+
+def write_spam_report(index: Optional[ReviewDedupIndex], path: str) -> None:
+    """Write the clusters spanning several xids (suspected spam) to path."""
+    if index is None:
+        return
+    clusters = index.spam_clusters()
+    write_artifact(clusters, path, columns=SPAM_REPORT_COLUMNS)
+    logging.info(f"Reused labels for {index.exact_duplicates} exact and {index.near_duplicates} near-duplicate "
+                 f"reviews; {len(clusters)} cluster(s) span several xids, see {path}")
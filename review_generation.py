@@ -1,16 +1,29 @@
 
 
 import sys
-from pydantic import BaseModel
+import csv
+import re
+from collections import deque
+from typing import List
+from pydantic import BaseModel, ValidationError, field_validator
 from dotenv import load_dotenv
 import google.generativeai as genai
 from google.generativeai import types
-import os, random
+import os
 import json
 import time
+import asyncio
+import threading
 import pandas as pd
-from collections import deque
-from datetime import datetime
+from google.ai import generativelanguage as glm
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from artifacts import artifact_path, find_artifact, format_of, read_artifact, write_artifact
+from config import env_flag
+from fileutil import atomic_open
+from llm_cache import LLMCache, get_cache
+from rate_limiter import DailyLimitReached, QuotaStore, RateLimiter, key_id
+from telemetry import count_tokens, get_metrics
 
 class Review(BaseModel):
     positive_review: str
@@ -23,45 +36,160 @@ class Review(BaseModel):
     overall: str  # String like "3.8" or "N.A."
     duration_of_stay: str
 
-class RateLimiter:
-    def __init__(self, max_requests_per_minute=10, max_requests_per_day=200):
-        self.max_rpm = max_requests_per_minute
-        self.max_daily = max_requests_per_day
-        self.request_times = deque()
-        self.daily_count = 0
-        self.last_day_check = datetime.now().day
-
-    def check_limit(self):
-        now = datetime.now()
-        if now.day != self.last_day_check:
-            self.daily_count = 0
-            self.last_day_check = now.day
-        
-        if self.daily_count >= self.max_daily:
-            raise Exception("Daily request limit reached")
-        
-        # Remove old requests outside the 1-minute window
-        while self.request_times and (now - self.request_times[0]).total_seconds() > 60:
-            self.request_times.popleft()
-        
-        if len(self.request_times) >= self.max_rpm:
-            time_to_wait = 60 - (now - self.request_times[0]).total_seconds()
-            if time_to_wait > 0:
-                print(f"Rate limit reached. Waiting {time_to_wait:.2f} seconds...")
-                time.sleep(time_to_wait)
-        
-        return True
+    @field_validator('society_management', 'green_area', 'amenities', 'connectivity', 'construction', 'overall')
+    @classmethod
+    def _normalize_rating(cls, value):
+        value = value.strip()
+        if value.lower() in ["", "na", "n.a.", "not available", "not applicable"]:
+            return "N.A."
+        return value
+
+class ProjectSet(BaseModel):
+    """The phrases of one set of a project, split by polarity."""
+    project_name: str
+    set_number: int
+    positive_phrases: List[str]
+    negative_phrases: List[str]
+    neutral_phrases: List[str]
+    duration_of_stay: str
+
+DISPATCH_CHUNK_PROJECTS = 50
+
+# Projects buffered before structured_reviews.csv rows are flushed to disk
+DEFAULT_FLUSH_EVERY = 25
+
+# Rough allowance for the generated review when charging tokens-per-minute
+REVIEW_OUTPUT_TOKENS = 512
+
+# Input tokens per request (system prompt + message); phrases beyond it are dropped
+PROMPT_TOKEN_BUDGET = int(os.getenv("GEMINI_PROMPT_TOKENS", "2000"))
+
+def estimate_tokens(system_instruction, message):
+    """Tokens reserved against tokens-per-minute before a call: the prompt plus an output allowance."""
+    return count_tokens(system_instruction) + count_tokens(message) + REVIEW_OUTPUT_TOKENS
+
+def record_generation_call(api_key, seconds, system_instruction, message, response=None, error=None,
+                           rate_limiter=None):
+    """
+    Record one Gemini call in the telemetry, with the token counts from the
+    response's usage_metadata (estimated locally when it is missing). When
+    the call used more tokens than estimate_tokens() reserved, the excess is
+    charged to rate_limiter.
+    """
+    usage = getattr(response, 'usage_metadata', None)
+    input_tokens = getattr(usage, 'prompt_token_count', 0) or count_tokens(system_instruction + message)
+    output_tokens = getattr(usage, 'candidates_token_count', 0)
+    if not output_tokens and response is not None:
+        try:
+            output_tokens = count_tokens(response.text)
+        except Exception:
+            output_tokens = 0
+    get_metrics().record_call('generation', seconds, key=key_id(api_key), input_tokens=input_tokens,
+                              output_tokens=output_tokens, status='ok' if error is None else type(error).__name__)
+
+    excess = input_tokens + output_tokens - estimate_tokens(system_instruction, message)
+    if rate_limiter is not None and error is None and excess > 0:
+        rate_limiter.record_tokens(excess)
+
+def rate_limits_from_env():
+    """Per-key limits; override with GEMINI_RPM, GEMINI_RPD and GEMINI_TPM."""
+    tpm = os.getenv("GEMINI_TPM")
+    return {
+        'max_requests_per_minute': int(os.getenv("GEMINI_RPM", "10")),
+        'max_requests_per_day': int(os.getenv("GEMINI_RPD", "200")),
+        'max_tokens_per_minute': int(tpm) if tpm else None
+    }
+
+# Gemini schema for Review: every field is a required string
+REVIEW_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {field: {'type': 'STRING'} for field in Review.model_fields},
+    'required': list(Review.model_fields)
+}
+
+GENERATION_CONFIG = {
+    'temperature': 0.8,
+    'top_p': 0.7,
+    'response_mime_type': 'application/json',
+    'response_schema': REVIEW_SCHEMA
+}
+
+DEFAULT_PROMPT = "Generate a detailed review based on the provided project information."
+
+# Persona prompts in set order; with more sets than personas (SETS_COUNT) they repeat
+SET_PERSONAS = (
+    'system_instruction_review_generator_resident',
+    'system_instruction_review_generator_family',
+    'system_instruction_review_generator_female',
+    'system_instruction_review_generator_old'
+)
+
+class PromptRegistry:
+    """
+    Persona system prompts from the prompt JSON file, parsed once and
+    re-read only when the file's mtime changes. Every persona in
+    set_personas is checked on load so a missing or empty prompt is
+    reported once instead of silently producing an empty instruction.
+    """
+
+    def __init__(self, path, set_personas=None):
+        self.path = path
+        self.set_personas = tuple(SET_PERSONAS if set_personas is None else set_personas)
+        if not self.set_personas:
+            raise ValueError("PromptRegistry needs at least one set persona")
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._prompts = {}
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self._mtime != 'missing':
+                print(f"Warning: Prompt file {self.path} not found. Using default prompt.")
+                self._mtime = 'missing'
+                self._prompts = {}
+            return
+
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                prompts = json.load(file)
+        except json.JSONDecodeError:
+            print(f"Warning: Invalid JSON in {self.path}. Using default prompt.")
+            prompts = {}
+
+        if self._mtime is not None:
+            print(f"Reloaded prompts from {self.path}")
+        for persona in sorted(set(self.set_personas)):
+            if not isinstance(prompts.get(persona), str) or not prompts[persona].strip():
+                print(f"Warning: Persona '{persona}' is missing or empty in {self.path}. Using default prompt.")
+
+        self._prompts = prompts
+        self._mtime = mtime
 
-    def record_request(self):
-        now = datetime.now()
-        self.request_times.append(now)
-        self.daily_count += 1
+    def persona_for_set(self, set_number):
+        """Set 1 gets the first persona, and the personas cycle from there."""
+        return self.set_personas[(set_number - 1) % len(self.set_personas)]
+
+    def prompt(self, persona):
+        with self._lock:
+            self._load()
+            prompt = self._prompts.get(persona)
+        if not isinstance(prompt, str) or not prompt.strip():
+            return DEFAULT_PROMPT
+        return prompt
+
+    def prompt_for_set(self, set_number):
+        return self.prompt(self.persona_for_set(set_number))
 
 class GeminiReviewGenerator:
     __model_name = 'gemini-2.0-flash'  # Updated to use a more stable model
     __prompt_file_path = 'gemini_ai_prompts.json'
 
-    def __init__(self):
+    def __init__(self, session_cache_size=None, prompt_token_budget=None):
         load_dotenv()
         
         # Initialize API keys in round-robin fashion
@@ -70,9 +198,21 @@ class GeminiReviewGenerator:
             raise ValueError("No API keys found for Gemini. Please set GEMINI_API_KEY or GEMINI_API_KEY_1, GEMINI_API_KEY_2, etc. in the .env file.")
         
         self.current_key_index = 0
-        self.rate_limiter = RateLimiter()
-        # Store chats by project_name AND set_number combination
-        self.project_chats = {}
+        self.quota_store = QuotaStore()
+        # One persisted limiter per key, shared by name with GeminiDispatcher's
+        rate_limits = rate_limits_from_env()
+        self.rate_limiters = {
+            key: RateLimiter(limiter_id=key_id(key), store=self.quota_store, **rate_limits) for key in self.api_keys
+        }
+        # Generation is stateless by default. When continuity is wanted, chats are
+        # kept per project_name AND set_number in a bounded LRU.
+        if session_cache_size is None:
+            session_cache_size = int(os.getenv("GEMINI_CHAT_SESSIONS", "0"))
+        self.session_cache_size = session_cache_size
+        self.project_chats = OrderedDict()
+        self._key_clients = {}
+        self.prompts = PromptRegistry(GeminiReviewGenerator.__prompt_file_path)
+        self.prompt_token_budget = prompt_token_budget or PROMPT_TOKEN_BUDGET
         
         print(f"Initialized with {len(self.api_keys)} API key(s) for round-robin usage")
 
@@ -109,166 +249,208 @@ class GeminiReviewGenerator:
         print(f"Using API key #{self.current_key_index if self.current_key_index == 0 else len(self.api_keys)} (Round-robin)")
         return current_key
 
-    def _configure_api_with_key(self, api_key):
-        """Configure the Gemini API with a specific key"""
-        genai.configure(api_key=api_key)
+    def _acquire_next_key(self, tokens):
+        """
+        Next API key in round-robin order with a request of `tokens` reserved
+        on its limiter, waiting for its per-minute budget if needed. Keys out
+        of daily quota are skipped; DailyLimitReached once every key is.
+        """
+        for _ in range(len(self.api_keys)):
+            api_key = self._get_next_api_key()
+            try:
+                self.rate_limiters[api_key].acquire_blocking(tokens)
+                return api_key
+            except DailyLimitReached as e:
+                print(f"{e}, trying the next key")
+        raise DailyLimitReached("All API keys have reached their daily limit")
 
-    def __getPromptFromFile(self, type: str) -> str:
-        try:
-            with open(GeminiReviewGenerator.__prompt_file_path, 'r', encoding='utf-8') as file:
-                data = file.read()
-            parsed_data = json.loads(data)
-            return parsed_data.get(type, "")
-        except FileNotFoundError:
-            print(f"Warning: Prompt file {GeminiReviewGenerator.__prompt_file_path} not found. Using default prompt.")
-            return "Generate a detailed review based on the provided project information."
-        except json.JSONDecodeError:
-            print(f"Warning: Invalid JSON in {GeminiReviewGenerator.__prompt_file_path}. Using default prompt.")
-            return "Generate a detailed review based on the provided project information."
+    def _client_for_key(self, api_key):
+        client = self._key_clients.get(api_key)
+        if client is None:
+            client = GeminiKeyClient(api_key, self.__model_name, rate_limiter=self.rate_limiters[api_key])
+            self._key_clients[api_key] = client
+        return client
 
     def _get_system_instruction_for_set(self, set_number):
         """
         Get the appropriate system instruction based on set number
         """
-        # Define mapping of set numbers to system instruction keys
-        instruction_mapping = {
-            1: 'system_instruction_review_generator_resident',
-            2: 'system_instruction_review_generator_family',
-            3: 'system_instruction_review_generator_female',
-            4: 'system_instruction_review_generator_old'
-        }
-        
-        # Get the instruction key for the set number, default to resident if not found
-        instruction_key = instruction_mapping.get(set_number, 'system_instruction_review_generator_resident')
-        return self.__getPromptFromFile(instruction_key)
+        return self.prompts.prompt_for_set(set_number)
 
-    def _initialize_chat_for_project_set(self, project_name, set_number):
+    def _get_chat(self, project_name, set_number, system_prompt, api_key):
         """
-        Initialize a chat session for a specific project and set combination
+        Chat session for a project and set combination from the bounded LRU,
+        started on api_key if it is not cached yet
         """
-        # Get the next API key in round-robin fashion
-        current_api_key = self._get_next_api_key()
-        self._configure_api_with_key(current_api_key)
-        
-        # Get the appropriate system instruction for this set
-        system_prompt = self._get_system_instruction_for_set(set_number)
-        print(f"System prompt for set {set_number}: {system_prompt[:100]}...")
-        
-        # Create unique key for project-set combination
         chat_key = f"{project_name}_set_{set_number}"
-        
-        try:
-            # Create a new model instance with system instruction
-            model = genai.GenerativeModel(
-                model_name=self.__model_name,
-                system_instruction=system_prompt,
-                generation_config=genai.GenerationConfig(
-                    temperature=0.8,
-                    top_p=0.7,
-                    response_mime_type='application/json'
-                )
-            )
-            
-            # Start a chat session
-            chat = model.start_chat(history=[])
-            
-            # Send initial context message
-            initial_message = (
-                f"I will be generating a review for the project '{project_name}' (Set {set_number}). "
-                f"Please generate a review that matches the persona defined in the system instruction. "
-                f"Response must be valid JSON matching the Review schema."
-            )
-            
-            response = chat.send_message(initial_message)
-            print(f"Initial response: {response.text[:100]}...")
-            
-            self.project_chats[chat_key] = chat
-            print(f"✓ Initialized chat session for project: {project_name} - Set {set_number}")
-            
-        except Exception as e:
-            print(f"Error initializing chat for {project_name} - Set {set_number}: {str(e)}")
-            raise e
+        chat = self.project_chats.get(chat_key)
+        if chat is not None:
+            self.project_chats.move_to_end(chat_key)
+            return chat
 
-    def generate_review(self, project_info_df, project_name, set_number):
-        print(f"Generating review for project '{project_name}' - Set {set_number}...")
-        
-        if not self.rate_limiter.check_limit():
-            time.sleep(10)
-            return self.generate_review(project_info_df, project_name, set_number)
-        
-        self.rate_limiter.record_request()
-        time.sleep(random.uniform(0.5, 1.5))
+        chat = self._client_for_key(api_key).model(system_prompt).start_chat(history=[])
+        self.project_chats[chat_key] = chat
+        while len(self.project_chats) > self.session_cache_size:
+            self.project_chats.popitem(last=False)
 
-        # Create unique key for project-set combination
-        chat_key = f"{project_name}_set_{set_number}"
-        
-        # Initialize chat if it doesn't exist for this project-set combination
-        if chat_key not in self.project_chats:
-            self._initialize_chat_for_project_set(project_name, set_number)
+        print(f"✓ Initialized chat session for project: {project_name} - Set {set_number}")
+        return chat
 
-        chat = self.project_chats.get(chat_key)
-        if not chat:
-            print(f"Failed to get chat for {chat_key}")
-            return None
+    def _build_review_message(self, project_set, project_name, set_number, system_prompt=""):
+        header = (f"Review project '{project_name}' (set {set_number}) from these resident phrases.\n"
+                  f"Stay: {project_set.duration_of_stay}\n")
+        rules = ("Rules: positive_review and negative_review are detailed text; society_management, "
+                 "green_area, amenities, connectivity and construction are \"1\"-\"5\" or \"N.A.\"; "
+                 "overall is their average as a string (e.g. \"3.8\") or \"N.A.\"; "
+                 "duration_of_stay comes from Stay.")
+        sections = [("Positive", project_set.positive_phrases),
+                    ("Negative", project_set.negative_phrases),
+                    ("Neutral", project_set.neutral_phrases)]
 
-        # Get the next API key for this request
-        current_api_key = self._get_next_api_key()
-        self._configure_api_with_key(current_api_key)
+        budget = (self.prompt_token_budget - count_tokens(system_prompt) - count_tokens(header + rules)
+                  - sum(count_tokens(label) + 2 for label, _ in sections))
+        kept = self._fit_phrases([phrases for _, phrases in sections], budget)
 
-        message_content = f"""
-        Generate a detailed review for project '{project_name}' based on the following data:
-        {project_info_df.to_json(orient='records')}
-        
-        This is Set {set_number}. Please ensure the review reflects the perspective and style 
-        appropriate for this set while maintaining uniqueness.
-        
-        IMPORTANT: Return ONLY valid JSON with this exact structure:
-        {{
-            "positive_review": "Write detailed positive aspects here",
-            "negative_review": "Write detailed negative aspects here", 
-            "society_management": "4",
-            "green_area": "3",
-            "amenities": "4",
-            "connectivity": "5",
-            "construction": "4",
-            "overall": "4.0",
-            "duration_of_stay": "2 years"
-        }}
-        
-        Rules:
-        - positive_review and negative_review must be detailed text (not empty)
-        - All rating fields must be strings: either "1", "2", "3", "4", "5" or "N.A."
-        - overall should be calculated average as string (e.g. "3.8") or "N.A."
-        - duration_of_stay should be from the data provided
-        - Do not include any other fields like "review_text" or "ratings" object
+        dropped = sum(len(phrases) for _, phrases in sections) - sum(len(phrases) for phrases in kept)
+        if dropped:
+            print(f"Prompt budget: dropped {dropped} phrase(s) for {project_name} - Set {set_number}")
+
+        lines = [f"{label}: {'; '.join(phrases)}" for (label, _), phrases in zip(sections, kept) if phrases]
+        return header + "\n".join(lines) + "\n" + rules
+
+    @staticmethod
+    def _fit_phrases(phrase_lists, budget):
         """
+        Take phrases round-robin across the lists (in their original order) while
+        they fit in `budget` tokens, so every polarity keeps its leading phrases;
+        set_making.py lists the most-mentioned phrases of each polarity first.
+        """
+        queues = [deque(phrases) for phrases in phrase_lists]
+        kept = [[] for _ in phrase_lists]
+        while any(queues):
+            for queue, taken in zip(queues, kept):
+                if not queue:
+                    continue
+                phrase = queue.popleft()
+                cost = count_tokens(phrase) + 1  # plus the '; ' separator
+                if cost <= budget:
+                    taken.append(phrase)
+                    budget -= cost
+        return kept
 
-        try:
-            response = chat.send_message(message_content)
-            review_json = response.text
-            print(f"Raw response: {review_json[:200]}...")
-            
-        except Exception as e:
-            print(f'Gemini AI Chat execution threw an exception: {e}')
+    def generate_review(self, project_set, project_name, set_number):
+        print(f"Generating review for project '{project_name}' - Set {set_number}...")
+
+        system_prompt, message_content, cache_key = self.prepare_request(project_set, project_name, set_number)
+
+        cache = get_cache()
+        review_json = cache.get(cache_key)
+        if review_json is not None:
+            print(f"Cache hit for {project_name} - Set {set_number}")
+            get_metrics().record_cache_hit('generation')
+            return self.parse_review_response(review_json, project_set)
+
+        tokens = estimate_tokens(system_prompt, message_content)
+        chat_key = f"{project_name}_set_{set_number}"
+
+        # Try once more with the next key if the request fails or the
+        # response does not validate against the Review schema; every
+        # attempt is charged to the limiter of the key it is sent on
+        for attempt in range(2):
+            api_key = self._acquire_next_key(tokens)
+            if attempt:
+                get_metrics().record_retry('generation', key_id(api_key))
             try:
-                # Re-initialize chat on error with different API key
-                print("Attempting to re-initialize chat with different API key...")
-                self._initialize_chat_for_project_set(project_name, set_number)
-                chat = self.project_chats.get(chat_key)
-                if chat:
-                    # Use different API key for retry
-                    retry_api_key = self._get_next_api_key()
-                    self._configure_api_with_key(retry_api_key)
-                    response = chat.send_message(message_content)
+                if self.session_cache_size > 0:
+                    chat = self._get_chat(project_name, set_number, system_prompt, api_key)
+                    start = time.perf_counter()
+                    try:
+                        response = chat.send_message(message_content)
+                    except Exception as e:
+                        record_generation_call(api_key, time.perf_counter() - start, system_prompt, message_content,
+                                               error=e)
+                        raise
+                    record_generation_call(api_key, time.perf_counter() - start, system_prompt, message_content,
+                                           response, rate_limiter=self.rate_limiters[api_key])
                     review_json = response.text
                 else:
-                    return None
-            except Exception as e2:
-                print(f"Re-initialization failed: {e2}")
-                return None
+                    review_json = self._client_for_key(api_key).generate(system_prompt, message_content)
+            except Exception as e:
+                print(f'Gemini AI execution threw an exception (attempt {attempt + 1}): {e}')
+                self.project_chats.pop(chat_key, None)
+                continue
+
+            result = self.parse_review_response(review_json, project_set) if review_json else None
+            if result is not None:
+                cache.set(cache_key, review_json)
+                return result
+            print(f"Response failed validation (attempt {attempt + 1})")
+            self.project_chats.pop(chat_key, None)
+
+        return None
+
+    @property
+    def model_name(self):
+        return self.__model_name
 
-        if not review_json:
+    def prepare_request(self, project_set, project_name, set_number):
+        system_prompt = self._get_system_instruction_for_set(set_number)
+        message_content = self._build_review_message(project_set, project_name, set_number, system_prompt)
+        cache_key = LLMCache.make_key(self.__model_name, system_prompt, message_content,
+                                      GENERATION_CONFIG['temperature'])
+        return system_prompt, message_content, cache_key
+
+    def cached_review(self, project_set, project_name, set_number):
+        """Parsed review from the LLM cache, or None on a miss."""
+        _, _, cache_key = self.prepare_request(project_set, project_name, set_number)
+        review_json = get_cache().get(cache_key)
+        if review_json is None:
             return None
+        get_metrics().record_cache_hit('generation')
+        return self.parse_review_response(review_json, project_set)
+
+    def estimate_request_tokens(self, project_set, project_name, set_number):
+        system_prompt, message_content, _ = self.prepare_request(project_set, project_name, set_number)
+        return estimate_tokens(system_prompt, message_content)
+
+    def generate_review_with_client(self, client, project_set, project_name, set_number, check_cache=True):
+        """
+        Single-shot generation through a per-key client (see GeminiDispatcher).
+        Rate limiting is left to the caller; API errors and responses that
+        fail validation are raised so the dispatcher can retry the item on
+        another key.
+        """
+        system_prompt, message_content, cache_key = self.prepare_request(project_set, project_name, set_number)
+
+        cache = get_cache()
+        if check_cache:
+            review_json = cache.get(cache_key)
+            if review_json is not None:
+                get_metrics().record_cache_hit('generation')
+                return self.parse_review_response(review_json, project_set)
+
+        review_json = client.generate(system_prompt, message_content)
+        result = self.parse_review_response(review_json, project_set) if review_json else None
+        if result is None:
+            raise ValueError("Response did not match the Review schema")
+
+        cache.set(cache_key, review_json)
+        return result
+
+    def parse_review_response(self, review_json, project_set):
+        """
+        Normalize a raw model response into the flat Review JSON string
+        """
+        # Schema-constrained responses validate directly; the repairs below
+        # run for free-form output such as older cache entries, and for
+        # valid reviews with empty fields that need the defaults
+        try:
+            review = Review.model_validate_json(review_json)
+            if (review.positive_review and review.negative_review and review.duration_of_stay
+                    and review.overall != "N.A."):
+                return review.model_dump_json()
+        except ValidationError:
+            pass
 
         try:
             # Clean the JSON response (remove markdown formatting if present)
@@ -293,7 +475,7 @@ class GeminiReviewGenerator:
                         
         except json.JSONDecodeError as e:
             print(f"JSON decode error: {e}")
-            print(f"Raw response: {review_json}")
+            print(f"Raw response: {review_json[:200]}...")
             return None
 
         # Handle missing overall rating - calculate from other ratings
@@ -341,11 +523,7 @@ class GeminiReviewGenerator:
 
         # Handle duration of stay
         if "duration_of_stay" not in review_data or review_data["duration_of_stay"] is None or review_data["duration_of_stay"] == "":
-            if 'duration_of_stay' in project_info_df.columns and not project_info_df['duration_of_stay'].empty:
-                duration_val = project_info_df['duration_of_stay'].iloc[0]
-                review_data["duration_of_stay"] = str(duration_val) if not pd.isna(duration_val) else "N.A."
-            else:
-                review_data["duration_of_stay"] = "N.A."
+            review_data["duration_of_stay"] = project_set.duration_of_stay if project_set is not None else "N.A."
 
         # Ensure required fields exist and have proper values
         if "positive_review" not in review_data or not review_data["positive_review"]:
@@ -390,158 +568,560 @@ class GeminiReviewGenerator:
             print(f"Error getting chat history: {e}")
             return []
 
-def prepare_project_info_df(pname, set_phrases, duration, set_number):
-    if not set_phrases or pd.isna(set_phrases) or set_phrases == "":
+class GeminiKeyClient:
+    """
+    Gemini client bound to a single API key. genai.configure() is global, so
+    each instance owns its own GenerativeServiceClient and attaches it to the
+    models it builds; this lets several keys be used at the same time.
+    Tokens a call uses beyond its estimate are charged to rate_limiter.
+    """
+
+    def __init__(self, api_key, model_name, rate_limiter=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter
+        self._service = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+        self._models = {}
+
+    def model(self, system_instruction):
+        model = self._models.get(system_instruction)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name=self.model_name,
+                system_instruction=system_instruction,
+                generation_config=genai.GenerationConfig(**GENERATION_CONFIG)
+            )
+            # GenerativeModel has no public way to pass a client per instance
+            model._client = self._service
+            self._models[system_instruction] = model
+        return model
+
+    def generate(self, system_instruction, message):
+        start = time.perf_counter()
+        try:
+            response = self.model(system_instruction).generate_content(message)
+        except Exception as e:
+            record_generation_call(self.api_key, time.perf_counter() - start, system_instruction, message, error=e)
+            raise
+        record_generation_call(self.api_key, time.perf_counter() - start, system_instruction, message, response,
+                               rate_limiter=self.rate_limiter)
+        return response.text
+
+class GeminiDispatcher:
+    """
+    Schedules generate_review work items across every API key concurrently.
+    Each key has its own client and its own persisted RateLimiter. Every
+    request is routed to the key with the most headroom, so the aggregate
+    quota of all keys is used before anyone waits.
+
+    client_factory(api_key, model_name, rate_limiter) builds the per-key
+    client; tests can pass a fake with the same generate(system_instruction,
+    message) method.
+    """
+
+    def __init__(self, generator, api_keys=None, client_factory=GeminiKeyClient, workers_per_key=2,
+                 rate_limits=None, max_attempts=3):
+        self.generator = generator
+        self.api_keys = list(api_keys or generator.api_keys)
+        if not self.api_keys:
+            raise ValueError("GeminiDispatcher needs at least one API key")
+
+        rate_limits = rate_limits or rate_limits_from_env()
+        self.limiters = [
+            RateLimiter(limiter_id=key_id(key), store=generator.quota_store, **rate_limits)
+            for key in self.api_keys
+        ]
+        self.clients = [client_factory(key, generator.model_name, rate_limiter=limiter)
+                        for key, limiter in zip(self.api_keys, self.limiters)]
+        self.workers_per_key = workers_per_key
+        self.max_attempts = max_attempts
+        self._live_keys = set(range(len(self.api_keys)))
+        # Set once every key is out of daily quota; unfinished items stay None
+        self.quota_exhausted = False
+
+    async def _acquire_key(self, tokens, avoid=None):
+        """
+        Wait until some key can take a request of `tokens`, preferring the key
+        with the most remaining capacity, and return its index. The `avoid`
+        key (the one a retried item just failed on) is only used when no
+        other key is left.
+        """
+        while True:
+            waits = []
+            candidates = self._live_keys - {avoid} or self._live_keys
+            for key_index in sorted(candidates, key=lambda i: self.limiters[i].headroom(), reverse=True):
+                try:
+                    wait = self.limiters[key_index].try_acquire(tokens)
+                except DailyLimitReached:
+                    print(f"API key #{key_index + 1} reached its daily limit")
+                    self._live_keys.discard(key_index)
+                    continue
+                if wait == 0:
+                    return key_index
+                waits.append(wait)
+
+            if not waits:
+                self.quota_exhausted = True
+                raise DailyLimitReached("All API keys have reached their daily limit")
+            await asyncio.sleep(min(waits))
+
+    async def _worker(self, queue, results, executor):
+        while True:
+            try:
+                position, item, attempts, failed_key = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            project_set, project_name, set_number = item
+
+            cached = self.generator.cached_review(project_set, project_name, set_number)
+            if cached is not None:
+                results[position] = cached
+                continue
+
+            tokens = self.generator.estimate_request_tokens(project_set, project_name, set_number)
+            try:
+                key_index = await self._acquire_key(tokens, avoid=failed_key)
+            except DailyLimitReached as e:
+                print(f"Stopping generation: {e}")
+                queue.put_nowait((position, item, attempts, failed_key))
+                return
+
+            try:
+                results[position] = await asyncio.get_running_loop().run_in_executor(
+                    executor, self.generator.generate_review_with_client,
+                    self.clients[key_index], project_set, project_name, set_number, False
+                )
+            except Exception as e:
+                print(f"API key #{key_index + 1} failed for {project_name} - Set {set_number}: {e}")
+                if attempts + 1 < self.max_attempts:
+                    get_metrics().record_retry('generation', key_id(self.api_keys[key_index]), type(e).__name__)
+                    queue.put_nowait((position, item, attempts + 1, key_index))
+
+    async def run(self, work_items):
+        """
+        Generate every (project_set, project_name, set_number) item and
+        return the review JSON strings (or None) in the order of work_items.
+        When the daily quota of every key runs out, the items not generated
+        yet are left as None and quota_exhausted is set.
+        """
+        results = [None] * len(work_items)
+        queue = asyncio.Queue()
+        for position, item in enumerate(work_items):
+            queue.put_nowait((position, item, 0, None))
+
+        worker_count = len(self.clients) * self.workers_per_key
+        # One thread per worker so blocking SDK calls never queue behind each other
+        with ThreadPoolExecutor(max_workers=worker_count) as executor:
+            await asyncio.gather(*(self._worker(queue, results, executor) for _ in range(worker_count)))
+        return results
+
+    def generate_all(self, work_items):
+        return asyncio.run(self.run(work_items))
+
+def prepare_project_set(pname, set_phrases, duration, set_number):
+    if not set_phrases or pd.isna(set_phrases) or str(set_phrases).strip() == "":
         return None
-    
-    phrases = [p.strip() for p in str(set_phrases).split('\n') if p.strip()]
-    positive = [p.replace(" (positive)", "") for p in phrases if "(positive)" in p]
-    negative = [p.replace(" (negative)", "") for p in phrases if "(negative)" in p]
-    neutral = [p for p in phrases if "(positive)" not in p and "(negative)" not in p]
-    
-    return pd.DataFrame({
-        'project_name': [pname],
-        'positive_phrases': [positive],
-        'negative_phrases': [negative],
-        'neutral_phrases': [neutral],
-        'duration_of_stay': [duration if not pd.isna(duration) else "NA"],
-        'set_number': [set_number]
-    })
 
-def main():
-    # Check if required files exist
-    if not os.path.exists("output_sets.csv"):
-        print("Error: output_sets.csv not found!")
-        return
-    
-    if not os.path.exists("gemini_ai_prompts.json"):
-        print("Warning: gemini_ai_prompts.json not found. Using default prompts.")
-    
+    # set_making joins a set's phrases with '; '; older files used newlines
+    phrases = [p.strip() for p in re.split(r'[;\n]', str(set_phrases)) if p.strip()]
+    positive, negative, neutral = [], [], []
+    for phrase in phrases:
+        if phrase.endswith("(positive)"):
+            positive.append(phrase[:-len("(positive)")].strip())
+        elif phrase.endswith("(negative)"):
+            negative.append(phrase[:-len("(negative)")].strip())
+        else:
+            neutral.append(phrase)
+
+    return ProjectSet(
+        project_name=str(pname),
+        set_number=set_number,
+        positive_phrases=positive,
+        negative_phrases=negative,
+        neutral_phrases=neutral,
+        duration_of_stay=str(duration) if not pd.isna(duration) else "NA"
+    )
+
+# positive_review of the placeholder written for a set whose generation failed
+FAILED_REVIEW_PREFIX = "Generation failed: "
+
+def failed_review_json(error):
+    return json.dumps({
+        "positive_review": f"{FAILED_REVIEW_PREFIX}{str(error)[:100]}", 
+        "negative_review": "",
+        "society_management": "N.A.", 
+        "green_area": "N.A.", 
+        "amenities": "N.A.",
+        "connectivity": "N.A.", 
+        "construction": "N.A.", 
+        "overall": "N.A.",
+        "duration_of_stay": "N.A."
+    }, separators=(',', ':'))
+
+def review_succeeded(cell):
+    """
+    Whether a 'Review N' cell holds a generated review: True for review JSON
+    and for an empty cell (a set without phrases), False for
+    failed_review_json() placeholders and text that does not parse.
+    """
+    if cell is None or (not isinstance(cell, str) and pd.isna(cell)) or not str(cell).strip():
+        return True
     try:
-        df = pd.read_csv("output_sets.csv")
-    except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        return
-    
-    if df.empty:
-        print("Error: CSV file is empty!")
-        return
-    
+        review_data = json.loads(cell)
+    except (TypeError, ValueError):
+        return False
+    return (isinstance(review_data, dict)
+            and not str(review_data.get("positive_review", "")).startswith(FAILED_REVIEW_PREFIX))
+
+def ensure_structured_output(output_file, set_count):
+    # Create output file if it doesn't exist
+    if not os.path.exists(output_file):
+        columns = ["xid", "Project name"] + [f"Review {i}" for i in range(1, set_count+1)]
+        write_artifact(pd.DataFrame(columns=columns), output_file)
+        print(f"Created output file: {output_file}")
+
+class StructuredReviewWriter:
+    """
+    Buffered writer for structured_reviews.csv. Project rows are kept in
+    memory and every `flush_every` projects they are written as one segment
+    file under `<output>.segments/`: written to a temp file, fsynced and
+    renamed into place, so a crash loses at most the unflushed batch and
+    never leaves a half-written row. close() folds the segments into the
+    output file the same way; the last row written for an xid replaces any
+    earlier one. Segments left behind by a crash are folded in by the next
+    writer unless it starts over with truncate.
+
+    A .parquet or .arrow output gets segments in the same format, and the
+    reviews are stored as plain string columns instead of quoted CSV cells.
+    """
+
+    def __init__(self, output_file, set_count, flush_every=DEFAULT_FLUSH_EVERY, truncate=False):
+        self.output_file = output_file
+        self.columns = ["xid", "Project name"] + [f"Review {i}" for i in range(1, set_count+1)]
+        self.flush_every = max(1, flush_every)
+        self.segment_dir = f"{output_file}.segments"
+        self.format = format_of(output_file)
+        self.extension = os.path.splitext(output_file)[1] or '.csv'
+        self._buffer = []
+
+        if truncate:
+            for path in self._segment_paths():
+                os.remove(path)
+            if os.path.isdir(self.segment_dir):
+                os.rmdir(self.segment_dir)
+            if os.path.exists(output_file):
+                os.remove(output_file)
+        ensure_structured_output(output_file, set_count)
+        self._consolidate()
+
+    def _segment_paths(self):
+        if not os.path.isdir(self.segment_dir):
+            return []
+        return sorted(os.path.join(self.segment_dir, name) for name in os.listdir(self.segment_dir)
+                      if name.endswith(self.extension))
+
+    def _write_atomic(self, path, write):
+        with atomic_open(path, newline='', encoding='utf-8') as f:
+            write(f)
+
+    def _csv_writer(self, f):
+        return csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator=os.linesep)
+
+    def completed_xids(self):
+        """
+        xids in the output file or in flushed segments whose reviews were all
+        generated (see review_succeeded). An xid whose latest row holds a
+        failure is left out, so a resume generates it again.
+        """
+        succeeded = {}
+        review_columns = self.columns[2:]
+        for path in [self.output_file] + self._segment_paths():
+            if self.format != 'csv':
+                rows = read_artifact(path).to_dict('records')
+            else:
+                with open(path, 'r', newline='', encoding='utf-8') as f:
+                    rows = [row for row in csv.DictReader(f, fieldnames=self.columns) if row['xid'] != 'xid']
+            for row in rows:
+                succeeded[str(row['xid'])] = all(review_succeeded(row.get(column)) for column in review_columns)
+        return {xid for xid, ok in succeeded.items() if ok}
+
+    def write(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        os.makedirs(self.segment_dir, exist_ok=True)
+        segment_paths = self._segment_paths()
+        number = int(os.path.splitext(os.path.basename(segment_paths[-1]))[0]) + 1 if segment_paths else 1
+        segment_path = os.path.join(self.segment_dir, f"{number:06d}{self.extension}")
+        rows = self._buffer
+
+        if self.format != 'csv':
+            write_artifact(pd.DataFrame(rows, columns=self.columns), segment_path)
+        else:
+            def write_rows(f):
+                self._csv_writer(f).writerows([row.get(column, "") for column in self.columns] for row in rows)
+
+            self._write_atomic(segment_path, write_rows)
+        self._buffer = []
+
+    def _consolidate(self):
+        segment_paths = self._segment_paths()
+        if not segment_paths:
+            return
+
+        if self.format != 'csv':
+            merged = pd.concat([read_artifact(path) for path in [self.output_file] + segment_paths],
+                               ignore_index=True)
+            merged = merged[~merged['xid'].astype(str).duplicated(keep='last')]
+            write_artifact(merged, self.output_file)
+            for path in segment_paths:
+                os.remove(path)
+            os.rmdir(self.segment_dir)
+            return
+
+        # Later segments win over earlier ones, and segments over the output
+        new_rows = {}
+        for path in segment_paths:
+            with open(path, 'r', newline='', encoding='utf-8') as segment:
+                for row in csv.reader(segment):
+                    if row:
+                        new_rows.pop(row[0], None)
+                        new_rows[row[0]] = row
+
+        def merge(out):
+            writer = self._csv_writer(out)
+            with open(self.output_file, 'r', newline='', encoding='utf-8') as base:
+                for number, row in enumerate(csv.reader(base)):
+                    if row and (number == 0 or row[0] not in new_rows):
+                        writer.writerow(row)
+            writer.writerows(new_rows.values())
+
+        self._write_atomic(self.output_file, merge)
+        for path in segment_paths:
+            os.remove(path)
+        os.rmdir(self.segment_dir)
+
+    def close(self):
+        self.flush()
+        self._consolidate()
+
+def sets_to_generate(row, pname, xid, set_count, reuse_reviews):
+    """
+    (set number, ProjectSet) for every set of a row that needs a fresh review
+    """
+    for s in range(1, set_count+1):
+        scol = f"Set {s}"
+        dcol = f"How Long do you stay here {s}"
+        if scol not in row or pd.isna(row[scol]) or str(row[scol]).strip() == "":
+            continue
+        if reuse_reviews.get(str(xid), {}).get(s):
+            continue
+        project_set = prepare_project_set(pname, row[scol], row.get(dcol, "NA"), s)
+        if project_set is not None:
+            yield s, project_set
+
+def generate_reviews(df, output_file="structured_reviews.csv", gen=None, reuse_reviews=None, dispatcher=None,
+                     resume=False, flush_every=DEFAULT_FLUSH_EVERY, keep_existing=False):
+    """
+    Generate one review per set for every project row of an output_sets
+    DataFrame. Finished projects go through a StructuredReviewWriter, which
+    flushes them to output_file every flush_every projects; the generated
+    rows are also returned for in-process callers. With resume, xids already
+    present in output_file are skipped. Otherwise output_file is started
+    over, unless keep_existing is set: then its rows for other xids stay and
+    the generated rows replace those of the same xid.
+
+    reuse_reviews maps xid -> {set number: review JSON} for sets that are
+    unchanged since a previous run; those are copied instead of regenerated.
+
+    With a GeminiDispatcher, the sets of DISPATCH_CHUNK_PROJECTS projects are
+    generated concurrently across all keys before those projects are written.
+
+    When the daily quota runs out the run stops at the first project that
+    could not be generated and writes nothing for it or any later project,
+    so a resume picks them up.
+    """
+    reuse_reviews = reuse_reviews or {}
     set_columns = [col for col in df.columns if col.startswith("Set ")]
     if not set_columns:
         print("Error: No 'Set' columns found in the CSV!")
-        return
+        return None
     
-    output_file = "structured_reviews.csv"
+    writer = StructuredReviewWriter(output_file, len(set_columns), flush_every=flush_every,
+                                    truncate=not (resume or keep_existing))
+    completed = writer.completed_xids() if resume else set()
+    if completed:
+        print(f"Resuming: {len(completed)} project(s) already in {output_file}")
     
-    # Create output file if it doesn't exist
-    if not os.path.exists(output_file):
-        columns = ["xid", "Project name"] + [f"Review {i}" for i in range(1, len(set_columns)+1)]
-        pd.DataFrame(columns=columns).to_csv(output_file, index=False)
-        print(f"Created output file: {output_file}")
-    
-    try:
-        gen = GeminiReviewGenerator()
-    except Exception as e:
-        print(f"Error initializing Gemini generator: {e}")
-        return
+    if gen is None:
+        try:
+            gen = GeminiReviewGenerator()
+        except Exception as e:
+            print(f"Error initializing Gemini generator: {e}")
+            return None
 
     total_projects = len(df)
     successful_projects = 0
+    stopped = None
+    output_rows = []
+    pregenerated = {}
     
-    for idx, (_, row) in enumerate(df.iterrows()):
-        try:
-            xid = row.get("xid", f"id_{idx}")
-            pname = row.get("Project name", f"Project_{idx}")
+    try:
+        for idx, (_, row) in enumerate(df.iterrows()):
+            if dispatcher is not None and idx % DISPATCH_CHUNK_PROJECTS == 0:
+                keys, items = [], []
+                chunk = df.iloc[idx:idx + DISPATCH_CHUNK_PROJECTS]
+                for offset, (_, chunk_row) in enumerate(chunk.iterrows()):
+                    chunk_xid = chunk_row.get("xid", f"id_{idx + offset}")
+                    if str(chunk_xid) in completed:
+                        continue
+                    chunk_pname = chunk_row.get("Project name", f"Project_{idx + offset}")
+                    for s, project_set in sets_to_generate(chunk_row, chunk_pname, chunk_xid, len(set_columns), reuse_reviews):
+                        keys.append((idx + offset, s))
+                        items.append((project_set, chunk_pname, s))
+
+                print(f"Dispatching {len(items)} generations across {len(dispatcher.clients)} API key(s)...")
+                pregenerated = dict(zip(keys, dispatcher.generate_all(items)))
+
+            try:
+                xid = row.get("xid", f"id_{idx}")
+                pname = row.get("Project name", f"Project_{idx}")
+
+                if str(xid) in completed:
+                    print(f"Skipping project {idx+1}/{total_projects}: {pname} (ID: {xid}) already completed")
+                    continue
             
-            print(f"\n{'='*50}")
-            print(f"Processing project {idx+1}/{total_projects}: {pname} (ID: {xid})")
-            print(f"{'='*50}")
+                print(f"\n{'='*50}")
+                print(f"Processing project {idx+1}/{total_projects}: {pname} (ID: {xid})")
+                print(f"{'='*50}")
             
-            pdata = {"xid": xid, "Project name": pname}
-            project_success = True
+                pdata = {"xid": xid, "Project name": pname}
+                project_success = True
 
-            # Process each set with different system instructions
-            for s in range(1, len(set_columns)+1):
-                scol = f"Set {s}"
-                dcol = f"How Long do you stay here {s}"
+                # Process each set with different system instructions
+                for s in range(1, len(set_columns)+1):
+                    scol = f"Set {s}"
+                    dcol = f"How Long do you stay here {s}"
                 
-                print(f"\n--- Processing Set {s} ---")
+                    print(f"\n--- Processing Set {s} ---")
                 
-                if scol not in row or pd.isna(row[scol]) or str(row[scol]).strip() == "":
-                    print(f"Skipping Set {s}: No data available")
-                    pdata[f"Review {s}"] = ""
-                    continue
+                    if scol not in row or pd.isna(row[scol]) or str(row[scol]).strip() == "":
+                        print(f"Skipping Set {s}: No data available")
+                        pdata[f"Review {s}"] = ""
+                        continue
+
+                    previous_review = reuse_reviews.get(str(xid), {}).get(s)
+                    if previous_review:
+                        print(f"Reusing unchanged review for Set {s}")
+                        pdata[f"Review {s}"] = previous_review
+                        continue
                 
-                pdf = prepare_project_info_df(pname, row[scol], row.get(dcol, "NA"), s)
-                if pdf is None:
-                    print(f"Skipping Set {s}: Could not prepare project info")
-                    pdata[f"Review {s}"] = ""
-                    continue
+                    project_set = prepare_project_set(pname, row[scol], row.get(dcol, "NA"), s)
+                    if project_set is None:
+                        print(f"Skipping Set {s}: Could not prepare project info")
+                        pdata[f"Review {s}"] = ""
+                        continue
                     
-                try:
-                    print(f"Generating review for {pname} - Set {s}...")
-                    rjson = gen.generate_review(pdf, pname, s)
+                    try:
+                        print(f"Generating review for {pname} - Set {s}...")
+                        if dispatcher is not None:
+                            rjson = pregenerated.pop((idx, s), None)
+                            if rjson is None and dispatcher.quota_exhausted:
+                                raise DailyLimitReached("All API keys have reached their daily limit")
+                        else:
+                            rjson = gen.generate_review(project_set, pname, s)
                     
-                    if rjson:
-                        pdata[f"Review {s}"] = rjson
-                        print(f"✓ Success: {pname} - Set {s}")
-                    else:
-                        raise Exception("No review generated")
+                        if rjson:
+                            pdata[f"Review {s}"] = rjson
+                            print(f"✓ Success: {pname} - Set {s}")
+                        else:
+                            raise Exception("No review generated")
                         
-                except Exception as e:
-                    print(f"✗ Failed for {pname} (Set {s}): {str(e)}")
-                    project_success = False
+                    except DailyLimitReached:
+                        raise
+                    except Exception as e:
+                        print(f"✗ Failed for {pname} (Set {s}): {str(e)}")
+                        project_success = False
                     
-                    # Create error JSON
-                    err_json = json.dumps({
-                        "positive_review": f"Generation failed: {str(e)[:100]}", 
-                        "negative_review": "",
-                        "society_management": "N.A.", 
-                        "green_area": "N.A.", 
-                        "amenities": "N.A.",
-                        "connectivity": "N.A.", 
-                        "construction": "N.A.", 
-                        "overall": "N.A.",
-                        "duration_of_stay": "N.A."
-                    })
-                    pdata[f"Review {s}"] = err_json
-
-            # Save data for this project
-            try:
-                # Convert the JSON string back to dict for proper CSV storage
-                output_data = {}
-                for key, value in pdata.items():
-                    if key.startswith("Review ") and value:
-                        try:
-                            # Parse JSON and store as properly formatted JSON string
-                            review_dict = json.loads(value)
-                            output_data[key] = json.dumps(review_dict, ensure_ascii=False, separators=(',', ':'))
-                        except:
-                            output_data[key] = value
-                    else:
-                        output_data[key] = value
-                
-                pd.DataFrame([output_data]).to_csv(output_file, mode='a', header=False, index=False, quoting=1, escapechar=None)
-                print(f"✓ Saved data for {pname} to {output_file}")
-                if project_success:
-                    successful_projects += 1
-            except Exception as e:
-                print(f"✗ Error saving data for {pname}: {e}")
+                        pdata[f"Review {s}"] = failed_review_json(e)
 
-        except Exception as e:
-            print(f"✗ Critical error processing project {idx+1}: {e}")
-            continue
+                # Save data for this project
+                try:
+                    writer.write(pdata)
+                    output_rows.append(pdata)
+                    print(f"✓ Saved data for {pname} to {output_file}")
+                    if project_success:
+                        successful_projects += 1
+                except Exception as e:
+                    print(f"✗ Error saving data for {pname}: {e}")
+
+            except DailyLimitReached as e:
+                stopped = e
+                print(f"✗ Stopping at project {idx+1}/{total_projects}: {e}")
+                break
+            except Exception as e:
+                print(f"✗ Critical error processing project {idx+1}: {e}")
+                continue
+    finally:
+        writer.close()
 
     print(f"\n{'='*60}")
     print(f"SUMMARY")
     print(f"{'='*60}")
     print(f"Total projects processed: {total_projects}")
     print(f"Successful projects: {successful_projects}")
-    print(f"Failed projects: {total_projects - successful_projects}")
+    print(f"Failed projects: {len(output_rows) - successful_projects}")
+    if stopped is not None:
+        print(f"Not processed (resume to continue): {total_projects - idx}")
     print(f"Output file: {output_file}")
+    print(f"LLM cache stats: {get_cache().stats()}")
+    print(f"Generation metrics: {get_metrics().summary().get('generation', {})}")
     print(f"{'='*60}")
 
-if __name__ == "__main__":
+    return output_rows
+
+def main():
+    # Check if required files exist
+    sets_file = find_artifact("output_sets")
+    if not os.path.exists(sets_file):
+        print(f"Error: {sets_file} not found!")
+        return
+    
+    if not os.path.exists("gemini_ai_prompts.json"):
+        print("Warning: gemini_ai_prompts.json not found. Using default prompts.")
+    
+    try:
+        df = read_artifact(sets_file)
+    except Exception as e:
+        print(f"Error reading CSV file: {e}")
+        return
+    
+    if df.empty:
+        print("Error: CSV file is empty!")
+        return
+
+    try:
+        gen = GeminiReviewGenerator()
+    except Exception as e:
+        print(f"Error initializing Gemini generator: {e}")
+        return
+
+    dispatcher = None
+    if env_flag("GEMINI_CONCURRENT"):
+        dispatcher = GeminiDispatcher(gen, workers_per_key=int(os.getenv("GEMINI_WORKERS_PER_KEY", "2")))
 
+    resume = env_flag("GENERATION_RESUME")
+    flush_every = int(os.getenv("GENERATION_FLUSH_EVERY", DEFAULT_FLUSH_EVERY))
+    start = time.time()
+    generate_reviews(df, artifact_path("structured_reviews"), gen=gen, dispatcher=dispatcher, resume=resume,
+                     flush_every=flush_every)
+    get_metrics().record_stage('generation', time.time() - start)
+    get_metrics().close()
+
+if __name__ == "__main__":
     main()
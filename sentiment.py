@@ -6,19 +6,30 @@ import requests
 import openai
 from dotenv import load_dotenv
 import chardet
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
 import sys
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('sentiment_analysis.log'),
-        logging.StreamHandler()
-    ]
-)
+import csv
+import hashlib
+import json
+import re
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from config import env_flag
+from llm_cache import LLMCache, get_cache
+from prefilter import ReviewPrefilter, get_prefilter
+from review_dedup import ReviewDedupIndex, new_dedup_index, write_spam_report
+from telemetry import get_metrics, usage_tokens
+
+def configure_logging() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('sentiment_analysis.log'),
+            logging.StreamHandler()
+        ]
+    )
 
 # Load environment variables
 load_dotenv()
@@ -26,7 +37,16 @@ load_dotenv()
 openai.api_key = "dummy"  # Required by SDK, ignored by custom endpoint
 MODEL_ID = "gpt-4.0-mini"
 
-SYSTEM_INSTRUCTION = """
+API_URL = os.getenv('SENTIMENT_API_URL', 'http://new99acresposting:6009/api/analyze')
+DEFAULT_TIMEOUT = 30
+CHECKPOINT_WINDOW = 50
+# Windows whose requests may be in flight at once; the oldest is written out before another is queued
+MAX_PENDING_WINDOWS = 2
+SPAM_REPORT_FILE = 'suspected_spam.csv'
+INPUT_CHUNK_ROWS = 10000
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+
+CLASSIFICATION_GUIDELINES = """
 You are an expert residential real estate analyst with extensive experience evaluating homebuyer feedback.
 
 Classification guidelines:
@@ -42,139 +62,513 @@ Classification guidelines:
    - Is too brief or vague to determine genuine sentiment about the property
 
 Analyze the actual content. Focus exclusively on property quality assessment.
+"""
 
+SYSTEM_INSTRUCTION = CLASSIFICATION_GUIDELINES + """
 Return only one word as your classification: 'positive', 'negative', or 'ignore'.
 """
 
-def detect_file_encoding(file_path: str) -> str:
+BATCH_SYSTEM_INSTRUCTION = CLASSIFICATION_GUIDELINES + """
+You will receive several numbered reviews. Classify each review independently of the others.
+
+Return only a JSON array with exactly one object per review, using the review's number as "id", e.g.:
+[{"id": 1, "sentiment": "positive"}, {"id": 2, "sentiment": "ignore"}]
+
+Each "sentiment" must be one of 'positive', 'negative', or 'ignore'.
+"""
+
+VALID_SENTIMENTS = {'positive', 'negative', 'ignore'}
+
+def detect_file_encoding(file_path: str, sample_size: int = ENCODING_SAMPLE_BYTES) -> str:
+    """
+    Sniff the encoding from a bounded prefix of the file instead of reading
+    the whole export into memory. An all-ASCII prefix says nothing about the
+    rest of the file, so it is reported as UTF-8, its superset.
+    """
     try:
+        detector = chardet.UniversalDetector()
+        read = 0
         with open(file_path, 'rb') as f:
-            result = chardet.detect(f.read())
-        return result['encoding'] or 'utf-8'
+            while read < sample_size and not detector.done:
+                block = f.read(min(64 * 1024, sample_size - read))
+                if not block:
+                    break
+                detector.feed(block)
+                read += len(block)
+        detector.close()
+        encoding = detector.result['encoding'] or 'utf-8'
+        return 'utf-8' if encoding.lower() == 'ascii' else encoding
     except Exception as e:
         logging.error(f"Error detecting file encoding: {e}")
         return 'utf-8'
 
-def classify_sentiment(review: str, max_retries: int = 3) -> str:
+def iter_input_chunks(input_file: str, chunksize: int = INPUT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Stream the input CSV in chunks with a file-wide row index. If a chunk
+    fails to decode, the file is reopened with the next fallback encoding and
+    the rows already yielded are skipped, so no row is produced twice.
+    """
+    encoding = detect_file_encoding(input_file)
+    logging.info(f"Detected encoding: {encoding} for file: {input_file}")
+
+    # UTF-8 goes before the single-byte fallbacks, which decode almost anything
+    encodings = [encoding] + [e for e in ['utf-8', 'windows-1252', 'iso-8859-1', 'latin1'] if e != encoding.lower()]
+    rows_read = 0
+
+    for attempt, current_encoding in enumerate(encodings):
+        try:
+            to_skip = rows_read
+            for chunk in pd.read_csv(input_file, encoding=current_encoding, chunksize=chunksize, dtype=str):
+                if to_skip:
+                    dropped = min(to_skip, len(chunk))
+                    chunk = chunk.iloc[dropped:]
+                    to_skip -= dropped
+                    if chunk.empty:
+                        continue
+
+                # Clean column names
+                chunk.columns = [col.strip() for col in chunk.columns]
+                chunk.index = range(rows_read, rows_read + len(chunk))
+                rows_read += len(chunk)
+                yield chunk
+
+            if attempt:
+                logging.info(f"Successfully read with {current_encoding} encoding")
+            return
+        except UnicodeDecodeError:
+            logging.warning(f"Could not decode {input_file} as {current_encoding} after {rows_read} rows, trying next encoding")
+            continue
+
+    raise ValueError("Failed to read file with any supported encoding")
+
+def _post_analyze(messages: List[Dict[str, str]], max_retries: int = 3,
+                  timeout: float = DEFAULT_TIMEOUT) -> Optional[str]:
+    """
+    Send one chat request to the analyze endpoint with exponential backoff.
+    Returns the raw 'result' text, or None if every attempt failed.
+    """
+    data = {
+        "messages": messages,
+        "temperature": 0.8,
+        "keyType": "MINI"
+    }
+
+    cache = get_cache()
+    cache_key = LLMCache.make_key(API_URL, messages[0]["content"], messages[1]["content"], data["temperature"])
+    cached = cache.get(cache_key)
+    if cached is not None:
+        get_metrics().record_cache_hit('sentiment')
+        return cached
+
+    metrics = get_metrics()
+    prompt_text = messages[0]["content"] + messages[1]["content"]
     for attempt in range(max_retries):
+        if attempt:
+            metrics.record_retry('sentiment')
+        start = time.perf_counter()
         try:
-            messages = [
-                {"role": "system", "content": SYSTEM_INSTRUCTION},
-                {"role": "user", "content": f'Review: "{review}"'}
-            ]
-            
-            data = {
-                "messages": messages,
-                "temperature": 0.8,
-                "keyType": "MINI"
-            }
-
             response = requests.post(
-                'http://new99acresposting:6009/api/analyze',
+                API_URL,
                 json=data,
                 headers={"Content-Type": "application/json"},
-                timeout=30
+                timeout=timeout
             )
 
             if response.status_code != 200:
+                metrics.record_call('sentiment', time.perf_counter() - start, status=f"http_{response.status_code}")
                 logging.warning(f"Attempt {attempt + 1}: Received status code {response.status_code}")
                 time.sleep(2 ** attempt)
                 continue
-            
-            response_data = response.json()
-            sentiment = response_data.get("result", "").strip().lower()
-            valid_sentiments = {'positive', 'negative', 'ignore'}
-
-            if sentiment not in valid_sentiments:
-                logging.warning(f"Invalid response: {sentiment}. Treating as 'ignore'.")
-                sentiment = 'ignore'
 
-            logging.info(f"Classified sentiment: {sentiment} for review: {review[:50]}...")
-            return sentiment
+            response_data = response.json()
+            result = response_data.get("result", "")
+            input_tokens, output_tokens = usage_tokens(response_data, prompt_text, str(result))
+            metrics.record_call('sentiment', time.perf_counter() - start,
+                                input_tokens=input_tokens, output_tokens=output_tokens)
+            cache.set(cache_key, result)
+            return result
 
         except requests.exceptions.RequestException as e:
+            metrics.record_call('sentiment', time.perf_counter() - start, status=type(e).__name__)
             logging.warning(f"Attempt {attempt + 1}: API request failed - {str(e)}")
             time.sleep(2 ** attempt)
         except Exception as e:
+            metrics.record_call('sentiment', time.perf_counter() - start, status=type(e).__name__)
             logging.error(f"Unexpected error during classification: {e}")
             break
 
-    return 'ignore'
+    return None
 
-def ensure_directory_exists(file_path: str) -> None:
-    directory = os.path.dirname(file_path)
-    if directory and not os.path.exists(directory):
-        os.makedirs(directory, exist_ok=True)
+def classify_sentiment(review: str, max_retries: int = 3, timeout: float = DEFAULT_TIMEOUT) -> str:
+    messages = [
+        {"role": "system", "content": SYSTEM_INSTRUCTION},
+        {"role": "user", "content": f'Review: "{review}"'}
+    ]
 
-def process_sentiments(input_file: str, output_file: str, ignore_file: str) -> None:
-    try:
-        encoding = detect_file_encoding(input_file)
-        logging.info(f"Detected encoding: {encoding} for file: {input_file}")
+    result = _post_analyze(messages, max_retries=max_retries, timeout=timeout)
+    if result is None:
+        return 'ignore'
+
+    sentiment = result.strip().lower()
+    if sentiment not in VALID_SENTIMENTS:
+        logging.warning(f"Invalid response: {sentiment}. Treating as 'ignore'.")
+        sentiment = 'ignore'
+
+    logging.info(f"Classified sentiment: {sentiment} for review: {review[:50]}...")
+    return sentiment
 
+def _labels_by_id(pairs: List[Tuple[object, object]], count: int) -> Optional[List[str]]:
+    labels: Dict[int, str] = {}
+    for item_id, label in pairs:
         try:
-            df = pd.read_csv(input_file, encoding=encoding)
-        except UnicodeDecodeError:
-            for fallback_encoding in ['windows-1252', 'iso-8859-1', 'latin1']:
-                try:
-                    df = pd.read_csv(input_file, encoding=fallback_encoding)
-                    logging.info(f"Successfully read with {fallback_encoding} encoding")
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise ValueError("Failed to read file with any supported encoding")
+            number = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        label = str(label).strip().lower()
+        if not 1 <= number <= count or number in labels or label not in VALID_SENTIMENTS:
+            return None
+        labels[number] = label
+    if len(labels) != count:
+        return None
+    return [labels[number] for number in range(1, count + 1)]
+
+def parse_batch_response(result: str, count: int) -> Optional[List[str]]:
+    """
+    One label per review from a batch response, in review order. Returns None
+    unless the response labels every id 1..count exactly once with a valid
+    sentiment: a partial, duplicated, out-of-range or 0-based answer cannot
+    be trusted for any of its reviews.
+    """
+    text = result.strip()
+    pairs = None
+
+    # Strip markdown fences and anything around the outermost JSON array
+    start, end = text.find('['), text.rfind(']')
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            items = None
+
+        if isinstance(items, list):
+            pairs = []
+            for position, item in enumerate(items):
+                if isinstance(item, dict):
+                    pairs.append((item.get('id'), item.get('sentiment', '')))
+                elif isinstance(item, str):
+                    pairs.append((position + 1, item))
+                else:
+                    return None
+
+    # Fall back to "3. positive" / "3: negative" style lines
+    if pairs is None:
+        pairs = [(match.group(1), match.group(2)) for match in
+                 re.finditer(r'^\W*(\d+)\W+(positive|negative|ignore)\b', text, re.IGNORECASE | re.MULTILINE)]
+
+    return _labels_by_id(pairs, count)
+
+def classify_sentiment_batch(reviews: List[str], max_retries: int = 3,
+                             timeout: float = DEFAULT_TIMEOUT) -> List[str]:
+    """
+    Classify several reviews with a single request. When the response does
+    not label every review (see parse_batch_response) the batch is split in
+    half and each half is classified again; if the request itself fails,
+    every review is classified on its own.
+    """
+    if len(reviews) == 1:
+        return [classify_sentiment(reviews[0], max_retries=max_retries, timeout=timeout)]
+
+    numbered = "\n".join(
+        f'{number}. Review: "{" ".join(review.split())}"' for number, review in enumerate(reviews, 1)
+    )
+    messages = [
+        {"role": "system", "content": BATCH_SYSTEM_INSTRUCTION},
+        {"role": "user", "content": numbered}
+    ]
 
-        # Clean column names
-        df.columns = [col.strip() for col in df.columns]
+    result = _post_analyze(messages, max_retries=max_retries, timeout=timeout)
+    if result is None:
+        logging.warning(f"Batch request for {len(reviews)} reviews failed, falling back to single-review calls")
+        return [classify_sentiment(review, max_retries=max_retries, timeout=timeout) for review in reviews]
+
+    labels = parse_batch_response(result, len(reviews))
+    if labels is None:
+        half = len(reviews) // 2
+        logging.warning(f"Invalid batch response for {len(reviews)} reviews, splitting into {half} + {len(reviews) - half}")
+        return (classify_sentiment_batch(reviews[:half], max_retries=max_retries, timeout=timeout)
+                + classify_sentiment_batch(reviews[half:], max_retries=max_retries, timeout=timeout))
+
+    logging.info(f"Classified batch of {len(reviews)} reviews")
+    return labels
+
+def classify_sentiments_concurrently(reviews: List[str], max_workers: int = 1,
+                                     timeout: float = DEFAULT_TIMEOUT, max_retries: int = 3,
+                                     batch_size: int = 1) -> List[str]:
+    """
+    Classify reviews on a bounded thread pool, optionally packing batch_size
+    reviews into each request. Labels are returned in the same order as the
+    input, so callers can zip them back onto their source rows.
+    """
+    batches = [reviews[i:i + batch_size] for i in range(0, len(reviews), batch_size)]
+    classify = lambda batch: _classify_request(batch, timeout, max_retries)
+
+    if max_workers <= 1:
+        results = [classify(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(classify, batches))
+
+    return [label for batch_labels in results for label in batch_labels]
+
+def _classify_request(reviews: List[str], timeout: float = DEFAULT_TIMEOUT, max_retries: int = 3) -> List[str]:
+    """Labels for one request: a single review, or a batch of them."""
+    if len(reviews) == 1:
+        return [classify_sentiment(reviews[0], max_retries=max_retries, timeout=timeout)]
+    return classify_sentiment_batch(reviews, max_retries=max_retries, timeout=timeout)
 
-        if 'Review' not in df.columns:
+def ensure_directory_exists(file_path: str) -> None:
+    directory = os.path.dirname(file_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+def review_text(row) -> str:
+    """The row's review, with a missing value read as empty rather than 'nan'."""
+    review = row.get('Review', '')
+    return '' if pd.isna(review) else str(review).strip()
+
+def row_xid(row) -> str:
+    """The row's xid as written to the outputs: a missing value is empty, not 'nan'."""
+    xid = row.get('xid', '')
+    return '' if pd.isna(xid) else str(xid)
+
+def review_key(xid, review: str) -> str:
+    """
+    Stable identity for an input row, used to skip completed rows on resume.
+    A missing xid keys the same as the empty string the outputs hold for it.
+    """
+    xid = '' if pd.isna(xid) else xid
+    return hashlib.sha1(f"{xid}\x1f{str(review).strip()}".encode('utf-8')).hexdigest()
+
+def load_completed_keys(*paths: str) -> Counter:
+    """
+    Count the rows already written to previous outputs. A Counter (rather than
+    a set) keeps exact duplicates in the input from being skipped more times
+    than they were actually written.
+    """
+    completed = Counter()
+    for path in paths:
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            continue
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                completed[review_key(row.get('xid', ''), row.get('Review', ''))] += 1
+    return completed
+
+class IncrementalCsvWriter:
+    """
+    Appends result rows to a CSV as soon as they are classified. The header is
+    taken from an existing file when resuming, otherwise from the first row.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+
+        if not append and os.path.exists(path):
+            os.remove(path)
+
+    def _open(self, first_row: Dict) -> None:
+        ensure_directory_exists(self.path)
+        fieldnames = None
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'r', newline='', encoding='utf-8') as f:
+                fieldnames = next(csv.reader(f), None)
+
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames or list(first_row.keys()),
+                                      extrasaction='ignore')
+        if not fieldnames:
+            self._writer.writeheader()
+
+    def write_rows(self, rows: List[Dict]) -> None:
+        if not rows:
+            return
+        if self._writer is None:
+            self._open(rows[0])
+        self._writer.writerows(rows)
+        self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def _to_output_row(row: pd.Series) -> Dict:
+    return {key: ('' if pd.isna(value) else value) for key, value in row.to_dict().items()}
+
+def iter_input_rows(input_file: str) -> Iterator[Tuple[int, pd.Series]]:
+    """Yield (row index, row) pairs from the streamed input CSV."""
+    first = True
+    for chunk in iter_input_chunks(input_file):
+        if first and 'Review' not in chunk.columns:
             raise ValueError("Input CSV must contain a 'Review' column")
+        first = False
+        yield from chunk.iterrows()
+
+def classify_rows(rows: Iterable[Tuple[int, pd.Series]], max_workers: int = 1,
+                  timeout: float = DEFAULT_TIMEOUT, batch_size: int = 1,
+                  completed: Optional[Counter] = None,
+                  prefilter: Optional[ReviewPrefilter] = None,
+                  dedup: Optional[ReviewDedupIndex] = None) -> Iterator[Tuple[List[Dict], List[Dict]]]:
+    """
+    Classify rows one window at a time, yielding (classified, ignored) row
+    dicts for each window in input order. Rows counted in `completed` are
+    skipped (and decremented) so callers can resume a previous run. Reviews
+    the pre-filter (get_prefilter() by default) rejects go straight to the
+    ignored rows with its reason, without an API call. Only one review per
+    exact or near-duplicate cluster of `dedup` (a new_dedup_index() by
+    default) is sent; the others get its label.
+
+    Requests of up to batch_size reviews run on one pool of max_workers
+    threads for the whole run. The next window is queued while the previous
+    one is still in flight (at most MAX_PENDING_WINDOWS), and each window is
+    yielded as soon as its requests complete.
+    """
+    completed = completed if completed is not None else Counter()
+    prefilter = prefilter if prefilter is not None else get_prefilter()
+    dedup = dedup if dedup is not None else new_dedup_index()
+
+    # Windows keep memory bounded and let callers checkpoint after each one
+    window_size = max(CHECKPOINT_WINDOW, max_workers * batch_size * 4)
+    skipped = 0
+    # dedup clusters whose label has been requested by this or an earlier window
+    requested = set()
+
+    def submit_window(window, executor):
+        queries = [position for position, (_, _, _, reason) in enumerate(window) if reason is None]
+        if dedup is not None:
+            clusters = dedup.assign([(row_xid(window[i][1]), window[i][2]) for i in queries])
+        else:
+            clusters = queries
+        cluster_of = dict(zip(queries, clusters))
+
+        # One API call per cluster that no earlier window has asked about
+        first = {}
+        for position, cluster in cluster_of.items():
+            if cluster not in requested and cluster not in first:
+                first[cluster] = position
+        if dedup is not None:
+            requested.update(first)
+
+        reviews = [window[position][2] for position in first.values()]
+        futures = [executor.submit(_classify_request, reviews[i:i + batch_size], timeout)
+                   for i in range(0, len(reviews), batch_size)]
+        return window, cluster_of, list(first), futures
+
+    def finish_window(window, cluster_of, clusters, futures):
+        # Earlier windows finish first, so labels of clusters they requested are already known
+        labels = dict(zip(clusters, (label for future in futures for label in future.result())))
+        if dedup is not None:
+            dedup.labels.update(labels)
+            labels = dedup.labels
 
         output_data = []
         ignore_data = []
-        total_reviews = len(df)
-        
-        logging.info(f"Starting processing of {total_reviews} reviews...")
-
-        for index, row in df.iterrows():
-            review = str(row['Review']).strip()
-            if not review:
-                continue
-
+        for position, (index, row, review, reason) in enumerate(window):
+            if reason is None:
+                sentiment = labels[cluster_of[position]]
+            else:
+                sentiment = 'ignore'
             duration = row.get('How Long do you stay here', 'N/A')
-            logging.info(f"Processing review {index + 1}/{total_reviews} | Stay Duration: {duration}")
+            logging.info(f"Processed review {index + 1} | Stay Duration: {duration}")
 
-            sentiment = classify_sentiment(review)
-            row_data = row.to_dict()
+            row_data = _to_output_row(row)
 
             if sentiment in ['positive', 'negative']:
                 row_data['Sentiment'] = sentiment
                 output_data.append(row_data)
             else:
-                row_data['Ignore_Reason'] = "Ignored due to unclear sentiment or irrelevant content."
+                row_data['Ignore_Reason'] = reason or "Ignored due to unclear sentiment or irrelevant content."
                 ignore_data.append(row_data)
 
-            if (index + 1) % 10 == 0:
-                logging.info(f"Processed {index + 1}/{total_reviews} reviews")
+        logging.info(f"Processed {window[-1][0] + 1} input rows")
+        return output_data, ignore_data
 
-        ensure_directory_exists(output_file)
-        ensure_directory_exists(ignore_file)
+    window = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        try:
+            for index, row in rows:
+                review = review_text(row)
+                if not review:
+                    continue
 
-        if output_data:
-            result_df = pd.DataFrame(output_data)
-            result_df.to_csv(output_file, index=False, encoding='utf-8')
-            logging.info(f"Saved {len(result_df)} classified reviews to {output_file}")
+                key = review_key(row.get('xid', ''), review)
+                if completed[key] > 0:
+                    completed[key] -= 1
+                    skipped += 1
+                    continue
 
-        if ignore_data:
-            ignore_df = pd.DataFrame(ignore_data)
-            ignore_df.to_csv(ignore_file, index=False, encoding='utf-8')
-            logging.info(f"Saved {len(ignore_df)} ignored reviews to {ignore_file}")
+                reason = prefilter.check(review) if prefilter is not None else None
+                window.append((index, row, review, reason))
+                if len(window) >= window_size:
+                    pending.append(submit_window(window, executor))
+                    window = []
+                    while len(pending) >= MAX_PENDING_WINDOWS:
+                        yield finish_window(*pending.popleft())
+
+            if window:
+                pending.append(submit_window(window, executor))
+            while pending:
+                yield finish_window(*pending.popleft())
+        finally:
+            # A caller that stops early or fails leaves nothing queued behind it
+            for *_, futures in pending:
+                for future in futures:
+                    future.cancel()
+
+    if skipped:
+        logging.info(f"Skipped {skipped} reviews completed in a previous run")
+    if prefilter is not None and prefilter.routed:
+        logging.info(f"Pre-filter routed reviews to ignore without an API call: {dict(prefilter.routed)}")
+
+def process_sentiments(input_file: str, output_file: str, ignore_file: str,
+                       max_workers: int = 1, timeout: float = DEFAULT_TIMEOUT,
+                       batch_size: int = 1, resume: bool = False) -> None:
+    try:
+        completed = load_completed_keys(output_file, ignore_file) if resume else Counter()
+        if completed:
+            logging.info(f"Resuming: {sum(completed.values())} rows already present in outputs will be skipped")
+
+        output_writer = IncrementalCsvWriter(output_file, append=resume)
+        ignore_writer = IncrementalCsvWriter(ignore_file, append=resume)
+
+        logging.info(f"Starting streaming processing of {input_file} with {max_workers} worker(s)...")
+
+        dedup = new_dedup_index()
+        try:
+            for output_data, ignore_data in classify_rows(iter_input_rows(input_file), max_workers=max_workers,
+                                                          timeout=timeout, batch_size=batch_size,
+                                                          completed=completed, dedup=dedup):
+                output_writer.write_rows(output_data)
+                ignore_writer.write_rows(ignore_data)
+        finally:
+            output_writer.close()
+            ignore_writer.close()
+
+        logging.info(f"Saved {output_writer.rows_written} classified reviews to {output_file}")
+        logging.info(f"Saved {ignore_writer.rows_written} ignored reviews to {ignore_file}")
+        write_spam_report(dedup, os.path.join(os.path.dirname(output_file), SPAM_REPORT_FILE))
 
     except Exception as e:
         logging.error(f"Fatal error in process_sentiments: {e}", exc_info=True)
         raise
 
 def main():
+    configure_logging()
     try:
         input_path = os.path.join(os.getcwd(), 'input.csv')
         output_path = os.path.join(os.getcwd(), 'reviews.csv')
@@ -184,13 +578,23 @@ def main():
         output_path = 'reviews.csv'
         ignore_path = 'ignore.csv'
 
+        max_workers = int(os.getenv('SENTIMENT_CONCURRENCY', '1'))
+        timeout = float(os.getenv('SENTIMENT_TIMEOUT', str(DEFAULT_TIMEOUT)))
+        batch_size = int(os.getenv('SENTIMENT_BATCH_SIZE', '1'))
+        resume = env_flag('SENTIMENT_RESUME')
+
         logging.info("Starting sentiment analysis pipeline...")
         start_time = time.time()
         
-        process_sentiments(input_path, output_path, ignore_path)
+        process_sentiments(input_path, output_path, ignore_path, max_workers=max_workers, timeout=timeout,
+                           batch_size=batch_size, resume=resume)
         
         elapsed_time = time.time() - start_time
+        get_metrics().record_stage('sentiment', elapsed_time)
         logging.info(f"Analysis complete! Total processing time: {elapsed_time:.2f} seconds")
+        logging.info(f"LLM cache stats: {get_cache().stats()}")
+        logging.info(f"Sentiment metrics: {get_metrics().summary().get('sentiment', {})}")
+        get_metrics().close()
 
     except Exception as e:
         logging.error(f"Pipeline failed: {e}", exc_info=True)
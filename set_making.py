@@ -1,142 +1,267 @@
 
 
-import csv
+import heapq
+import itertools
+import json
+import os
 import random
 import re
-from collections import defaultdict
+import tempfile
+import pandas as pd
+from artifacts import ChunkedArtifactWriter, artifact_path, find_artifact, iter_records
+from config import env_flag
 
-input_file = 'phrases.csv'
-output_file = 'output_sets.csv'
+# Artifact names; the file format comes from ARTIFACT_FORMAT
+input_artifact = 'phrases'
+dedup_artifact = 'phrases_dedup'
+output_artifact = 'output_sets'
+
+# Sets per project, and the phrase count below which a project gets a single set.
+# Deduplicated phrases count once per row they stand for (their Count column).
+NUM_SETS = int(os.getenv('SETS_COUNT', '4'))
+SINGLE_SET_THRESHOLD = int(os.getenv('SETS_SINGLE_THRESHOLD', '30'))
+
+# Sets are dealt with a per-xid seed so unchanged phrases always give the same
+# sets (and the same cached reviews). SETS_DETERMINISTIC=0 reshuffles every run.
+DETERMINISTIC_SETS = env_flag('SETS_DETERMINISTIC', default=True)
+SETS_SEED = os.getenv('SETS_SEED', '')
+
+# Keywords used to spread phrases about the same rated aspect across sets
+ASPECT_KEYWORDS = {
+    'society_management': ['maintenance', 'management', 'security', 'guard', 'staff', 'society', 'clean'],
+    'green_area': ['green', 'park', 'garden', 'tree', 'lawn', 'open space'],
+    'amenities': ['amenit', 'gym', 'pool', 'club', 'play', 'lift', 'power backup', 'parking', 'water'],
+    'connectivity': ['connect', 'metro', 'road', 'traffic', 'transport', 'school', 'hospital', 'market',
+                     'location', 'airport', 'station', 'highway'],
+    'construction': ['construction', 'quality', 'build', 'wall', 'seepage', 'leak', 'crack', 'finish',
+                     'structure', 'plumbing', 'ventilation']
+}
+
+# Phrase rows sorted in memory at a time before sort_by_xid spills to disk
+SORT_CHUNK_ROWS = 200000
+
+# Output rows collected before they are written out by main()
+WRITE_CHUNK_ROWS = 1000
 
 def extract_years(text):
     match = re.search(r'(\d+)', text)
     return int(match.group(1)) if match else 0
 
-def distribute_phrases_equally(positives, negatives, durations, num_sets=4):
-    """
-    Distribute positive and negative phrases equally across 4 sets
-    """
-    random.shuffle(positives)
-    random.shuffle(negatives)
-    
-    pos_per_set = len(positives) // num_sets
-    neg_per_set = len(negatives) // num_sets
-    
-    pos_remainder = len(positives) % num_sets
-    neg_remainder = len(negatives) % num_sets
-    
-    sets = []
-    pos_index = 0
-    neg_index = 0
-    
-    for set_num in range(num_sets):
-        pos_count = pos_per_set + (1 if set_num < pos_remainder else 0)
-        neg_count = neg_per_set + (1 if set_num < neg_remainder else 0)
-        
-        set_positives = positives[pos_index:pos_index + pos_count]
-        set_negatives = negatives[neg_index:neg_index + neg_count]
-        
-        pos_index += pos_count
-        neg_index += neg_count
-        
-        if not set_positives and not set_negatives:
-            continue
-        
-        formatted_phrases = []
-        formatted_phrases.extend([f"{p} (positive)" for p in set_positives])
-        formatted_phrases.extend([f"{n} (negative)" for n in set_negatives])
-        
-        all_phrases = set_positives + set_negatives
-        durations_list = [durations.get(p, 0) for p in all_phrases]
-        avg_duration = sum(durations_list) / len(durations_list) if durations_list else 0
-        
-        sets.append({
-            'phrases': '; '.join(formatted_phrases),
-            'duration': f"{avg_duration:.1f} Years",
-            'pos_count': len(set_positives),
-            'neg_count': len(set_negatives)
-        })
-    
-    return sets
-
-# ✅ Group only by xid
-data = defaultdict(lambda: {'project_names': set(), 'positives': [], 'negatives': [], 'durations': {}})
-
-with open(input_file, 'r', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        xid = row['xid']
-        phrase = row['Phrase']
-        sentiment = row['Sentiment'].lower()
-        duration = extract_years(row['How Long do you stay here'])
-
-        if 'positive' in sentiment:
-            data[xid]['positives'].append(phrase)
-        elif 'negative' in sentiment:
-            data[xid]['negatives'].append(phrase)
-
-        data[xid]['durations'][phrase] = duration
-        data[xid]['project_names'].add(row['Project name'])
-
-output_rows = []
-
-for xid, sentiments in data.items():
-    positives = sentiments['positives']
-    negatives = sentiments['negatives']
-    durations = sentiments['durations']
-    project_names = ', '.join(sorted(sentiments['project_names']))
-
-    total_phrases = len(positives) + len(negatives)
-    
-    print(f"\n{xid} - {project_names}:")
-    print(f"  Total positives: {len(positives)}")
-    print(f"  Total negatives: {len(negatives)}")
-    print(f"  Total phrases: {total_phrases}")
-    
-    if total_phrases < 30:
-        print(f"  Creating 1 set (less than 40 phrases)")
-        formatted_phrases = []
-        formatted_phrases.extend([f"{p} (positive)" for p in positives])
-        formatted_phrases.extend([f"{n} (negative)" for n in negatives])
-        
-        all_phrases = positives + negatives
-        durations_list = [durations.get(p, 0) for p in all_phrases]
-        avg_duration = sum(durations_list) / len(durations_list) if durations_list else 0
-        
-        sets = [{
-            'phrases': '; '.join(formatted_phrases),
-            'duration': f"{avg_duration:.1f} Years",
-            'pos_count': len(positives),
-            'neg_count': len(negatives)
-        }]
-        
-        print(f"    Set 1: {len(positives)} positives, {len(negatives)} negatives")
-    else:
-        print(f"  Distributing across 4 sets...")
-        sets = distribute_phrases_equally(positives, negatives, durations, 4)
-    
-    for i, set_data in enumerate(sets, 1):
-        print(f"    Set {i}: {set_data['pos_count']} positives, {set_data['neg_count']} negatives")
-    
-    row = [xid, project_names]
-    for set_data in sets:
-        row.append(set_data['phrases'])
-        row.append(set_data['duration'])
-    
-    output_rows.append(row)
-
-# Prepare headers for exactly 4 sets
-headers = ['xid', 'Project name']
-for i in range(1, 5):
-    headers.append(f'Set {i}')
-    headers.append(f'How Long do you stay here {i}')
-
-with open(output_file, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(headers)
-    for row in output_rows:
+def _mentions(occurrences):
+    return sum(count for _, _, count in occurrences)
+
+def _format_set(positives, negatives):
+    """
+    One set from (phrase, years, count) occurrences. Each polarity lists its
+    most-mentioned phrases first, so they survive prompt trimming, and the
+    duration is the average over the rows the occurrences stand for
+    """
+    formatted_phrases = []
+    formatted_phrases.extend([f"{p} (positive)" for p, _, _ in sorted(positives, key=lambda o: -o[2])])
+    formatted_phrases.extend([f"{n} (negative)" for n, _, _ in sorted(negatives, key=lambda o: -o[2])])
+
+    mentions = _mentions(positives) + _mentions(negatives)
+    total_years = sum(years * count for _, years, count in positives + negatives)
+    avg_duration = total_years / mentions if mentions else 0
+
+    return {
+        'phrases': '; '.join(formatted_phrases),
+        'duration': f"{avg_duration:.1f} Years",
+        'pos_count': _mentions(positives),
+        'neg_count': _mentions(negatives)
+    }
+
+def aspect_of(phrase):
+    text = phrase.lower()
+    for aspect, keywords in ASPECT_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return aspect
+    return 'other'
+
+def set_rng(xid, deterministic=None):
+    """Random generator for one xid's sets, seeded from the xid unless determinism is off."""
+    if deterministic is None:
+        deterministic = DETERMINISTIC_SETS
+    return random.Random(f"{SETS_SEED}:{xid}") if deterministic else random.Random()
+
+def _deal(occurrences, buckets, years_totals, rng):
+    """
+    Deal one polarity's occurrences into the buckets a round at a time. The
+    occurrences are ordered by aspect, so each round of len(buckets) spreads
+    one aspect over every set; within a round the longest stays go to the
+    sets with the smallest duration total. A final partial round goes to the
+    sets holding the fewest phrases so far.
+    """
+    occurrences = sorted(occurrences)
+    rng.shuffle(occurrences)
+    occurrences.sort(key=lambda occurrence: aspect_of(occurrence[0]))
+
+    num_sets = len(buckets)
+    for start in range(0, len(occurrences), num_sets):
+        round_items = sorted(occurrences[start:start + num_sets], key=lambda occurrence: -occurrence[1])
+        targets = sorted(range(num_sets), key=lambda i: (len(buckets[i][0]) + len(buckets[i][1]), i))
+        targets = sorted(targets[:len(round_items)], key=lambda i: (years_totals[i], i))
+        for index, occurrence in zip(targets, round_items):
+            yield index, occurrence
+            years_totals[index] += occurrence[1]
+
+def distribute_phrases_equally(positives, negatives, num_sets=NUM_SETS, rng=None):
+    """
+    Distribute positive and negative (phrase, years, count) occurrences across
+    num_sets sets so that every set gets the same number of each polarity
+    (give or take one), a share of every aspect and a similar average stay
+    """
+    rng = rng or random.Random()
+    buckets = [([], []) for _ in range(num_sets)]
+    years_totals = [0] * num_sets
+
+    for polarity, occurrences in enumerate((positives, negatives)):
+        for index, occurrence in _deal(occurrences, buckets, years_totals, rng):
+            buckets[index][polarity].append(occurrence)
+
+    return [_format_set(set_positives, set_negatives) for set_positives, set_negatives in buckets
+            if set_positives or set_negatives]
+
+def build_sets(positives, negatives, rng=None, num_sets=NUM_SETS, threshold=SINGLE_SET_THRESHOLD):
+    """
+    Build the sets for one xid: a single set for small projects, otherwise
+    the phrases are spread across num_sets sets. Project size is the number
+    of phrase rows, so deduplication does not shrink the number of sets
+    """
+    total_phrases = _mentions(positives) + _mentions(negatives)
+
+    if total_phrases < threshold:
+        return [_format_set(positives, negatives)]
+
+    return distribute_phrases_equally(positives, negatives, num_sets, rng=rng)
+
+def _spill(rows, directory):
+    fd, path = tempfile.mkstemp(suffix='.jsonl', dir=directory)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    return path
+
+def _read_spill(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+def sort_by_xid(rows, chunk_size=SORT_CHUNK_ROWS):
+    """
+    Order phrase rows by xid, keeping the input order within each xid.
+    Inputs up to chunk_size rows are sorted in memory; larger ones are
+    sorted in runs that are spilled to temp files and merged back.
+    """
+    rows = ((str(row['xid']), position, dict(row)) for position, row in enumerate(rows))
+    chunk = list(itertools.islice(rows, chunk_size))
+    chunk.sort(key=lambda entry: entry[:2])
+    if len(chunk) < chunk_size:
+        for _, _, row in chunk:
+            yield row
+        return
+
+    with tempfile.TemporaryDirectory(prefix='set_making_') as directory:
+        runs = []
+        while chunk:
+            runs.append(_spill(chunk, directory))
+            chunk = list(itertools.islice(rows, chunk_size))
+            chunk.sort(key=lambda entry: entry[:2])
+
+        for _, _, row in heapq.merge(*(_read_spill(path) for path in runs), key=lambda entry: entry[:2]):
+            yield row
+
+def _count(row):
+    count = row.get('Count')
+    try:
+        return max(int(float(count)), 1)
+    except (TypeError, ValueError):
+        return 1
+
+def iter_groups(rows):
+    """
+    Yield (xid, project names, positives, negatives) for each run of rows
+    with the same xid, where positives and negatives are lists of
+    (phrase, years, count) occurrences; count comes from phrase_dedup.py's
+    Count column and is 1 for raw phrases. Rows must be grouped by xid; an xid that
+    shows up again after its group closed raises ValueError.
+    """
+    closed = set()
+    for xid, group in itertools.groupby(rows, key=lambda row: str(row['xid'])):
+        if xid in closed:
+            raise ValueError(f"Phrase rows are not grouped by xid: {xid} appears more than once")
+        closed.add(xid)
+
+        project_names = set()
+        positives = []
+        negatives = []
+        for row in group:
+            sentiment = row['Sentiment'].lower()
+            occurrence = (row['Phrase'], extract_years(row['How Long do you stay here']), _count(row))
+            if 'positive' in sentiment:
+                positives.append(occurrence)
+            elif 'negative' in sentiment:
+                negatives.append(occurrence)
+            project_names.add(row['Project name'])
+
+        yield xid, project_names, positives, negatives
+
+def output_headers(num_sets=NUM_SETS):
+    # Prepare headers for exactly NUM_SETS sets
+    headers = ['xid', 'Project name']
+    for i in range(1, num_sets + 1):
+        headers.append(f'Set {i}')
+        headers.append(f'How Long do you stay here {i}')
+    return headers
+
+def iter_sets(rows, presorted=False):
+    """
+    Stream one output row (dict keyed by output_headers()) per xid, emitted as
+    soon as the xid's group closes. With presorted the rows must already be
+    grouped by xid and memory stays bounded by the largest project; otherwise
+    they go through sort_by_xid first.
+    """
+    headers = output_headers()
+    if not presorted:
+        rows = sort_by_xid(rows)
+
+    for xid, project_names, positives, negatives in iter_groups(rows):
+        sets = build_sets(positives, negatives, rng=set_rng(xid))
+
+        row = [xid, ', '.join(sorted(project_names))]
+        for set_data in sets:
+            row.append(set_data['phrases'])
+            row.append(set_data['duration'])
         row += [''] * (len(headers) - len(row))  # pad missing columns
-        writer.writerow(row)
 
-print(f"\nOutput saved to {output_file}")
+        yield dict(zip(headers, row))
+
+def make_sets(rows, presorted=False):
+    """
+    Turn phrase rows into one output row (dict keyed by output_headers()) per xid
+    """
+    return list(iter_sets(rows, presorted=presorted))
+
+def _input_file():
+    # Prefer phrase_dedup.py's output unless phrases were extracted again after it
+    phrases_file = find_artifact(input_artifact)
+    dedup_file = find_artifact(dedup_artifact)
+    if os.path.exists(dedup_file) and (not os.path.exists(phrases_file)
+                                       or os.path.getmtime(dedup_file) >= os.path.getmtime(phrases_file)):
+        return dedup_file
+    return phrases_file
+
+def main():
+    output_file = artifact_path(output_artifact)
+    writer = ChunkedArtifactWriter(output_file, columns=output_headers())
+
+    presorted = env_flag('SETS_PRESORTED')
+    output_rows = iter_sets(iter_records(_input_file()), presorted=presorted)
+    while chunk := list(itertools.islice(output_rows, WRITE_CHUNK_ROWS)):
+        writer.write(pd.DataFrame(chunk, columns=output_headers()))
+    writer.close()
+
+    print(f"\nOutput saved to {output_file} ({writer.rows_written} projects)")
 
+if __name__ == "__main__":
+    main()
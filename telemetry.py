@@ -0,0 +1,256 @@
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from config import env_flag
+
+DEFAULT_METRICS_PATH = 'pipeline_metrics.jsonl'
+# The /metrics endpoint is local-only unless METRICS_HOST says otherwise
+DEFAULT_METRICS_HOST = '127.0.0.1'
+
+# USD per million (input, output) tokens. Generation uses the Gemini 2.0 Flash
+# list price; sentiment and phrases call self-hosted endpoints. Override with
+# <STAGE>_INPUT_USD_PER_MTOK and <STAGE>_OUTPUT_USD_PER_MTOK.
+DEFAULT_PRICES = {'generation': (0.10, 0.40)}
+
+# Upper bounds (seconds) of the per-call latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """
+    Local estimate of LLM input tokens: one per punctuation mark and one
+    per started four characters of a word. Close enough to the real
+    tokenizers for budgeting, without a count_tokens API call.
+    """
+    return sum((len(token) + 3) // 4 for token in _TOKEN_PATTERN.findall(text or ''))
+
+def usage_tokens(response_data: Dict, prompt_text: str, result_text: str):
+    """
+    (input, output) tokens from an OpenAI-style 'usage' block of an API
+    response, estimated locally for whatever the endpoint does not report.
+    """
+    usage = response_data.get('usage') if isinstance(response_data, dict) else None
+    usage = usage if isinstance(usage, dict) else {}
+    return (int(usage.get('prompt_tokens') or count_tokens(prompt_text)),
+            int(usage.get('completion_tokens') or count_tokens(result_text)))
+
+def stage_prices(stage: str):
+    """(input, output) USD per million tokens for a stage's LLM calls."""
+    default_input, default_output = DEFAULT_PRICES.get(stage, (0.0, 0.0))
+    prefix = stage.upper()
+    return (float(os.getenv(f'{prefix}_INPUT_USD_PER_MTOK', default_input)),
+            float(os.getenv(f'{prefix}_OUTPUT_USD_PER_MTOK', default_output)))
+
+class _Series:
+    """Counters and latency histogram for one (stage, key) pair."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+class Metrics:
+    """
+    Per-stage, per-API-key telemetry for LLM calls: call counts, errors,
+    retries, cache hits, input/output tokens, their cost (see stage_prices)
+    and a latency histogram, plus the wall-clock time of each stage. Every event is appended to a JSONL
+    file as it happens; summary() and prometheus_text() aggregate them.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_METRICS_PATH, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._series = defaultdict(_Series)
+        self._stages = {}
+        self._prices = {}
+        self._file = None
+        self._server = None
+
+        if self.enabled and path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(path, 'a', encoding='utf-8', buffering=1)
+
+    def _emit(self, event: Dict) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    def record_call(self, stage: str, seconds: float, key: str = 'default', input_tokens: int = 0,
+                    output_tokens: int = 0, status: str = 'ok') -> None:
+        """One API call: its latency, token usage and status ('ok' or an error kind)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if stage not in self._prices:
+                self._prices[stage] = stage_prices(stage)
+            input_price, output_price = self._prices[stage]
+            cost = (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+            series = self._series[stage, key]
+            series.calls += 1
+            series.errors += status != 'ok'
+            series.input_tokens += input_tokens
+            series.output_tokens += output_tokens
+            series.cost_usd += cost
+            series.latency_sum += seconds
+            series.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self._emit({'ts': time.time(), 'event': 'call', 'stage': stage, 'key': key,
+                        'seconds': round(seconds, 4), 'input_tokens': input_tokens,
+                        'output_tokens': output_tokens, 'cost_usd': round(cost, 8), 'status': status})
+
+    def record_retry(self, stage: str, key: str = 'default', reason: str = '') -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._series[stage, key].retries += 1
+            self._emit({'ts': time.time(), 'event': 'retry', 'stage': stage, 'key': key, 'reason': reason})
+
+    def record_cache_hit(self, stage: str) -> None:
+        # Hits are only counted; logging each one would dwarf the real calls
+        if not self.enabled:
+            return
+        with self._lock:
+            self._series[stage, 'cache'].cache_hits += 1
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        """Wall-clock time of a whole stage, used for its throughput."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stages[stage] = self._stages.get(stage, 0.0) + seconds
+            self._emit({'ts': time.time(), 'event': 'stage', 'stage': stage, 'seconds': round(seconds, 4)})
+
+    def summary(self) -> Dict[str, Dict]:
+        """Totals per stage, with calls/second over the stage wall-clock when known."""
+        with self._lock:
+            totals = {}
+            for (stage, _), series in self._series.items():
+                total = totals.setdefault(stage, {'calls': 0, 'errors': 0, 'retries': 0, 'cache_hits': 0,
+                                                  'input_tokens': 0, 'output_tokens': 0, 'cost_usd': 0.0,
+                                                  'api_seconds': 0.0})
+                total['calls'] += series.calls
+                total['errors'] += series.errors
+                total['retries'] += series.retries
+                total['cache_hits'] += series.cache_hits
+                total['input_tokens'] += series.input_tokens
+                total['output_tokens'] += series.output_tokens
+                total['cost_usd'] += series.cost_usd
+                total['api_seconds'] += series.latency_sum
+
+            for stage, seconds in self._stages.items():
+                total = totals.setdefault(stage, {'calls': 0})
+                total['wall_seconds'] = round(seconds, 3)
+                total['calls_per_second'] = round(total['calls'] / seconds, 3) if seconds > 0 else 0.0
+            for total in totals.values():
+                if 'api_seconds' in total:
+                    total['api_seconds'] = round(total['api_seconds'], 3)
+                    total['cost_usd'] = round(total['cost_usd'], 6)
+            return totals
+
+    def prometheus_text(self) -> str:
+        """Current counters in the Prometheus text exposition format."""
+        lines = []
+        counters = [('calls', 'LLM API calls'), ('errors', 'LLM API calls that failed'),
+                    ('retries', 'LLM API calls that were retried'), ('cache_hits', 'LLM cache hits'),
+                    ('input_tokens', 'LLM input tokens'), ('output_tokens', 'LLM output tokens'),
+                    ('cost_usd', 'Estimated LLM cost in USD')]
+        with self._lock:
+            for field, help_text in counters:
+                lines.append(f"# HELP pipeline_llm_{field}_total {help_text}")
+                lines.append(f"# TYPE pipeline_llm_{field}_total counter")
+                for (stage, key), series in sorted(self._series.items()):
+                    lines.append(f'pipeline_llm_{field}_total{{stage="{stage}",key="{key}"}} {getattr(series, field)}')
+
+            lines.append("# HELP pipeline_llm_call_seconds LLM API call latency")
+            lines.append("# TYPE pipeline_llm_call_seconds histogram")
+            for (stage, key), series in sorted(self._series.items()):
+                if not series.calls:
+                    continue
+                labels = f'stage="{stage}",key="{key}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), series.buckets):
+                    cumulative += count
+                    lines.append(f'pipeline_llm_call_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'pipeline_llm_call_seconds_sum{{{labels}}} {series.latency_sum:.6f}')
+                lines.append(f'pipeline_llm_call_seconds_count{{{labels}}} {series.calls}')
+
+            lines.append("# HELP pipeline_stage_seconds Wall-clock time spent in each stage")
+            lines.append("# TYPE pipeline_stage_seconds gauge")
+            for stage, seconds in sorted(self._stages.items()):
+                lines.append(f'pipeline_stage_seconds{{stage="{stage}"}} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = DEFAULT_METRICS_HOST) -> None:
+        """Expose prometheus_text() at http://host:port/metrics from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logging.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+
+    def log_summary(self) -> None:
+        for stage, total in self.summary().items():
+            logging.info(f"Metrics {stage}: {total}")
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        if self._file is not None:
+            summary = self.summary()
+            with self._lock:
+                self._emit({'ts': time.time(), 'event': 'summary', 'stages': summary})
+                self._file.close()
+                self._file = None
+
+_shared_metrics = None
+_shared_metrics_lock = threading.Lock()
+
+def get_metrics() -> Metrics:
+    """
+    Return the process-wide metrics recorder, configured from METRICS_PATH,
+    METRICS_DISABLED (set to 1 to opt out) and METRICS_PORT (serve a
+    Prometheus /metrics endpoint on that port of METRICS_HOST, 127.0.0.1 by
+    default).
+    """
+    global _shared_metrics
+    with _shared_metrics_lock:
+        if _shared_metrics is None:
+            disabled = env_flag('METRICS_DISABLED')
+            _shared_metrics = Metrics(path=os.getenv('METRICS_PATH', DEFAULT_METRICS_PATH), enabled=not disabled)
+            port = os.getenv('METRICS_PORT')
+            if port and not disabled:
+                _shared_metrics.serve(int(port), os.getenv('METRICS_HOST', DEFAULT_METRICS_HOST))
+        return _shared_metrics
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def isolated_workdir(tmp_path, monkeypatch):
+    # Stages read and write their artifacts, caches and quota state in the cwd
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('LLM_CACHE_DISABLED', '1')
+    monkeypatch.setenv('METRICS_DISABLED', '1')
+    return tmp_path
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from artifacts import ChunkedArtifactWriter, iter_artifact_chunks, iter_records
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_chunks_with_changing_column_types_share_one_schema(tmp_path, fmt):
+    path = str(tmp_path / f"output_sets.{fmt}")
+    writer = ChunkedArtifactWriter(path, columns=['xid', 'Set 4'])
+    writer.write(pd.DataFrame({'xid': [101, 102], 'Set 4': [np.nan, np.nan]}))
+    writer.write(pd.DataFrame({'xid': ['A4', 'B7'], 'Set 4': ['good park (positive)', np.nan]}))
+    writer.close()
+
+    assert writer.rows_written == 4
+    assert [row['xid'] for row in iter_records(path)] == ['101', '102', 'A4', 'B7']
+    assert [row['Set 4'] for row in iter_records(path)] == ['', '', 'good park (positive)', '']
+
+
+def test_csv_chunks_are_read_as_text(tmp_path):
+    csv_path = tmp_path / 'phrases.csv'
+    csv_path.write_text('xid,Count\n1,2\n2,\nA4,3\n', encoding='utf-8')
+
+    parquet_path = str(tmp_path / 'phrases.parquet')
+    writer = ChunkedArtifactWriter(parquet_path)
+    for chunk in iter_artifact_chunks(str(csv_path), chunk_size=1):
+        writer.write(chunk)
+    writer.close()
+
+    assert [(row['xid'], row['Count']) for row in iter_records(parquet_path)] == [('1', '2'), ('2', ''), ('A4', '3')]
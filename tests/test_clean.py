@@ -0,0 +1,37 @@
+import json
+from collections import Counter
+
+import pandas as pd
+
+from clean import OUTPUT_COLUMNS, flatten_reviews, flatten_reviews_file
+
+REVIEW = json.dumps({'positive_review': 'Green and quiet.', 'negative_review': 'Parking is tight.',
+                     'society_management': '4', 'green_area': '5', 'amenities': '3', 'connectivity': '4',
+                     'construction': '3', 'overall': '3.8', 'duration_of_stay': '2 Years'})
+
+STRUCTURED = pd.DataFrame({
+    'xid': ['1', '2', '3'],
+    'Project name': ['Green Acres', 'Blue Towers', 'Red Court'],
+    'Review 1': [REVIEW, 'Generation failed: not json', REVIEW],
+    'Review 2': ['{"positive_review": "cut off', '', '["not", "an", "object"]'],
+})
+
+
+def test_parse_failures_are_counted_per_column():
+    failures = Counter()
+    flat = flatten_reviews(STRUCTURED, failures)
+
+    assert failures == {'Review 1': 1, 'Review 2': 2}
+    assert list(flat.columns) == OUTPUT_COLUMNS
+    assert flat['xid'].tolist() == ['1', '3']
+    assert flat['overall_rating'].tolist() == ['3.8', '3.8']
+
+
+def test_file_failures_add_up_across_chunks():
+    STRUCTURED.to_csv('structured_reviews.csv', index=False)
+
+    projects, reviews, failures = flatten_reviews_file('structured_reviews.csv', 'processed_reviews.csv',
+                                                       chunk_size=1)
+
+    assert (projects, reviews) == (3, 2)
+    assert failures == {'Review 1': 1, 'Review 2': 2}
@@ -0,0 +1,11 @@
+import pytest
+
+from config import env_flag
+
+
+@pytest.mark.parametrize('value, default, expected', [
+    ('1', False, True), ('Yes', False, True), ('0', True, False), ('no', True, False),
+    ('', True, True), ('maybe', False, False), ('maybe', True, True)])
+def test_env_flag(monkeypatch, value, default, expected):
+    monkeypatch.setenv('SOME_FLAG', value)
+    assert env_flag('SOME_FLAG', default=default) is expected
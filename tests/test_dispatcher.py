@@ -0,0 +1,99 @@
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+from review_generation import GeminiDispatcher, GeminiReviewGenerator, generate_reviews, prepare_project_set
+
+LIMITS = {'max_requests_per_minute': 1000, 'max_requests_per_day': 1000, 'max_tokens_per_minute': None}
+
+
+class FakeClient:
+    """Stands in for GeminiKeyClient; keys listed in `failing` raise once per item."""
+
+    calls = []
+    failing = set()
+    _lock = threading.Lock()
+
+    def __init__(self, api_key, model_name, rate_limiter=None):
+        self.api_key = api_key
+
+    def generate(self, system_instruction, message):
+        with self._lock:
+            FakeClient.calls.append((self.api_key, message))
+        if self.api_key in FakeClient.failing:
+            raise RuntimeError("quota exceeded")
+        return json.dumps({
+            'positive_review': f"Generated by {self.api_key}", 'negative_review': message.splitlines()[0],
+            'society_management': '4', 'green_area': '3', 'amenities': '4', 'connectivity': '5',
+            'construction': '3', 'overall': '3.8', 'duration_of_stay': '2 Years'
+        })
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    monkeypatch.setenv('GEMINI_API_KEY_1', 'key-one')
+    monkeypatch.setenv('GEMINI_API_KEY_2', 'key-two')
+    monkeypatch.delenv('GEMINI_API_KEY_3', raising=False)
+    FakeClient.calls = []
+    FakeClient.failing = set()
+    return GeminiReviewGenerator()
+
+
+def _items(count):
+    return [(prepare_project_set(f"Project {i}", 'good park (positive); noisy road (negative)', '2 Years', 1),
+             f"Project {i}", 1) for i in range(count)]
+
+
+def test_dispatcher_spreads_items_over_keys_in_order(generator):
+    dispatcher = GeminiDispatcher(generator, client_factory=FakeClient, rate_limits=LIMITS)
+    results = dispatcher.generate_all(_items(6))
+
+    assert [f"'Project {i}'" in json.loads(result)['negative_review'] for i, result in enumerate(results)] == [True] * 6
+    assert {key for key, _ in FakeClient.calls} == {'key-one', 'key-two'}
+
+
+def test_failed_key_is_retried_on_another_key(generator):
+    FakeClient.failing = {'key-one'}
+    dispatcher = GeminiDispatcher(generator, client_factory=FakeClient, rate_limits=LIMITS, max_attempts=3)
+    results = dispatcher.generate_all(_items(4))
+
+    assert all(json.loads(result)['positive_review'] == 'Generated by key-two' for result in results)
+
+
+def test_resume_skips_projects_already_written(generator):
+    df = pd.DataFrame({'xid': ['1', '2'], 'Project name': ['Green Acres', 'Blue Towers'],
+                       'Set 1': ['good park (positive)', 'noisy road (negative)'],
+                       'How Long do you stay here 1': ['2.0 Years', '1.0 Years']})
+    dispatcher = GeminiDispatcher(generator, client_factory=FakeClient, rate_limits=LIMITS)
+    generate_reviews(df.iloc[:1], 'structured_reviews.csv', gen=generator, dispatcher=dispatcher)
+    assert len(FakeClient.calls) == 1
+
+    FakeClient.calls = []
+    rows = generate_reviews(df, 'structured_reviews.csv', gen=generator, dispatcher=dispatcher, resume=True)
+    assert [row['xid'] for row in rows] == ['2']
+    assert len(FakeClient.calls) == 1
+    assert pd.read_csv('structured_reviews.csv', dtype=str)['xid'].tolist() == ['1', '2']
+
+
+def test_exhausted_quota_stops_the_run_and_resume_regenerates_the_rest(generator):
+    df = pd.DataFrame({'xid': [str(i) for i in range(5)], 'Project name': [f"Project {i}" for i in range(5)],
+                       'Set 1': ['good park (positive)'] * 5, 'How Long do you stay here 1': ['2.0 Years'] * 5})
+    tiny = dict(LIMITS, max_requests_per_day=3)
+    dispatcher = GeminiDispatcher(generator, api_keys=['key-one'], client_factory=FakeClient, rate_limits=tiny)
+    rows = generate_reviews(df, 'structured_reviews.csv', gen=generator, dispatcher=dispatcher)
+
+    assert dispatcher.quota_exhausted
+    assert [row['xid'] for row in rows] == ['0', '1', '2']
+    assert pd.read_csv('structured_reviews.csv', dtype=str)['xid'].tolist() == ['0', '1', '2']
+
+    FakeClient.calls = []
+    dispatcher = GeminiDispatcher(generator, api_keys=['key-two'], client_factory=FakeClient, rate_limits=LIMITS)
+    rows = generate_reviews(df, 'structured_reviews.csv', gen=generator, dispatcher=dispatcher, resume=True)
+    assert [row['xid'] for row in rows] == ['3', '4']
+    assert len(FakeClient.calls) == 2
+    written = pd.read_csv('structured_reviews.csv', dtype=str)
+    assert written['xid'].tolist() == ['0', '1', '2', '3', '4']
+    assert not written['Review 1'].str.contains('Generation failed').any()
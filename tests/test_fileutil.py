@@ -0,0 +1,19 @@
+import pytest
+
+from fileutil import atomic_open
+
+
+def test_atomic_open_keeps_the_old_file_when_writing_fails(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('old', encoding='utf-8')
+    with pytest.raises(RuntimeError):
+        with atomic_open(str(path), encoding='utf-8') as f:
+            f.write('partial')
+            raise RuntimeError("crash")
+
+    assert path.read_text(encoding='utf-8') == 'old'
+    assert [p.name for p in tmp_path.iterdir()] == ['state.json']
+
+    with atomic_open(str(path), encoding='utf-8') as f:
+        f.write('new')
+    assert path.read_text(encoding='utf-8') == 'new'
@@ -0,0 +1,49 @@
+import llm_cache
+from llm_cache import LLMCache
+
+
+def _sum_size(cache):
+    return cache._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+
+def test_eviction_keeps_cache_under_budget(tmp_path):
+    cache = LLMCache(path=str(tmp_path / 'cache.sqlite'), max_size_bytes=1000)
+    for i in range(100):
+        cache.set(cache.make_key('model', 'system', f'prompt {i}', 0.0), 'x' * 50)
+
+    assert cache.stats()['size_bytes'] <= 1000
+    assert cache._total_size == _sum_size(cache)
+    cache.close()
+
+
+def test_recently_read_entry_survives_eviction(tmp_path, monkeypatch):
+    # Keep the hit queued so eviction has to flush it first
+    monkeypatch.setattr(llm_cache, 'TOUCH_BATCH', 1000)
+    cache = LLMCache(path=str(tmp_path / 'cache.sqlite'), max_size_bytes=1000)
+    keep = cache.make_key('model', 'system', 'prompt keep', 0.0)
+    cache.set(keep, 'k' * 50)
+    for i in range(10):
+        cache.set(cache.make_key('model', 'system', f'prompt {i}', 0.0), 'x' * 50)
+
+    assert cache.get(keep) == 'k' * 50
+    for i in range(10, 20):
+        cache.set(cache.make_key('model', 'system', f'prompt {i}', 0.0), 'x' * 50)
+
+    assert cache.get(keep) == 'k' * 50
+    assert cache.get(cache.make_key('model', 'system', 'prompt 0', 0.0)) is None
+    cache.close()
+
+
+def test_replacing_an_entry_updates_the_running_size(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = LLMCache(path=path, max_size_bytes=10_000)
+    key = cache.make_key('model', 'system', 'prompt', 0.0)
+    cache.set(key, 'a' * 100)
+    cache.set(key, 'b' * 30)
+    assert cache._total_size == _sum_size(cache) == 30
+    cache.close()
+
+    reopened = LLMCache(path=path, max_size_bytes=10_000)
+    assert reopened._total_size == 30
+    assert reopened.get(key) == 'b' * 30
+    reopened.close()
@@ -0,0 +1,21 @@
+from manifest import PipelineManifest
+
+
+def test_manifest_round_trip_reports_only_changes(tmp_path):
+    path = str(tmp_path / 'pipeline_manifest.json')
+    manifest = PipelineManifest(path)
+    manifest.record_reviews('1', ['r1', 'r2'])
+    manifest.record_reviews('2', ['r3'])
+    manifest.record_sets('1', {1: PipelineManifest.set_hash('good park (positive)', '2.0 Years')})
+    manifest.save()
+
+    reloaded = PipelineManifest(path)
+    assert reloaded.xids == manifest.xids
+    # Review order does not matter; a new review or a vanished xid does
+    assert reloaded.changed_xids({'1': ['r2', 'r1'], '3': ['r4']}) == {'2', '3'}
+    assert reloaded.changed_sets('1', {1: PipelineManifest.set_hash('good park (positive)', '2.0 Years'),
+                                       2: PipelineManifest.set_hash('noisy road (negative)', '1.0 Years')}) == {2}
+
+    reloaded.forget('2')
+    reloaded.save()
+    assert '2' not in PipelineManifest(path).xids
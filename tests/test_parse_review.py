@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from review_generation import SET_PERSONAS, GeminiReviewGenerator, PromptRegistry, prepare_project_set
+
+REVIEW = {'positive_review': 'Green and quiet.', 'negative_review': 'Parking is tight.',
+          'society_management': '4', 'green_area': '5', 'amenities': '3', 'connectivity': '4',
+          'construction': '3', 'overall': '3.8', 'duration_of_stay': '2 Years'}
+
+
+@pytest.fixture
+def parse():
+    # parse_review_response does not touch the generator's keys or clients
+    project_set = prepare_project_set('Green Acres', 'good park (positive)', '3.0 Years', 1)
+    return lambda review: json.loads(GeminiReviewGenerator.parse_review_response(None, json.dumps(review),
+                                                                                 project_set))
+
+
+def test_valid_review_is_returned_unchanged(parse):
+    assert parse(REVIEW) == REVIEW
+
+
+def test_valid_review_with_empty_fields_gets_the_defaults(parse):
+    review = parse(dict(REVIEW, positive_review='', negative_review='', overall='', duration_of_stay=''))
+
+    assert review['positive_review'] == 'No specific positive aspects mentioned.'
+    assert review['negative_review'] == 'No specific negative aspects mentioned.'
+    assert review['overall'] == '3.8'
+    assert review['duration_of_stay'] == '3.0 Years'
+
+
+def test_not_applicable_overall_stays(parse):
+    assert parse(dict(REVIEW, overall='n.a.'))['overall'] == 'N.A.'
+
+
+def test_personas_cycle_over_the_sets(tmp_path):
+    registry = PromptRegistry(str(tmp_path / 'prompts.json'))
+    assert [registry.persona_for_set(n) for n in range(1, 10)] == [SET_PERSONAS[(n - 1) % 4] for n in range(1, 10)]
+    assert registry.persona_for_set(5) == registry.persona_for_set(1) == 'system_instruction_review_generator_resident'
+
+    registry = PromptRegistry(str(tmp_path / 'prompts.json'), set_personas=['calm', 'blunt', 'brief'])
+    assert [registry.persona_for_set(n) for n in range(1, 8)] == ['calm', 'blunt', 'brief'] * 2 + ['calm']
+    with pytest.raises(ValueError):
+        PromptRegistry(str(tmp_path / 'prompts.json'), set_personas=[])
@@ -0,0 +1,32 @@
+import pandas as pd
+
+import phrases_extraction
+from artifacts import iter_records
+
+
+def test_output_is_flushed_per_review_not_per_phrase(monkeypatch):
+    monkeypatch.setattr(phrases_extraction, 'extract_phrases',
+                        lambda review, sentiment: [{'Phrase': word, 'Sentiment': sentiment} for word in review.split()])
+    written = []
+    original = phrases_extraction.ChunkedArtifactWriter.write
+    monkeypatch.setattr(phrases_extraction.ChunkedArtifactWriter, 'write',
+                        lambda self, df: written.append(len(df)) or original(self, df))
+
+    pd.DataFrame({'xid': ['1', '1', '2'], 'How Long do you stay here': ['2 years'] * 3,
+                  'Project name': ['Green Acres'] * 3, 'Review': ['good park', 'noisy road', 'clean lifts'],
+                  'Sentiment': ['Positive', 'Negative', 'Positive']}).to_csv('reviews.csv', index=False)
+    phrases_extraction.process_phrases('reviews.csv', 'phrases.parquet', flush_every=2)
+
+    assert written == [4, 2]
+    assert [row['Phrase'] for row in iter_records('phrases.parquet')] == ['good', 'park', 'noisy', 'road',
+                                                                          'clean', 'lifts']
+
+
+def test_session_pool_grows_for_a_larger_caller(monkeypatch):
+    monkeypatch.setattr(phrases_extraction, '_session', None)
+    monkeypatch.setattr(phrases_extraction, '_session_pool_size', 0)
+    session = phrases_extraction.get_session(pool_size=1)
+    assert phrases_extraction.get_session(pool_size=8) is session
+    assert session.get_adapter('http://example.com')._pool_maxsize == 8
+    phrases_extraction.get_session(pool_size=2)
+    assert session.get_adapter('http://example.com')._pool_maxsize == 8
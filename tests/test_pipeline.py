@@ -0,0 +1,90 @@
+import json
+
+import pandas as pd
+
+import pipeline
+import review_generation
+from artifacts import read_artifact
+from manifest import DEFAULT_MANIFEST_PATH, PipelineManifest
+
+
+def _input(rows):
+    pd.DataFrame(rows, columns=['xid', 'Project name', 'How Long do you stay here', 'Review']).to_csv(
+        'input.csv', index=False)
+
+
+def test_run_without_phrases_leaves_empty_outputs():
+    # Every review is too short for the pre-filter, so nothing reaches an API
+    _input([['1', 'Green Acres', '2 years', 'ok'], ['2', 'Blue Towers', '1 year', 'nice']])
+    pd.DataFrame({'xid': ['9'], 'project_name': ['Old'], 'positive': ['stale']}).to_csv('processed_reviews.csv')
+    pd.DataFrame({'xid': ['9'], 'Project name': ['Old'], 'Review 1': ['{}']}).to_csv('structured_reviews.csv')
+
+    pipeline.run_pipeline('input.csv')
+
+    assert read_artifact('processed_reviews.csv').empty
+    assert read_artifact('structured_reviews.csv').empty
+    assert len(read_artifact('ignore.csv')) == 2
+
+
+def test_concurrent_generation_uses_a_dispatcher(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'key-one')
+    _input([['1', 'Green Acres', '2 years', 'The park is lovely and well kept by the society']])
+    monkeypatch.setattr(pipeline.sentiment, 'classify_rows',
+                        lambda rows, **kwargs: iter([([dict(row, Sentiment='positive') for _, row in rows], [])]))
+    monkeypatch.setattr(pipeline.phrases_extraction, 'extract_phrase_rows', lambda rows, max_workers: [
+        {'xid': row['xid'], 'How Long do you stay here': row['How Long do you stay here'],
+         'Project name': row['Project name'], 'Phrase': 'lovely park', 'Sentiment': 'positive'} for row in rows])
+    calls = []
+    monkeypatch.setattr(review_generation, 'generate_reviews',
+                        lambda df, output_file, gen=None, dispatcher=None, **kwargs: calls.append(dispatcher) or
+                        [{'xid': '1', 'Project name': 'Green Acres', 'Review 1': ''}])
+
+    pipeline.run_pipeline('input.csv', concurrent_generation=True, workers_per_key=3)
+
+    [dispatcher] = calls
+    assert isinstance(dispatcher, review_generation.GeminiDispatcher)
+    assert dispatcher.workers_per_key == 3
+
+
+class FlakyGenerator:
+    """Fails the first request for Blue Towers, then answers every request."""
+
+    def __init__(self):
+        self.calls = []
+
+    def generate_review(self, project_set, project_name, set_number):
+        self.calls.append(project_name)
+        if project_name == 'Blue Towers' and self.calls.count(project_name) == 1:
+            raise RuntimeError('503 unavailable')
+        return json.dumps({'positive_review': f'{project_name} is pleasant', 'negative_review': 'Parking is tight',
+                           'society_management': '4', 'green_area': '4', 'amenities': '4', 'connectivity': '4',
+                           'construction': '4', 'overall': '4', 'duration_of_stay': '2 years'})
+
+
+def test_incremental_run_regenerates_only_failed_sets(monkeypatch):
+    _input([['1', 'Green Acres', '2 years', 'The park is lovely and well kept by the society'],
+            ['2', 'Blue Towers', '1 year', 'The gym is modern and the lifts are quick']])
+    monkeypatch.setattr(pipeline.sentiment, 'classify_rows',
+                        lambda rows, **kwargs: iter([([dict(row, Sentiment='positive') for _, row in rows], [])]))
+    monkeypatch.setattr(pipeline.phrases_extraction, 'extract_phrase_rows', lambda rows, max_workers: [
+        {'xid': row['xid'], 'How Long do you stay here': row['How Long do you stay here'],
+         'Project name': row['Project name'], 'Phrase': 'lovely park', 'Sentiment': 'positive'} for row in rows])
+    gen = FlakyGenerator()
+    monkeypatch.setattr(pipeline, '_generation_backend', lambda concurrent, workers_per_key: (gen, None))
+
+    pipeline.run_incremental('input.csv')
+    assert gen.calls == ['Green Acres', 'Blue Towers']
+    manifest = PipelineManifest(DEFAULT_MANIFEST_PATH)
+    assert 'reviews' in manifest.xids['1'] and manifest.xids['1']['sets']
+    # The failed set is neither recorded nor reused
+    assert 'reviews' not in manifest.xids['2']
+    assert manifest.changed_sets('2', {1: 'any'}) == {1}
+
+    pipeline.run_incremental('input.csv')
+    assert gen.calls == ['Green Acres', 'Blue Towers', 'Blue Towers']
+    reviews = {str(row['xid']): row['Review 1'] for row in read_artifact('structured_reviews.csv').to_dict('records')}
+    assert all(review_generation.review_succeeded(reviews[xid]) for xid in ('1', '2'))
+    assert 'Blue Towers is pleasant' in reviews['2']
+
+    pipeline.run_incremental('input.csv')
+    assert len(gen.calls) == 3
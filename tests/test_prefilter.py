@@ -0,0 +1,35 @@
+import pytest
+
+from prefilter import REASON_PREFIX, ReviewPrefilter
+
+
+@pytest.mark.parametrize('review', [
+    'Builder delayed possession, still no refund',
+    'Sales team only talks about EMI and loan offers',
+    'Price hike after booking, payment demanded again',
+])
+def test_reviews_only_about_the_builder_are_routed(review):
+    assert ReviewPrefilter().check(review) == REASON_PREFIX + "Only about the builder, pricing or delays"
+
+
+@pytest.mark.parametrize('review', [
+    'The area is peaceful, well connected and the builder kept the promised specs',
+    'Affordable price for such a spacious 3BHK with great views of the lake',
+    'Lovely locality, near the airport, the developer delivered excellent interiors',
+    'Costly but worth it, the gated community feels very secure at night',
+    'Eminent residents and very friendly people here',
+])
+def test_reviews_about_living_there_are_kept(review):
+    assert ReviewPrefilter().check(review) is None
+
+
+@pytest.mark.parametrize('review, reason', [
+    ('', "Empty review"),
+    ('12345 !!!! ####', "Mostly symbols or numbers"),
+    ('Nice place', "Too short to judge the property"),
+    ('यह सोसाइटी बहुत अच्छी है और पार्क भी बड़ा है', "Not written in English"),
+])
+def test_other_reasons(review, reason):
+    prefilter = ReviewPrefilter()
+    assert prefilter.check(review) == REASON_PREFIX + reason
+    assert prefilter.routed == {reason: 1}
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from review_generation import GeminiReviewGenerator, prepare_project_set
+from set_making import build_sets
+from telemetry import count_tokens
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'key-one')
+    monkeypatch.delenv('GEMINI_API_KEY_1', raising=False)
+
+
+def _occurrences(polarity, count):
+    # (phrase, years, mentions) with the mentions in no particular order
+    mentions = list(range(1, count + 1))
+    random.Random(polarity).shuffle(mentions)
+    return [(f"{polarity} point {n} about the tower", 2, n) for n in mentions]
+
+
+def test_over_budget_set_keeps_the_most_mentioned_phrases_of_each_polarity():
+    positives, negatives = _occurrences('good', 60), _occurrences('poor', 40)
+    [project_set] = build_sets(positives, negatives, threshold=10 ** 6)
+    project_set = prepare_project_set('Green Acres', project_set['phrases'], project_set['duration'], 1)
+
+    system_prompt = GeminiReviewGenerator().prompts.prompt_for_set(1)
+    budget = count_tokens(system_prompt) + 250
+    gen = GeminiReviewGenerator(prompt_token_budget=budget)
+    system_prompt, message, _ = gen.prepare_request(project_set, 'Green Acres', 1)
+
+    assert count_tokens(system_prompt) + count_tokens(message) <= budget
+    kept = {line.split(': ', 1)[0]: line.split(': ', 1)[1].split('; ')
+            for line in message.splitlines() if line.startswith(('Positive: ', 'Negative: '))}
+    for label, polarity, total in (('Positive', 'good', 60), ('Negative', 'poor', 40)):
+        assert 0 < len(kept[label]) < total
+        # The most mentioned come first and are the ones kept
+        most_mentioned = range(total, total - len(kept[label]), -1)
+        assert kept[label] == [f"{polarity} point {n} about the tower" for n in most_mentioned]
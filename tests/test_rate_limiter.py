@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from rate_limiter import DailyLimitReached, QuotaStore, RateLimiter, key_id
+from review_generation import GeminiReviewGenerator, estimate_tokens, prepare_project_set, record_generation_call
+
+REVIEW = ('{"positive_review":"Green","negative_review":"Noisy","society_management":"4","green_area":"4",'
+          '"amenities":"3","connectivity":"4","construction":"3","overall":"3.6","duration_of_stay":"2 Years"}')
+
+
+def test_calls_beyond_the_estimate_are_charged():
+    limiter = RateLimiter(max_tokens_per_minute=100000, limiter_id='key', store=QuotaStore('quota.json'))
+    estimate = estimate_tokens('system', 'message')
+    usage = SimpleNamespace(prompt_token_count=estimate, candidates_token_count=40)
+    record_generation_call('key', 0.1, 'system', 'message', SimpleNamespace(usage_metadata=usage, text='{}'),
+                           rate_limiter=limiter)
+    assert limiter.store.usage('key') == (0, 40)
+
+    usage = SimpleNamespace(prompt_token_count=10, candidates_token_count=10)
+    record_generation_call('key', 0.1, 'system', 'message', SimpleNamespace(usage_metadata=usage, text='{}'),
+                           rate_limiter=limiter)
+    assert limiter.store.usage('key') == (0, 40)
+
+
+def test_sequential_generation_reserves_tokens(monkeypatch):
+    monkeypatch.delenv('GEMINI_API_KEY_1', raising=False)
+    monkeypatch.setenv('GEMINI_API_KEY', 'key-one')
+    monkeypatch.setenv('GEMINI_TPM', '100000')
+    gen = GeminiReviewGenerator()
+    monkeypatch.setattr(gen, '_client_for_key', lambda api_key: SimpleNamespace(generate=lambda system, message: REVIEW))
+
+    project_set = prepare_project_set('Green Acres', 'good park (positive)', '2 Years', 1)
+    assert gen.generate_review(project_set, 'Green Acres', 1) is not None
+
+    expected = gen.estimate_request_tokens(project_set, 'Green Acres', 1)
+    assert gen.quota_store.usage(key_id('key-one')) == (1, expected)
+    assert gen.rate_limiters['key-one']._tokens.fraction_available() < 1
+
+
+def _two_key_generator(monkeypatch, rpd):
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    monkeypatch.setenv('GEMINI_API_KEY_1', 'key-one')
+    monkeypatch.setenv('GEMINI_API_KEY_2', 'key-two')
+    monkeypatch.delenv('GEMINI_API_KEY_3', raising=False)
+    monkeypatch.setenv('GEMINI_RPD', str(rpd))
+    return GeminiReviewGenerator()
+
+
+def test_sequential_retry_is_charged_to_the_key_it_runs_on(monkeypatch):
+    gen = _two_key_generator(monkeypatch, rpd=10)
+    replies = iter(['not json', REVIEW])
+    monkeypatch.setattr(gen, '_client_for_key',
+                        lambda api_key: SimpleNamespace(generate=lambda system, message: next(replies)))
+
+    project_set = prepare_project_set('Green Acres', 'good park (positive)', '2 Years', 1)
+    assert gen.generate_review(project_set, 'Green Acres', 1) is not None
+    assert gen.quota_store.usage(key_id('key-one'))[0] == 1
+    assert gen.quota_store.usage(key_id('key-two'))[0] == 1
+
+
+def test_sequential_generation_skips_keys_out_of_daily_quota(monkeypatch):
+    gen = _two_key_generator(monkeypatch, rpd=1)
+    calls = []
+    monkeypatch.setattr(gen, '_client_for_key', lambda api_key: SimpleNamespace(
+        generate=lambda system, message: calls.append(api_key) or REVIEW))
+
+    for name in ('Green Acres', 'Blue Towers'):
+        project_set = prepare_project_set(name, 'good park (positive)', '2 Years', 1)
+        assert gen.generate_review(project_set, name, 1) is not None
+    assert calls == ['key-one', 'key-two']
+
+    project_set = prepare_project_set('Red Court', 'good park (positive)', '2 Years', 1)
+    with pytest.raises(DailyLimitReached):
+        gen.generate_review(project_set, 'Red Court', 1)
@@ -0,0 +1,68 @@
+import json
+
+import pandas as pd
+import pytest
+
+from review_batch import LocalBatchBackend, ingest_batch_results, make_backend, write_batch_jobs
+from review_generation import GeminiReviewGenerator, StructuredReviewWriter, review_succeeded
+
+SETS = pd.DataFrame({'xid': ['1', '2'], 'Project name': ['Green Acres', 'Blue Towers'],
+                     'Set 1': ['good park (positive)', 'noisy road (negative)'],
+                     'How Long do you stay here 1': ['2.0 Years', '1.0 Years']})
+
+
+class FakeClient:
+    """Stands in for GeminiKeyClient and answers every prompt with a review."""
+
+    def __init__(self, api_key, model_name, rate_limiter=None):
+        self.rate_limiter = rate_limiter
+        self.calls = []
+
+    def generate(self, system_instruction, message):
+        self.calls.append(message)
+        return json.dumps({
+            'positive_review': 'The park is lovely', 'negative_review': 'The road is noisy',
+            'society_management': '4', 'green_area': '3', 'amenities': '4', 'connectivity': '5',
+            'construction': '3', 'overall': '3.8', 'duration_of_stay': '2 Years'
+        })
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    monkeypatch.setenv('GEMINI_API_KEY_1', 'key-one')
+    monkeypatch.delenv('GEMINI_API_KEY_2', raising=False)
+    monkeypatch.setenv('GEMINI_RPM', '1000')
+    return GeminiReviewGenerator()
+
+
+def _round_trip(backend, gen):
+    assert write_batch_jobs(SETS, gen, 'jobs.jsonl') == 2
+    job = backend.submit('jobs.jsonl')
+    assert backend.state(job) == 'JOB_STATE_SUCCEEDED'
+    backend.download(job, 'results.jsonl')
+    return ingest_batch_results(SETS, 'results.jsonl', gen, 'structured_reviews.csv')
+
+
+def test_prepare_submit_download_ingest(generator):
+    backend = make_backend('local', generator, client_factory=FakeClient)
+    assert isinstance(backend, LocalBatchBackend)
+    rows = _round_trip(backend, generator)
+
+    assert len(backend.client.calls) == 2
+    # Every call went through the key's persisted daily quota
+    assert backend.rate_limiter is backend.client.rate_limiter
+    assert backend.rate_limiter.daily_count == 2
+    assert [json.loads(row['Review 1'])['positive_review'] for row in rows] == ['The park is lovely'] * 2
+    assert StructuredReviewWriter('structured_reviews.csv', 1).completed_xids() == {'1', '2'}
+
+
+def test_local_backend_stops_at_the_daily_quota(generator, monkeypatch):
+    monkeypatch.setenv('GEMINI_RPD', '1')
+    backend = make_backend('local', generator, client_factory=FakeClient)
+    rows = _round_trip(backend, generator)
+
+    assert len(backend.client.calls) == 1
+    assert [review_succeeded(row['Review 1']) for row in rows] == [True, False]
+    # The unanswered project is left for a later run
+    assert StructuredReviewWriter('structured_reviews.csv', 1).completed_xids() == {'1'}
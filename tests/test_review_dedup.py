@@ -0,0 +1,59 @@
+from review_dedup import ReviewDedupIndex
+
+REVIEW = "Spacious flats with good ventilation, the lifts are slow and parking is tight in the evenings."
+
+
+def test_duplicates_join_the_first_cluster_across_batches():
+    index = ReviewDedupIndex()
+    first = index.assign([('1', REVIEW), ('2', "Water supply is irregular and the club house is closed.")])
+    second = index.assign([('3', REVIEW.upper()), ('4', REVIEW.replace('evenings', 'evening'))])
+
+    assert second == [first[0], first[0]]
+    assert len(index) == 2
+    assert (index.exact_duplicates, index.near_duplicates) == (1, 1)
+
+
+def test_spam_clusters_span_several_xids():
+    index = ReviewDedupIndex()
+    index.assign([('A4', REVIEW), ('A4', REVIEW), ('B7', REVIEW), ('C1', "Nice park near the towers.")])
+
+    [cluster] = index.spam_clusters()
+    assert cluster['Reviews'] == 3
+    assert cluster['xids'] == 'A4; B7'
+
+
+def test_index_grows_past_its_first_allocation():
+    index = ReviewDedupIndex()
+    reviews = [(str(i), f"review number {i} about tower {i * 7919} and block {i * 104729}") for i in range(2000)]
+    clusters = index.assign(reviews)
+
+    assert len(set(clusters)) == len(index)
+    assert index.assign(reviews[-1:]) == clusters[-1:]
+
+
+def test_non_latin_reviews_keep_their_words():
+    hindi = "पार्किंग की जगह बहुत कम है और लिफ्ट धीमी चलती है"
+    other = "सोसाइटी का पार्क बहुत सुंदर है और सुरक्षा अच्छी है"
+    index = ReviewDedupIndex()
+    clusters = index.assign([('1', hindi), ('2', other), ('3', hindi)])
+
+    assert clusters[0] != clusters[1]
+    assert clusters[2] == clusters[0]
+    assert index.exact_duplicates == 1
+
+
+def test_reviews_without_words_never_cluster():
+    index = ReviewDedupIndex()
+    clusters = index.assign([('1', '!!!'), ('2', '...'), ('3', '!!!')])
+
+    assert len(set(clusters)) == 3
+    assert (index.exact_duplicates, index.near_duplicates) == (0, 0)
+
+
+def test_spam_sample_is_the_representative_review():
+    index = ReviewDedupIndex()
+    index.assign([('A4', REVIEW)])
+    index.assign([('B7', REVIEW.upper())])
+
+    [cluster] = index.spam_clusters()
+    assert cluster['Sample Review'] == REVIEW
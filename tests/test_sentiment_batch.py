@@ -0,0 +1,60 @@
+import json
+import re
+
+import pytest
+
+import sentiment
+from sentiment import classify_sentiment_batch, parse_batch_response
+
+
+def test_complete_responses_are_read_in_id_order():
+    result = '```json\n[{"id": 2, "sentiment": "Negative"}, {"id": 1, "sentiment": "positive"}]\n```'
+    assert parse_batch_response(result, 2) == ['positive', 'negative']
+    assert parse_batch_response('1. positive\n2: ignore', 2) == ['positive', 'ignore']
+    assert parse_batch_response('["positive", "negative"]', 2) == ['positive', 'negative']
+
+
+@pytest.mark.parametrize('result', [
+    'not a label in sight',
+    '[{"id": 1, "sentiment": "great"}, {"id": 2, "sentiment": "positive"}]',
+    '[{"id": "one", "sentiment": "positive"}, {"id": 2, "sentiment": "positive"}]',
+    '[{"id": 1, "sentiment": "positive"}, {"id": 1, "sentiment": "negative"}]',
+])
+def test_malformed_responses_fail_the_batch(result):
+    assert parse_batch_response(result, 2) is None
+
+
+def test_shifted_zero_based_ids_fail_the_batch():
+    result = '[{"id": 0, "sentiment": "positive"}, {"id": 1, "sentiment": "negative"}]'
+    assert parse_batch_response(result, 2) is None
+
+
+@pytest.mark.parametrize('result', [
+    '[{"id": 1, "sentiment": "positive"}]',
+    '["positive"]',
+    '1. positive',
+    '[{"id": 1, "sentiment": "positive"}, {"id": 2, "sentiment": "negative"}, {"id": 3, "sentiment": "ignore"}]',
+])
+def test_partial_or_overlong_responses_fail_the_batch(result):
+    assert parse_batch_response(result, 2) is None
+
+
+def test_invalid_batches_are_split_until_they_parse(monkeypatch):
+    requests = []
+
+    def fake_post(messages, max_retries=3, timeout=None):
+        numbered = re.findall(r'^(\d+)\. Review: "(.*)"$', messages[1]['content'], re.MULTILINE)
+        requests.append(len(numbered) or 1)
+        if len(numbered) > 2:
+            # A 0-based answer that would shift every label by one review
+            return json.dumps([{'id': int(number) - 1, 'sentiment': text} for number, text in numbered])
+        if numbered:
+            return json.dumps([{'id': int(number), 'sentiment': text} for number, text in numbered])
+        return re.search(r'Review: "(.*)"', messages[1]['content']).group(1)
+
+    monkeypatch.setattr(sentiment, '_post_analyze', fake_post)
+    reviews = ['positive', 'negative', 'ignore', 'positive', 'negative']
+
+    assert classify_sentiment_batch(reviews) == reviews
+    # 5 -> 2 + 3 -> 2 + (1 + 2)
+    assert requests == [5, 2, 3, 1, 2]
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import sentiment
+
+
+LABELS = {'good': 'positive', 'bad': 'negative', 'meh': 'ignore'}
+
+
+class StubServer:
+    """/api/analyze stand-in that labels reviews by their last word and tracks concurrent requests."""
+
+    def __init__(self, delay=0.02):
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with lock:
+                    stub.requests += 1
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(delay)
+                review = re.search(r'Review: "(.*)"', body['messages'][-1]['content']).group(1)
+                data = json.dumps({'result': LABELS[review.rsplit(' ', 1)[-1]]}).encode()
+                with lock:
+                    stub.in_flight -= 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/analyze"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setenv('PREFILTER_DISABLED', '1')
+    stub = StubServer()
+    monkeypatch.setattr(sentiment, 'API_URL', stub.url)
+    yield stub
+    stub.stop()
+
+
+WORDS = ['good', 'bad', 'meh']
+
+
+def _rows(count):
+    # Unrelated text per row so no two reviews are near-duplicates
+    reviews = [f"{hashlib.sha1(str(i).encode()).hexdigest()} {WORDS[i % 3]}" for i in range(count)]
+    frame = pd.DataFrame({'xid': [str(i) for i in range(count)], 'Review': reviews})
+    return list(frame.iterrows())
+
+
+def test_requests_run_in_parallel_on_one_pool_and_keep_input_order(server, monkeypatch):
+    pools = []
+    real_pool = sentiment.ThreadPoolExecutor
+    monkeypatch.setattr(sentiment, 'ThreadPoolExecutor', lambda **kwargs: pools.append(kwargs) or real_pool(**kwargs))
+    rows = _rows(3 * sentiment.CHECKPOINT_WINDOW + 7)
+
+    windows = list(sentiment.classify_rows(rows, max_workers=4))
+
+    assert pools == [{'max_workers': 4}]
+    assert len(windows) == 4
+    assert 1 < server.max_in_flight <= 4
+    assert server.requests == len(rows)
+    classified = [(row['xid'], row['Sentiment']) for rows_out, _ in windows for row in rows_out]
+    ignored = [row['xid'] for _, rows_out in windows for row in rows_out]
+    assert classified == [(str(i), LABELS[WORDS[i % 3]]) for i in range(len(rows)) if i % 3 != 2]
+    assert ignored == [str(i) for i in range(len(rows)) if i % 3 == 2]
+
+
+def test_duplicates_in_a_later_window_reuse_a_label_still_in_flight(server):
+    rows = _rows(sentiment.CHECKPOINT_WINDOW)
+    repeated = [(index + len(rows), row) for index, row in rows]
+
+    windows = list(sentiment.classify_rows(rows + repeated, max_workers=4))
+
+    assert server.requests == len(rows)
+    labels = {row['Review']: row['Sentiment'] for classified, _ in windows for row in classified}
+    assert sum(len(classified) for classified, _ in windows) == 2 * len(labels)
+    assert all(labels[review] == LABELS[review.rsplit(' ', 1)[-1]] for review in labels)
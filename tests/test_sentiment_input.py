@@ -0,0 +1,29 @@
+import pandas as pd
+
+from sentiment import ENCODING_SAMPLE_BYTES, detect_file_encoding, iter_input_chunks
+
+
+def _write_input(reviews, path='input.csv'):
+    pd.DataFrame({'xid': [str(i) for i in range(len(reviews))], 'Review': reviews}).to_csv(
+        path, index=False, encoding='utf-8')
+    return path
+
+
+def test_late_non_ascii_row_is_read_as_utf8():
+    filler = 'The lifts are quick and the park is clean every morning'
+    rows = ENCODING_SAMPLE_BYTES // len(filler) + 10
+    path = _write_input([filler] * rows + ['Café nearby, naïve décor — ₹ well spent'])
+
+    assert detect_file_encoding(path) == 'utf-8'
+    chunks = list(iter_input_chunks(path, chunksize=5000))
+    assert chunks[-1]['Review'].iloc[-1] == 'Café nearby, naïve décor — ₹ well spent'
+
+
+def test_chunks_stream_with_a_file_wide_index():
+    reviews = [f'review {i} about tower {i}' for i in range(25)]
+    path = _write_input(reviews)
+
+    chunks = list(iter_input_chunks(path, chunksize=10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert list(pd.concat(chunks).index) == list(range(25))
+    assert list(pd.concat(chunks)['Review']) == reviews
@@ -0,0 +1,20 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from sentiment import IncrementalCsvWriter, _to_output_row, load_completed_keys, review_key, row_xid
+
+
+def test_rows_without_xid_resume_under_the_key_they_were_written_with():
+    csv_text = 'xid,Review\n,Lovely park near the towers\n7,Noisy road\n'
+    row = next(pd.read_csv(io.StringIO(csv_text), dtype=str).iterrows())[1]
+    assert pd.isna(row['xid']) and row_xid(row) == ''
+
+    writer = IncrementalCsvWriter('reviews.csv')
+    writer.write_rows([dict(_to_output_row(row), Sentiment='positive')])
+    writer.close()
+
+    completed = load_completed_keys('reviews.csv')
+    assert completed[review_key(row['xid'], row['Review'])] == 1
+    assert review_key(np.nan, 'Noisy road') == review_key('', 'Noisy road') != review_key('nan', 'Noisy road')
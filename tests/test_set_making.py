@@ -0,0 +1,99 @@
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+import set_making
+from set_making import NUM_SETS, SINGLE_SET_THRESHOLD, iter_sets, make_sets, sort_by_xid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _row(xid, phrase, sentiment, years, count=None):
+    row = {'xid': xid, 'Project name': 'Green Acres', 'Phrase': phrase, 'Sentiment': sentiment,
+           'How Long do you stay here': f"{years} years"}
+    if count is not None:
+        row['Count'] = count
+    return row
+
+
+def test_deduplicated_rows_keep_the_raw_number_of_sets():
+    distinct = SINGLE_SET_THRESHOLD // 3 + 1
+    raw = [_row('1', f"phrase {i}", 'Positive', 2) for i in range(distinct) for _ in range(3)]
+    deduped = [_row('1', f"phrase {i}", 'Positive', 2, count=3) for i in range(distinct)]
+
+    [raw_row] = iter_sets(raw)
+    [deduped_row] = iter_sets(deduped)
+    filled = lambda row: sum(bool(row[f'Set {i}']) for i in range(1, NUM_SETS + 1))
+    assert filled(deduped_row) == filled(raw_row) == NUM_SETS
+
+
+def test_small_set_lists_most_mentioned_phrases_first_and_weights_the_stay():
+    rows = [_row('7', 'noisy road', 'Negative', 1, count=1),
+            _row('7', 'good park', 'Positive', 1, count=1),
+            _row('7', 'great security', 'Positive', 5, count=3)]
+
+    [row] = iter_sets(rows)
+    assert row['Set 1'] == 'great security (positive); good park (positive); noisy road (negative)'
+    assert row['How Long do you stay here 1'] == '3.4 Years'
+
+
+def _project(xid='1'):
+    aspects = ['park', 'lift', 'school', 'road', 'security', 'water', 'gym', 'parking']
+    return ([_row(xid, f"{aspect} {i} good", 'Positive', 1 + i % 5) for i, aspect in enumerate(aspects * 4)]
+            + [_row(xid, f"{aspect} {i} poor", 'Negative', 1 + i % 3) for i, aspect in enumerate(aspects * 2)])
+
+
+def test_same_phrases_give_the_same_sets_across_runs():
+    rows = _project()
+    first = make_sets(rows)
+    assert first[0]['Set 2']
+    assert make_sets(rows) == first
+    assert make_sets(list(reversed(rows))) == first
+
+    # A new process with another hash seed deals the same sets
+    script = ("import json, sys; from set_making import make_sets; "
+              "print(json.dumps(make_sets(json.loads(sys.stdin.read()))))")
+    output = subprocess.run([sys.executable, '-c', script], input=json.dumps(rows), capture_output=True, text=True,
+                            check=True, cwd=REPO_ROOT, env=dict(os.environ, PYTHONHASHSEED='12345')).stdout
+    assert json.loads(output) == first
+
+
+@pytest.fixture
+def reshuffling(monkeypatch):
+    monkeypatch.setenv('SETS_DETERMINISTIC', '0')
+    importlib.reload(set_making)
+    yield set_making
+    monkeypatch.delenv('SETS_DETERMINISTIC')
+    importlib.reload(set_making)
+
+
+def test_sets_deterministic_off_reshuffles_every_run(reshuffling):
+    assert not reshuffling.DETERMINISTIC_SETS
+    rows = _project()
+    deals = {tuple(sorted(reshuffling.make_sets(rows)[0].items())) for _ in range(5)}
+    assert len(deals) > 1
+
+
+def test_sort_by_xid_spills_runs_and_merges_them_in_order(tmp_path, monkeypatch):
+    spill_root = tmp_path / 'spill'
+    spill_root.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(spill_root))
+    rng = random.Random(7)
+    rows = [{'xid': rng.choice(['A4', 'B7', 'C1', '10', '9']), 'Phrase': f"phrase {i}"} for i in range(57)]
+
+    in_memory = list(sort_by_xid(rows, chunk_size=len(rows) + 1))
+    merged = sort_by_xid(rows, chunk_size=5)
+    first = next(merged)
+    [spill_dir] = spill_root.iterdir()
+    assert len(list(spill_dir.iterdir())) == 12
+
+    assert [first] + list(merged) == in_memory
+    assert [row['Phrase'] for row in in_memory] == [row['Phrase'] for row in
+                                                    sorted(rows, key=lambda row: row['xid'])]
+    assert list(spill_root.iterdir()) == []
@@ -0,0 +1,74 @@
+import json
+
+import pandas as pd
+import pytest
+
+from review_generation import StructuredReviewWriter, failed_review_json
+
+def review(text):
+    return json.dumps({'positive_review': text})
+
+def rows_by_xid(path):
+    df = pd.read_csv(path, dtype=str) if path.endswith('.csv') else pd.read_parquet(path)
+    return {str(row['xid']): row['Review 1'] for _, row in df.iterrows()}
+
+@pytest.mark.parametrize('output', ['structured_reviews.csv', 'structured_reviews.parquet'])
+def test_later_write_replaces_earlier_row(output):
+    if output.endswith('.parquet'):
+        pytest.importorskip('pyarrow')
+
+    writer = StructuredReviewWriter(output, set_count=1, flush_every=1)
+    writer.write({'xid': '1', 'Project name': 'A', 'Review 1': review('OLD')})
+    writer.close()
+
+    writer = StructuredReviewWriter(output, set_count=1, flush_every=1)
+    writer.write({'xid': '1', 'Project name': 'A', 'Review 1': review('NEW')})
+    writer.write({'xid': '2', 'Project name': 'B', 'Review 1': review('B')})
+    writer.close()
+
+    assert rows_by_xid(output) == {'1': review('NEW'), '2': review('B')}
+
+def test_truncate_starts_over():
+    writer = StructuredReviewWriter('structured_reviews.csv', set_count=1)
+    writer.write({'xid': 'stale', 'Project name': 'A', 'Review 1': review('OLD')})
+    writer.close()
+
+    writer = StructuredReviewWriter('structured_reviews.csv', set_count=1, truncate=True)
+    writer.write({'xid': 'fresh', 'Project name': 'B', 'Review 1': review('NEW')})
+    writer.close()
+
+    assert rows_by_xid('structured_reviews.csv') == {'fresh': review('NEW')}
+
+def test_segments_left_by_a_crash_are_recovered_once():
+    writer = StructuredReviewWriter('structured_reviews.csv', set_count=1, flush_every=2)
+    for xid in range(5):
+        writer.write({'xid': str(xid), 'Project name': 'P', 'Review 1': review(str(xid))})
+    # Crash: two segments were flushed, the fifth row was still buffered
+
+    resumed = StructuredReviewWriter('structured_reviews.csv', set_count=1)
+    assert resumed.completed_xids() == {'0', '1', '2', '3'}
+    resumed.write({'xid': '4', 'Project name': 'P', 'Review 1': review('4')})
+    resumed.close()
+
+    df = pd.read_csv('structured_reviews.csv', dtype=str)
+    assert sorted(df['xid']) == ['0', '1', '2', '3', '4']
+
+@pytest.mark.parametrize('output', ['structured_reviews.csv', 'structured_reviews.parquet'])
+def test_only_fully_generated_xids_count_as_completed(output):
+    if output.endswith('.parquet'):
+        pytest.importorskip('pyarrow')
+
+    writer = StructuredReviewWriter(output, set_count=2, flush_every=2)
+    writer.write({'xid': '1', 'Project name': 'A', 'Review 1': review('A1'), 'Review 2': ''})
+    writer.write({'xid': '2', 'Project name': 'B', 'Review 1': failed_review_json('quota'), 'Review 2': ''})
+    writer.write({'xid': '3', 'Project name': 'C', 'Review 1': review('C1'), 'Review 2': 'not json'})
+    writer.close()
+
+    writer = StructuredReviewWriter(output, set_count=2)
+    assert writer.completed_xids() == {'1'}
+
+    # A retried xid counts once its newer row succeeded, even before close()
+    writer.write({'xid': '2', 'Project name': 'B', 'Review 1': review('B1'), 'Review 2': review('B2')})
+    writer.flush()
+    assert writer.completed_xids() == {'1', '2'}
+    writer.close()
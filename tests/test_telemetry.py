@@ -0,0 +1,21 @@
+import inspect
+
+from telemetry import DEFAULT_METRICS_HOST, Metrics
+
+
+def test_summary_reports_cost_from_stage_prices(monkeypatch):
+    monkeypatch.setenv('PHRASES_INPUT_USD_PER_MTOK', '1.0')
+    metrics = Metrics(path=None)
+    metrics.record_call('generation', 0.2, key='k1', input_tokens=1_000_000, output_tokens=500_000)
+    metrics.record_call('phrases', 0.1, input_tokens=2_000_000, output_tokens=10)
+    metrics.record_stage('generation', 2.0)
+
+    summary = metrics.summary()
+    assert summary['generation']['cost_usd'] == 0.3
+    assert summary['generation']['calls_per_second'] == 0.5
+    assert summary['phrases']['cost_usd'] == 2.0
+    assert 'pipeline_llm_cost_usd_total{stage="generation",key="k1"} 0.3' in metrics.prometheus_text()
+
+
+def test_metrics_endpoint_is_local_by_default():
+    assert inspect.signature(Metrics.serve).parameters['host'].default == DEFAULT_METRICS_HOST == '127.0.0.1'